@@ -0,0 +1,77 @@
+"""
+Author: Robert Brennan
+Microbenchmark of container command generation, for a large scaled container with links.
+Run from the repository root: python TestingUtilities/bench_commands.py [replicas]
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dgrid.docker.container import Container, ContainerTemplate
+from dgrid.scheduling.utils.docker_netorking import add_networking
+
+WORKER = {"image": "ubuntu:14.04", "name": "worker", "interactive": "False",
+          "volumes": ["/data:/data", "/scratch:/scratch"],
+          "environment_variables": ["OMP_NUM_THREADS=1", "MODE=worker"],
+          "links": ["head:HEAD", "db:DB"],
+          "work_dir": "/data", "run_cmd": ["sh", "work.sh", "--verbose"], "host_to_list": "True"}
+HEAD = {"image": "python:2", "name": "head", "interactive": "True", "run_cmd": ["python", "run.py"],
+        "host_list_location": "/"}
+DB = {"image": "mongo", "name": "db", "interactive": "False"}
+
+
+def job(replicas):
+    template = ContainerTemplate(WORKER)
+    return [Container(HEAD), Container(DB)] + [Container(template) for i in range(replicas)]
+
+
+def launch(containers):
+    # The command is built for the launch script, logging, and again when a container is relaunched
+    for container in containers:
+        container.network = 'dgrid-net'
+        container.user = '1000'
+        container.cpu_set = '0'
+        for i in range(3):
+            container.run()
+        container.terminate(10)
+        container.cleanup()
+
+
+def main(replicas):
+    write_directory = tempfile.mkdtemp()
+    os.environ['DGRID_HOSTFILE_FORMAT'] = 'list'
+    containers = job(replicas)
+    add_networking(containers, write_directory)
+
+    timings = [
+        ('definition', lambda: job(replicas)),
+        ('add_networking', lambda: add_networking(job(replicas), write_directory)),
+        ('commands', lambda: launch(containers)),
+    ]
+    for name, call in timings:
+        best = min(timeit.repeat(call, number=1, repeat=5))
+        print("%-16s %8.2f ms  %6.2f us per replica" % (name, best * 1000, best * 1e6 / replicas))
+
+    os.remove(os.path.join(write_directory, 'hostfile'))
+    os.rmdir(write_directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
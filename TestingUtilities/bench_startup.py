@@ -0,0 +1,107 @@
+"""
+Author: Robert Brennan
+Benchmark of dgrid's startup for the command lines that never launch a container, --version, --help
+and a definition that fails validation. Exits 1 when any of them takes longer than the budget,
+over the interpreter's own startup, or imports Fabric or another dependency only executors need.
+Run from the repository root: python TestingUtilities/bench_startup.py [budget in ms]
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from subprocess import Popen, PIPE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds each light command line may take over a bare interpreter
+BUDGET = 50
+REPEAT = 10
+
+# Packages only the executors need
+HEAVY = ('fabric', 'paramiko', 'retry', 'Crypto', 'cryptography', 'dgrid.scheduling.schedulers')
+
+# Runs dgrid's CLI, then prints the heavy modules it imported
+CLI = """
+import sys
+from dgrid.dgrid import main
+sys.argv = ['dgrid'] + sys.argv[1:]
+try:
+    main()
+except SystemExit:
+    pass
+heavy = [name for name in sys.modules if sys.modules[name] is not None and
+         any(name == package or name.startswith(package + '.') for package in %r)]
+sys.stdout.write('\\nheavy:' + ','.join(sorted(heavy)) + '\\n')
+""" % (HEAVY,)
+
+
+def run(args):
+    """
+    Runs a fresh interpreter
+    :param args: Arguments after the interpreter
+    :return: Wall time in ms, stdout
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = ROOT + os.pathsep + environment.get('PYTHONPATH', '')
+    start = time.time()
+    proc = Popen([sys.executable] + args, stdout=PIPE, stderr=PIPE, env=environment, cwd=ROOT)
+    output = proc.communicate()[0].decode('utf-8')
+    return (time.time() - start) * 1000, output
+
+
+def best(args):
+    # Fastest of REPEAT runs, the first run also compiles the modules
+    run(args)
+    timings = [run(args) for i in range(REPEAT)]
+    return min(timings)
+
+
+def main(budget):
+    directory = tempfile.mkdtemp()
+    invalid = os.path.join(directory, 'invalid.json')
+    with open(invalid, 'w') as f:
+        f.write('{"containers": [{"name": "head", "image": "python:2"}]}')
+
+    paths = [
+        ('--version', ['--version']),
+        ('--help', ['--help']),
+        ('invalid definition', ['--dockdef', invalid]),
+    ]
+
+    interpreter = best(['-c', 'pass'])[0]
+    print("%-20s %8.1f ms" % ('interpreter', interpreter))
+    failed = False
+    try:
+        for name, args in paths:
+            timing, output = best(['-c', CLI] + args)
+            heavy = output.rsplit('heavy:', 1)[-1].strip()
+            over = timing - interpreter
+            status = 'ok'
+            if over > budget:
+                status = 'over budget of %d ms' % budget
+            elif heavy:
+                status = 'imported ' + heavy
+            failed = failed or status != 'ok'
+            print("%-20s %8.1f ms  +%6.1f ms  %s" % (name, timing, over, status))
+    finally:
+        shutil.rmtree(directory)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET))
@@ -23,3 +23,59 @@ Image cleanup possibilities:
 image_cleanup = 2
 
 enforce_memory_limits = True
+
+# Remote execution, see dgrid/conf/settings.py
+ssh_shell = '/bin/bash -l -c'
+ssh_binary = 'ssh'
+ssh_control_persist = '10m'
+ssh_concurrency = 256
+pbsdsh_binary = 'pbsdsh'
+pbsdsh_options = []
+tm_cgroup_parent = '/{job_path}'
+
+# Docker Engine API
+docker_api = False
+docker_socket = '/var/run/docker.sock'
+docker_api_timeout = 60
+
+# Slurm
+slurm_execution_method = 'SRUN'
+srun_binary = 'srun'
+scontrol_binary = 'scontrol'
+srun_options = []
+slurm_cgroup_parent = '/slurm/uid_{user}/job_{job_id}'
+
+# Container stop and teardown
+stop_timeout = 10
+teardown_deadline = 60
+output_buffer_lines = 1000
+
+# Launch and image staging
+parallel_launch = False
+launch_pool_size = 32
+batched_launch = False
+prestage_images = False
+image_distribution = 'registry'
+broadcast_fanout = 2
+image_inventory = False
+image_inventory_path = '/tmp/dgrid-images-{user}'
+image_inventory_ttl = 300
+
+# Placement and resource limits
+placement_strategy = 'pack'
+numa_partitioning = False
+cgroup_job_path = 'torque/{job_id}'
+
+# Image garbage collection, used when image_cleanup is 3
+docker_root = '/var/lib/docker'
+image_gc_index = '/var/lib/dgrid/image-index'
+image_gc_high = 85
+image_gc_low = 70
+
+# Deferred image cleanup
+deferred_cleanup = False
+cleanup_queue_dir = '/tmp/dgrid-cleanup-{user}'
+cleanup_drain = 'epilogue'
+
+# Job arrays
+array_concurrency = 4
@@ -23,24 +23,140 @@ DEBUG = False
 '''
 Scheduler configuration
 '''
-# Scheduler type & version
+# Scheduler type & version, Torque6, Slurm or a scheduler installed as a dgrid.schedulers plugin
 scheduler = "Torque6"
 
-# Execution method
+# Execution method, SSH, ASYNC_SSH, TM or an executor installed as a dgrid.executors plugin
 Execution_Method = 'SSH'
 
+'''
+SSH execution, used when Execution_Method is SSH.
+ssh_shell: the shell remote commands are wrapped in, a login shell as with Fabric so the remote login profile
+           i.e. PATH applies. None to run commands directly, without the login profile
+'''
+ssh_shell = '/bin/bash -l -c'
+
+'''
+OpenSSH execution, used when Execution_Method is ASYNC_SSH.
+ssh_binary: the ssh binary used to reach remote hosts, its own configuration i.e. ~/.ssh/config applies
+ssh_control_persist: how long idle multiplexed master connections are kept open for
+ssh_concurrency: maximum number of remote commands in flight at any one time
+'''
+ssh_binary = 'ssh'
+ssh_control_persist = '10m'
+ssh_concurrency = 256
+
+'''
+Task manager execution, used when Execution_Method is TM. Launch, pre-staging, teardown and image cleanup take one
+pbsdsh fan-out each, but broadcast image distribution relays images over ssh, so nodes still need passwordless ssh
+between them with image_distribution set to broadcast
+pbsdsh_binary: the pbsdsh binary remote commands are spawned through, as tasks of the job
+pbsdsh_options: extra pbsdsh options
+tm_cgroup_parent: the cgroup containers are placed in, {job_path} is replaced with cgroup_job_path and {job_id}
+                  with the job's id. None leaves containers in docker's own cgroup, and tracks them with pbs_track
+'''
+pbsdsh_binary = 'pbsdsh'
+pbsdsh_options = []
+tm_cgroup_parent = '/{job_path}'
+
+'''
+Docker Engine API, for the docker operations on the host dgrid runs on.
+docker_api: pull and run the interactive container, stop and remove it, and create the job's network, with requests
+            to the docker daemon's Engine API over one connection instead of docker CLI processes.
+            The CLI is used when the socket doesn't exist. Remote hosts' containers are still run by shell scripts.
+            Interactive containers get an open standard input, but dgrid's own is not forwarded to them as the CLI
+            does, leave this off when the interactive container reads from the terminal
+docker_socket: path of the docker daemon's socket
+docker_api_timeout: seconds a request to the daemon may take, other than requests lasting as long as a container runs
+'''
+docker_api = False
+docker_socket = '/var/run/docker.sock'
+docker_api_timeout = 60
+
+'''
+Slurm execution, used when scheduler is Slurm.
+slurm_execution_method: the executor Slurm jobs use, SRUN or an executor installed as a dgrid.executors plugin
+srun_binary, scontrol_binary: the srun and scontrol binaries to run
+srun_options: extra srun options for dgrid's job steps, i.e. ['--overlap'] on Slurm 20.11 and later
+slurm_cgroup_parent: the job's cgroup containers are placed in, {user} and {job_id} are replaced with the job owner's
+                     uid and the job's id. None leaves containers in docker's own cgroup
+'''
+slurm_execution_method = 'SRUN'
+srun_binary = 'srun'
+scontrol_binary = 'scontrol'
+srun_options = []
+slurm_cgroup_parent = '/slurm/uid_{user}/job_{job_id}'
+
 # Termination signals
 termination_signal = SIGTERM
 
+'''
+Container teardown, all of a host's containers are stopped and removed together, on all hosts at the same time.
+stop_timeout: seconds containers get to stop before they are killed
+teardown_deadline: seconds teardown may take before dgrid gives up waiting, keep it below Torque's kill_delay
+'''
+stop_timeout = 10
+teardown_deadline = 60
+
+# Lines of container output read ahead of logging, before output is left waiting in the container's pipes
+output_buffer_lines = 1000
+
 # pbs_track binary
 pbs_track = "/usr/local/bin/pbs_track"
 
+'''
+Remote container launch.
+parallel_launch: launch remote containers on all assigned hosts at the same time, instead of one after another
+launch_pool_size: maximum number of hosts being launched on at any one time when parallel_launch is enabled
+batched_launch: launch all of a host's containers with a single remote script, instead of a remote command per step
+prestage_images: pull the images needed on each host on all hosts at the same time before launch,
+                 while the job's docker network is created
+image_distribution: how images are pre-staged
+    registry) every host pulls its images from the registry
+    broadcast) the head node pulls each image once, and relays it to the other hosts with docker save and load,
+               over ssh between the hosts, with every execution method
+broadcast_fanout: number of hosts each host relays images on to, when image_distribution is broadcast
+image_inventory: list the images each host already has, once per host, and only pull or relay the missing ones
+image_inventory_path: file each host caches its image list in, {user} is replaced with the job owner's uid
+image_inventory_ttl: seconds a host's cached image list is used for, before docker is asked again
+'''
+parallel_launch = False
+launch_pool_size = 32
+batched_launch = False
+prestage_images = False
+image_distribution = 'registry'
+broadcast_fanout = 2
+image_inventory = False
+image_inventory_path = '/tmp/dgrid-images-{user}'
+image_inventory_ttl = 300
+
+'''
+Container placement.
+Hosts are allocated a slot for each time they appear in the job's host file, i.e. once per core in PBS_NODEFILE.
+The interactive container takes one slot of the host dgrid runs on, remote containers are placed on the remaining slots.
+placement_strategy:
+    pack) fill each host's slots before moving on to the next host
+    spread) place each container on the host with the most free slots
+    round-robin) place one container on each host with free slots in turn
+'''
+placement_strategy = 'pack'
+
+'''
+NUMA aware partitioning.
+numa_partitioning: give containers placed on the same host disjoint slices of the job's cpuset, kept inside NUMA nodes,
+                   with --cpuset-mems set to their NUMA nodes. With enforce_memory_limits the job's memory limit is split
+                   between them in proportion to their cpus
+'''
+numa_partitioning = False
+
 '''
 Linux control group configuration.
-cgroup_dir: the path to the machines cgroup directory
+cgroup_dir: the path to the machines cgroup directory, either cgroup v1 hierarchies or the cgroup v2 unified hierarchy
+cgroup_job_path: the path of a job's cgroup below each hierarchy, {job_id} is replaced with the job's id
 enforce_memory_limits: on systems where memory limits are enforced in cgroups, apply to spun up containers
 '''
 cgroup_dir = '/sys/fs/cgroup'
+cgroup_job_path = 'torque/{job_id}'
 enforce_memory_limits = False
 
 '''
@@ -48,10 +164,47 @@ Image cleanup possibilities:
 0) No removal of images. Must be carried out manually or automated job.
 1) At the end of execution remove all unused images on nodes assigned to the job.
 2) Remove only images associated with the job.
+3) Record when each image was last used on the node, and remove the least recently used unused images
+   once the disk docker uses is image_gc_high percent full, until it is image_gc_low percent full.
 '''
 image_cleanup = 0
 # image_cleanup = 1
 # image_cleanup = 2
+# image_cleanup = 3
+
+'''
+Image garbage collection, used when image_cleanup is 3.
+docker_root: docker's root directory on each node, the disk usage of its filesystem is checked
+image_gc_index: file each node records when its images were last used in. One index is shared by every user's jobs,
+                its directory must exist on each node and be writable by job owners, i.e. mode 1777 like /tmp
+image_gc_high: disk usage percentage at which images start being removed
+image_gc_low: disk usage percentage at which images stop being removed
+'''
+docker_root = '/var/lib/docker'
+image_gc_index = '/var/lib/dgrid/image-index'
+image_gc_high = 85
+image_gc_low = 70
+
+'''
+Deferred image cleanup.
+deferred_cleanup: queue the image cleanup on each node instead of running it before the job exits,
+                  so nodes are returned to Torque as soon as the containers are stopped
+cleanup_queue_dir: queue directory on each node, {user} is replaced with the job owner's uid
+cleanup_drain: what runs the queued cleanup
+    epilogue) a Torque epilogue running python -m dgrid.scheduling.utils.cleanup_queue /tmp/dgrid-cleanup-*
+    background) a worker started on each node when the job ends, in its own session. Torque MOMs with cgroups
+                enabled kill every process in the job's cgroup when the job ends, the worker included, use epilogue
+'''
+deferred_cleanup = False
+cleanup_queue_dir = '/tmp/dgrid-cleanup-{user}'
+cleanup_drain = 'epilogue'
+
+'''
+Job arrays, run with dgrid --array.
+array_concurrency: the number of sub-jobs running at once when the array specification sets no limit with %,
+                   each running sub-job needs one of the head node's slots for its interactive container
+'''
+array_concurrency = 4
 
 '''
 Remove containers using unreferenced images
@@ -21,7 +21,7 @@ Root execution script for dgrid
 
 import argparse
 from .version import __version__
-from .scheduling.schedule import Job
+from .scheduling.utils.job_array import parse_array
 from .scheduling.utils.logger import Logger
 
 
@@ -61,6 +61,14 @@ def main():
                           help="Display program's version number and exit",
                           version=__version__)
 
+    optional.add_argument('--array',
+                          dest='array',
+                          type=array_spec,
+                          help="Run as a job array in one process, for the indices given as in qsub -t, "
+                               "i.e. 0-999 or 0-999%%8 to run at most 8 sub-jobs at a time. Each sub-job's index "
+                               "is in its containers' DGRID_ARRAY_INDEX environment variable",
+                          required=False)
+
     # Optional debug parameter, for verbose output during execution
     optional.add_argument('--enable-debug',
                           dest='debug',
@@ -73,6 +81,25 @@ def main():
     # Get required logger for use during execution
     logger = Logger(args.debug).get_logger()
 
+    # Imported once the arguments are read, --help and --version don't need the scheduling modules
+    from .scheduling.schedule import Job
+
     # Create job instance and execute
-    job = Job(args.df, args.hf)
+    if args.array is None:
+        job = Job(args.df, args.hf)
+    else:
+        indices, limit = args.array
+        job = Job(args.df, args.hf, array=indices, concurrency=limit)
     job.execute()
+
+
+def array_spec(spec):
+    """
+    Reads the --array argument
+    :param spec: Job array specification
+    :return: List of array indices, limit on the sub-jobs running at once or None
+    """
+    try:
+        return parse_array(spec)
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError(str(ex))
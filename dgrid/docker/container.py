@@ -20,29 +20,52 @@ Class defining docker containers and their relevant commands
 """
 
 
-class Container(object):
+def param_args(flag, values):
+    """
+    Builds the arguments passing each value with a flag, i.e. -v for volumes
+    :param flag: Flag preceding each value
+    :param values: List of values, or None
+    :return: Tuple of arguments
+    """
+    args = []
+    for value in values or ():
+        args.append(flag)
+        args.append(value)
+    return tuple(args)
+
+
+def byte_size(value):
     """
-    Represent all the Docker container commands used to interface with Docker daemon
+    Reads a size as docker run takes it, i.e. 512m, as a number of bytes
+    :param value: Size string, a plain number is in bytes, -1 is unlimited
+    :return: Number of bytes
     """
+    value = str(value).strip().lower()
+    units = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class ContainerTemplate(object):
+    """
+    Read-only definition of a container, shared by every replica of a scaled container
+    """
+    __slots__ = ('image', 'name', 'volumes', 'cmd', 'environment_vars', 'interactive', 'detach', 'work_dir',
+                 'host_to_list', 'host_list_location', 'links', 'checkpointing',
+                 'mode_args', 'volume_args', 'env_args', 'workdir_args', 'cmd_args')
 
     def __init__(self, json):
         """
-        Initializes a container object
+        Initializes a container template
         :param json: Json object of container to instantiate
         """
         self.image = json['image']
-        self.cgroup_parent = None
-
-        if 'volumes' in json:
-            self.volumes = json['volumes']
-
         self.name = json['name']
-
-        if 'run_cmd' in json:
-            self.cmd = json['run_cmd']
-
-        if 'environment_variables' in json:
-            self.environment_vars = json['environment_variables']
+        # Lists are kept as tuples, so replicas can't change each other's definition
+        self.volumes = tuple(json['volumes']) if 'volumes' in json else None
+        self.cmd = tuple(json['run_cmd']) if 'run_cmd' in json else None
+        self.environment_vars = tuple(json['environment_variables']) if 'environment_variables' in json else None
 
         if json['interactive'] == 'True':
             self.interactive = 'True'
@@ -51,81 +74,257 @@ class Container(object):
             self.detach = 'True'
             self.interactive = 'False'
 
-        if 'work_dir' in json:
-            self.work_dir = json['work_dir']
-
-        self.host_to_list = json['host_to_list'] if 'host_to_list' in json else None
+        self.work_dir = json['work_dir'] if 'work_dir' in json else None
+        host_to_list = json['host_to_list'] if 'host_to_list' in json else None
+        self.host_to_list = tuple(host_to_list) if isinstance(host_to_list, list) else host_to_list
         self.host_list_location = json['host_list_location'] if 'host_list_location' in json else None
-        self.links = json['links'] if 'links' in json else None
-
-        self.user = None
-        self.network = None
-        self.memory = None
-        self.cpu_shares = None
-        self.cpu_set = None
-        self.memory_swap = None
-        self.memory_swappiness = None
-        self.kernel_memory = None
+        self.links = tuple(json['links']) if 'links' in json else None
         self.checkpointing = json['checkpointing'] if 'checkpointing' in json else False
-        self.checkpoint_dir = None
-        self.checkpoint_name = None
-        self.run_command = None
-        self.chk_command = None
-        self.rst_command = None
-        self.cln_command = None
-        self.term_command = None
-        self.image_cleanup = ['docker', 'rmi', self.image]
-        # Save the assigned host with the container object
-        self.execution_host = None
+
+        # Parts of the run command every replica shares, built once
+        self.mode_args = ('--interactive=' + self.interactive, '--detach=' + self.detach)
+        self.volume_args = param_args('-v', self.volumes)
+        self.env_args = param_args('-e', self.environment_vars)
+        self.workdir_args = ('--workdir=' + self.work_dir,) if self.work_dir is not None else ()
+        self.cmd_args = self.cmd or ()
+
+
+class ReplicaList(list):
+    """
+    List a replica copied from its template, changing it in place rebuilds the replica's run command
+    """
+    __slots__ = ('owner',)
+
+    def __init__(self, owner, values):
+        list.__init__(self, values)
+        self.owner = owner
+
+
+def rebuilds(method):
+    # Wraps a list method changing the list, so the owner's run command is rebuilt
+    def change(self, *args, **kwargs):
+        self.owner.run_args = None
+        return method(self, *args, **kwargs)
+    return change
+
+
+for method in ('append', 'extend', 'insert', 'remove', 'pop', 'sort', 'reverse', '__setitem__', '__delitem__',
+               '__iadd__', '__imul__', '__setslice__', '__delslice__'):
+    if hasattr(list, method):
+        setattr(ReplicaList, method, rebuilds(getattr(list, method)))
+
+
+class Shared(object):
+    """
+    Container attribute read from the container's template until a replica sets its own value.
+    Lists are copied for a replica the first time it reads them, so changing them in place only changes that replica
+    """
+
+    def __init__(self, name, optional=False, copy=False):
+        """
+        :param name: Name of the template attribute
+        :param optional: Whether a missing value reads as no attribute at all, as in the definition
+        :param copy: Whether the value is a list each replica gets its own copy of
+        """
+        self.name = name
+        self.override = '_' + name
+        self.optional = optional
+        self.copy = copy
+
+    def __get__(self, container, owner):
+        if container is None:
+            return self
+        value = getattr(container, self.override, Container.UNSET)
+        if value is Container.UNSET:
+            value = getattr(container.template, self.name)
+            if value is None and self.optional:
+                raise AttributeError(self.name)
+            if self.copy:
+                value = ReplicaList(container, value)
+                setattr(container, self.override, value)
+        return value
+
+    def __set__(self, container, value):
+        setattr(container, self.override, value)
+
+    def __delete__(self, container):
+        setattr(container, self.override, Container.UNSET)
+
+    def peek(self, container):
+        # The current value without copying it for the replica, None if missing
+        value = getattr(container, self.override, Container.UNSET)
+        return getattr(container.template, self.name) if value is Container.UNSET else value
+
+
+class Container(object):
+    """
+    Represent all the Docker container commands used to interface with Docker daemon.
+    Replicas of a scaled container share one ContainerTemplate, and only hold the state that differs between them
+    """
+    # Marks a replica that uses its template's value
+    UNSET = object()
+
+    # Resource and identity options of the run command, in the order docker run takes them
+    RUN_OPTIONS = (('cgroup_parent', '--cgroup-parent'), ('cpu_shares', '--cpu-shares'), ('cpu_set', '--cpuset-cpus'),
+                   ('cpu_mems', '--cpuset-mems'), ('memory', '--memory'), ('memory_swap', '--memory-swap'),
+                   ('memory_swappiness', '--memory-swappiness'), ('kernel_memory', '--kernel-memory'),
+                   ('user', '--user'), ('network', '--network'))
+
+    # Host configuration of the Engine API's create request for each run option, with the type the API takes
+    API_OPTIONS = (('cgroup_parent', 'CgroupParent', str), ('cpu_shares', 'CpuShares', int),
+                   ('cpu_set', 'CpusetCpus', str), ('cpu_mems', 'CpusetMems', str), ('memory', 'Memory', byte_size),
+                   ('memory_swap', 'MemorySwap', byte_size), ('memory_swappiness', 'MemorySwappiness', int),
+                   ('kernel_memory', 'KernelMemory', byte_size), ('network', 'NetworkMode', str))
+
+    # Replica values of template attributes
+    TEMPLATE_FIELDS = ('_image', '_volumes', '_cmd', '_environment_vars', '_work_dir')
+
+    # Replica state, unset until the job sets it
+    STATE_FIELDS = ('execution_host', 'network', 'user', 'cgroup_parent', 'cpu_shares', 'cpu_set', 'cpu_mems',
+                    'memory', 'memory_swap', 'memory_swappiness', 'kernel_memory', 'checkpoint_dir', 'checkpoint_name',
+                    'run_command', 'chk_command', 'rst_command', 'cln_command', 'term_command', 'run_args')
+
+    __slots__ = ('template', 'name') + TEMPLATE_FIELDS + STATE_FIELDS
+
+    # Attributes the run command is built from, setting any of them rebuilds it
+    RUN_FIELDS = frozenset([field for field, flag in RUN_OPTIONS] + ['name'] + list(TEMPLATE_FIELDS))
+
+    image = Shared('image')
+    volumes = Shared('volumes', optional=True, copy=True)
+    cmd = Shared('cmd', optional=True, copy=True)
+    environment_vars = Shared('environment_vars', optional=True, copy=True)
+    work_dir = Shared('work_dir', optional=True)
+
+    def __init__(self, json):
+        """
+        Initializes a container object
+        :param json: Json object of container to instantiate, or a ContainerTemplate shared with other replicas
+        """
+        # Set directly, there is no run command to rebuild yet
+        init = object.__setattr__
+        init(self, 'template', json if isinstance(json, ContainerTemplate) else ContainerTemplate(json))
+        init(self, 'name', self.template.name)
+        for field in Container.TEMPLATE_FIELDS:
+            init(self, field, Container.UNSET)
+        # Save the assigned host with the container object in execution_host
+        for field in Container.STATE_FIELDS:
+            init(self, field, None)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in Container.RUN_FIELDS:
+            object.__setattr__(self, 'run_args', None)
+
+    @property
+    def interactive(self):
+        return self.template.interactive
+
+    @property
+    def detach(self):
+        return self.template.detach
+
+    @property
+    def host_to_list(self):
+        return self.template.host_to_list
+
+    @property
+    def host_list_location(self):
+        return self.template.host_list_location
+
+    @property
+    def links(self):
+        return self.template.links
+
+    @property
+    def checkpointing(self):
+        return self.template.checkpointing
+
+    @property
+    def image_cleanup(self):
+        return ['docker', 'rmi', self.image]
 
     def run(self):
         """
-        Builds the command to execute docker container
+        Builds the command to execute docker container. The command is built once, and again only after
+        an attribute it is built from changes
         :return: Command string for running container
         """
-        self.run_command = ['docker', 'run']
-
-        # Add arguments to run command. Structure of docker run command must be adhered to.
-        self.add_argument(self.run_command, 'interactive', '--interactive')
-        self.add_argument(self.run_command, 'detach', '--detach')
-        self.add_argument(self.run_command, 'cgroup_parent', '--cgroup-parent')
-        self.add_argument(self.run_command, 'cpu_shares', '--cpu-shares')
-        self.add_argument(self.run_command, 'cpu_set', '--cpuset-cpus')
-        self.add_argument(self.run_command, 'memory', '--memory')
-        self.add_argument(self.run_command, 'memory_swap', '--memory-swap')
-        self.add_argument(self.run_command, 'memory_swappiness', '--memory-swappiness')
-        self.add_argument(self.run_command, 'kernel_memory', '--kernel-memory')
-        self.add_argument(self.run_command, 'user', '--user')
-        self.add_argument(self.run_command, 'network', '--network')
-
-        if hasattr(self, 'volumes'):
-            for volume in self.volumes:
-                # self.add_volume(volume)
-                self.add_param(volume, vol=True)
-
-        if hasattr(self, 'environment_vars'):
-            for env_var in self.environment_vars:
-                self.add_param(env_var, env=True)
-
-        self.add_argument(self.run_command, 'name', '--name')
-        self.add_argument(self.run_command, 'work_dir', '--workdir')
-        self.add_argument(self.run_command, 'image')
-
-        if hasattr(self, 'cmd'):
-            for arg in self.cmd:
-                self.add_param(arg, cmd=True)
-
+        run_args = self.run_args
+        if run_args is None:
+            run_args = self.compile_run()
+            # Lists set from outside can be changed in place without the replica knowing, so they aren't kept
+            if all(own is Container.UNSET or isinstance(own, ReplicaList)
+                   for own in (self._volumes, self._environment_vars, self._cmd)):
+                self.run_args = run_args
+        self.run_command = list(run_args)
         return self.run_command
 
+    def compile_run(self):
+        """
+        Builds the run command from the template's shared parts and this replica's own state.
+        Structure of docker run command must be adhered to
+        :return: Tuple of command arguments
+        """
+        template = self.template
+        args = ['docker', 'run']
+        args.extend(template.mode_args)
+        for field, flag in Container.RUN_OPTIONS:
+            value = getattr(self, field)
+            if value is not None:
+                args.append(flag + "=" + value)
+
+        # Shared lists are read without copying them for this replica
+        args.extend(template.volume_args if self._volumes is Container.UNSET else param_args('-v', self._volumes))
+        args.extend(template.env_args if self._environment_vars is Container.UNSET
+                    else param_args('-e', self._environment_vars))
+        args.append('--name=' + self.name)
+        if self._work_dir is Container.UNSET:
+            args.extend(template.workdir_args)
+        elif self._work_dir is not None:
+            args.append('--workdir=' + self._work_dir)
+        args.append(self.image)
+        args.extend(template.cmd_args if self._cmd is Container.UNSET else self._cmd or ())
+        return tuple(args)
+
+    def api_config(self):
+        """
+        Builds the body of the Engine API's create request, for the container docker run would run.
+        The container's output is attached unless it is detached. Interactive containers keep standard input open
+        as with docker run --interactive, but dgrid's own standard input is not forwarded to them
+        :return: Dictionary of the container's configuration
+        """
+        host_config = dict()
+        for field, key, convert in Container.API_OPTIONS:
+            value = getattr(self, field)
+            if value is not None:
+                host_config[key] = convert(value)
+        if Container.volumes.peek(self) is not None:
+            host_config['Binds'] = list(Container.volumes.peek(self))
+
+        config = {'Image': self.image, 'HostConfig': host_config,
+                  'AttachStdout': self.detach != 'True', 'AttachStderr': self.detach != 'True',
+                  'OpenStdin': self.interactive == 'True', 'StdinOnce': self.interactive == 'True'}
+        if self.user is not None:
+            config['User'] = str(self.user)
+        if Container.environment_vars.peek(self) is not None:
+            config['Env'] = list(Container.environment_vars.peek(self))
+        if Container.work_dir.peek(self) is not None:
+            config['WorkingDir'] = Container.work_dir.peek(self)
+        if Container.cmd.peek(self) is not None:
+            config['Cmd'] = list(Container.cmd.peek(self))
+        return config
+
     def checkpoint(self):
         """
         Builds checkpoint command
         :return: Command for Checkpointing container
         """
         self.chk_command = ['docker', 'checkpoint', 'create']
-        self.add_argument(self.chk_command, 'checkpoint_dir', '--checkpoint-dir')
-        self.add_argument(self.chk_command, 'name')
-        self.add_argument(self.chk_command, 'checkpoint_name')
+        if self.checkpoint_dir is not None:
+            self.chk_command.append('--checkpoint-dir=' + self.checkpoint_dir)
+        self.chk_command.append(self.name)
+        if self.checkpoint_name is not None:
+            self.chk_command.append(self.checkpoint_name)
         return self.chk_command
 
     def restore(self):
@@ -133,11 +332,12 @@ class Container(object):
         Builds docker restore command
         :return: Command for restoring container
         """
-        self.rst_command = ['docker', 'start']
-        self.add_argument(self.rst_command, 'interactive', '--interactive')
-        self.add_argument(self.rst_command, 'checkpoint_dir', '--checkpoint-dir')
-        self.add_argument(self.rst_command, 'checkpoint_name', '--checkpoint')
-        self.add_argument(self.rst_command, 'name')
+        self.rst_command = ['docker', 'start', '--interactive=' + self.interactive]
+        if self.checkpoint_dir is not None:
+            self.rst_command.append('--checkpoint-dir=' + self.checkpoint_dir)
+        if self.checkpoint_name is not None:
+            self.rst_command.append('--checkpoint=' + self.checkpoint_name)
+        self.rst_command.append(self.name)
         return self.rst_command
 
     def cleanup(self):
@@ -145,48 +345,17 @@ class Container(object):
         Builds command for container removal
         :return: Command to remove the docker container, with force and volumes
         """
-        self.cln_command = ['docker', 'rm', '-fv']
-        self.cln_command.append(self.name)
+        self.cln_command = ['docker', 'rm', '-fv', self.name]
         return self.cln_command
 
-    def terminate(self):
+    def terminate(self, timeout=None):
         """
         Builds command for stopping running container
+        :param timeout: Seconds to wait for the container to stop before killing it, docker's default if None
         :return: Command to stop running container
         """
         self.term_command = ['docker', 'stop']
+        if timeout is not None:
+            self.term_command.extend(['-t', str(timeout)])
         self.term_command.append(self.name)
         return self.term_command
-
-    def add_argument(self, command, name, suffix=None):
-        """
-        Adds arguments to the run command
-        :param command: Command to which args are to be appended
-        :param name: Name of the parameter containing value to append to command
-        :param suffix: Suffix to use for command parameter when required
-        :return: Null
-        """
-        if suffix is None:
-            if hasattr(self, name) and getattr(self, name) is not None:
-                command.append(getattr(self, name))
-        else:
-            if hasattr(self, name) and getattr(self, name) is not None:
-                command.append(suffix + "=" + getattr(self, name))
-
-    def add_param(self, param, vol=False, env=False, cmd=False):
-        """
-        Adds volumes or environment variables to the run command
-        :param param: the value to be assigned as environment variable or or volume mapping
-        :param vol: Checks if the parameter is a volume
-        :param env: checks if the volume is an environment variable
-        :param cmd: Checks if the parameter is part of the run command
-        :return: Null
-        """
-        if vol:
-            self.run_command.append('-v')
-            self.run_command.append(param)
-        if env:
-            self.run_command.append('-e')
-            self.run_command.append(param)
-        if cmd:
-            self.run_command.append(param)
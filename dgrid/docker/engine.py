@@ -0,0 +1,325 @@
+"""
+Author: Robert Brennan
+Email:  robert.brnnn@gmail.com
+
+Client for the Docker Engine API, over the docker daemon's UNIX socket
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+
+try:
+    from httplib import HTTPConnection, HTTPException
+    from urllib import urlencode, quote
+except ImportError:
+    from http.client import HTTPConnection, HTTPException
+    from urllib.parse import urlencode, quote
+
+from dgrid.scheduling.utils.Errors import DockerAPIError
+from dgrid.scheduling.utils.output import clock, STDOUT, STDERR
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Stream numbers in the headers of multiplexed container output
+STREAMS = {1: STDOUT, 2: STDERR}
+
+
+def split_image(image):
+    """
+    Splits an image reference into the repository and the tag or digest the API's pull takes separately
+    :param image: Image reference, i.e. ubuntu:14.04 or registry:5000/ubuntu
+    :return: Repository, tag or digest, latest if the reference has neither
+    """
+    if '@' in image:
+        return image.split('@', 1)
+    repository, sep, tag = image.rpartition(':')
+    if not sep or '/' in tag:
+        return image, 'latest'
+    return repository, tag
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    HTTP connection to a UNIX socket
+    """
+
+    def __init__(self, path, timeout=None):
+        """
+        :param path: Path of the socket
+        :param timeout: Socket timeout in seconds, None to block
+        """
+        HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = path
+        self.socket_timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.socket_timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerEngine(object):
+    """
+    Talks to the docker daemon through its Engine API, instead of starting a docker CLI process for each operation.
+    Short requests share one keep-alive connection, requests that block until a container finishes
+    get their own, so the container can still be stopped meanwhile
+    """
+
+    def __init__(self, socket_path='/var/run/docker.sock', timeout=60):
+        """
+        :param socket_path: Path of the docker daemon's socket, or a socket forwarded from another host
+        :param timeout: Seconds a short request may take
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+        self.count_lock = threading.Lock()
+        self.connections = 0
+
+    def connect(self, timeout):
+        # Opens a connection to the daemon
+        with self.count_lock:
+            self.connections += 1
+        return UnixHTTPConnection(self.socket_path, timeout)
+
+    def url(self, path, params=None):
+        # Request path with its query string, parameters set to None are left out
+        params = [(key, value) for key, value in sorted((params or {}).items()) if value is not None]
+        return path + ('?' + urlencode(params) if params else '')
+
+    def check(self, response, method, path):
+        """
+        Raises DockerAPIError for an error response, with the daemon's message
+        :param response: HTTPResponse, read fully when it is an error
+        :param method: Request method
+        :param path: Request path
+        :return: Null
+        """
+        if response.status < 400:
+            return
+        body = response.read().decode('utf-8', 'replace')
+        try:
+            message = json.loads(body).get('message', body)
+        except ValueError:
+            message = body
+        raise DockerAPIError("%s %s failed with status %d: %s" % (method, path, response.status, message.strip()),
+                             response.status)
+
+    def request(self, method, path, params=None, body=None):
+        """
+        Sends a request over the keep-alive connection, which is reopened once if the daemon closed it
+        Raises DockerAPIError if the daemon returns an error
+        :param method: Request method
+        :param path: Request path
+        :param params: Dictionary of query parameters
+        :param body: Object sent as the JSON body, or None
+        :return: Status code, and the decoded JSON body or None if the response has none
+        """
+        url = self.url(path, params)
+        data = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        with self.lock:
+            for attempt in (1, 2):
+                if self.connection is None:
+                    self.connection = self.connect(self.timeout)
+                try:
+                    self.connection.request(method, url, data, headers)
+                    response = self.connection.getresponse()
+                    content = response.read() if response.status < 400 else None
+                    break
+                except (HTTPException, socket.error):
+                    self.connection.close()
+                    self.connection = None
+                    if attempt == 2:
+                        raise
+            if content is None:
+                self.check(response, method, path)
+        content = content.decode('utf-8', 'replace')
+        return response.status, json.loads(content) if content.strip() else None
+
+    def stream(self, method, path, params=None):
+        """
+        Sends a request over a connection of its own, for responses streamed until the daemon ends them
+        Raises DockerAPIError if the daemon returns an error
+        :param method: Request method
+        :param path: Request path
+        :param params: Dictionary of query parameters
+        :return: Connection, to close once read, and its HTTPResponse
+        """
+        connection = self.connect(None)
+        try:
+            connection.request(method, self.url(path, params))
+            response = connection.getresponse()
+            self.check(response, method, path)
+        except Exception:
+            connection.close()
+            raise
+        return connection, response
+
+    def pull(self, image):
+        """
+        Pulls an image, the daemon reports progress and errors as JSON objects, one per line, once it has finished
+        Raises DockerAPIError if the pull fails
+        :param image: Image reference
+        :return: Null
+        """
+        repository, tag = split_image(image)
+        connection, response = self.stream('POST', '/images/create', {'fromImage': repository, 'tag': tag})
+        try:
+            for line in response.read().decode('utf-8', 'replace').splitlines():
+                try:
+                    progress = json.loads(line)
+                except ValueError:
+                    continue
+                if 'error' in progress:
+                    raise DockerAPIError("Pulling %s failed: %s" % (image, progress['error']))
+                if 'progressDetail' not in progress or not progress['progressDetail']:
+                    logger.debug("%s: %s" % (image, progress.get('status', '')))
+        finally:
+            connection.close()
+
+    def create_container(self, name, config):
+        """
+        Creates a container
+        :param name: Container name
+        :param config: Create request body, as built by Container.api_config
+        :return: Container id
+        """
+        return self.request('POST', '/containers/create', {'name': name}, config)[1]['Id']
+
+    def start_container(self, name):
+        self.request('POST', '/containers/%s/start' % quote(name))
+
+    def run_container(self, name, config):
+        """
+        Creates and starts a container, as docker run does
+        :param name: Container name
+        :param config: Create request body, as built by Container.api_config
+        :return: Container id
+        """
+        container_id = self.create_container(name, config)
+        self.start_container(name)
+        return container_id
+
+    def inspect_container(self, name):
+        return self.request('GET', '/containers/%s/json' % quote(name))[1]
+
+    def container_pid(self, name):
+        """
+        :param name: Container name
+        :return: Process id of the container's main process, 0 if it isn't running
+        """
+        return self.inspect_container(name)['State']['Pid']
+
+    def follow(self, name, handle):
+        """
+        Hands on the container's output until it exits, then waits for its exit code.
+        Output of containers without a TTY is multiplexed, each frame has a header with its stream and length
+        :param name: Container name
+        :param handle: Called with (stream, timestamp, line) for each line, stream is STDOUT or STDERR
+        :return: Exit code of the container
+        """
+        connection, response = self.stream('GET', '/containers/%s/logs' % quote(name),
+                                           {'follow': 1, 'stdout': 1, 'stderr': 1})
+        partial = {STDOUT: b'', STDERR: b''}
+        try:
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                stream_number, length = struct.unpack('>BxxxL', header)
+                stream = STREAMS.get(stream_number, STDOUT)
+                lines = (partial[stream] + response.read(length)).split(b'\n')
+                partial[stream] = lines.pop()
+                for line in lines:
+                    handle(stream, clock(), line.decode('utf-8', 'replace').rstrip('\r'))
+        finally:
+            connection.close()
+        for stream in (STDOUT, STDERR):
+            if partial[stream]:
+                handle(stream, clock(), partial[stream].decode('utf-8', 'replace').rstrip('\r'))
+        return self.wait_container(name)
+
+    def wait_container(self, name):
+        """
+        Waits for a container to exit
+        :param name: Container name
+        :return: Exit code of the container
+        """
+        connection, response = self.stream('POST', '/containers/%s/wait' % quote(name))
+        try:
+            return json.loads(response.read().decode('utf-8'))['StatusCode']
+        finally:
+            connection.close()
+
+    def stop_container(self, name, timeout=None):
+        """
+        Stops a container, the request lasts as long as the container takes to stop
+        :param name: Container name
+        :param timeout: Seconds to wait for the container to stop before killing it, docker's default if None
+        :return: Null
+        """
+        connection, response = self.stream('POST', '/containers/%s/stop' % quote(name), {'t': timeout})
+        connection.close()
+
+    def remove_container(self, name):
+        """
+        Removes a container with its volumes, killing it if it is still running, as docker rm -fv does
+        :param name: Container name
+        :return: Null
+        """
+        self.request('DELETE', '/containers/%s' % quote(name), {'force': 1, 'v': 1})
+
+    def create_network(self, name, driver='overlay'):
+        self.request('POST', '/networks/create', body={'Name': name, 'Driver': driver, 'CheckDuplicate': True})
+
+    def remove_network(self, name):
+        self.request('DELETE', '/networks/%s' % quote(name))
+
+    def stats(self):
+        """
+        Returns how many connections were opened to the daemon
+        :return: Dictionary of counts
+        """
+        return {'connections': self.connections}
+
+    def close(self):
+        """
+        Closes the keep-alive connection
+        :return: Null
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def local_engine():
+    """
+    Returns the client for this machine's docker daemon, when settings.docker_api is enabled and its socket exists
+    :return: DockerEngine, or None to use the docker CLI
+    """
+    path = settings.docker_socket
+    if not settings.docker_api or not os.path.exists(path):
+        return None
+    return DockerEngine(path, settings.docker_api_timeout)
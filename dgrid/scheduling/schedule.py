@@ -26,8 +26,8 @@ import signal
 
 from abc import ABCMeta, abstractmethod
 from dgrid.conf import settings
-from dgrid.scheduling.utils import fileparser
-from dgrid.scheduling.utils.Errors import ImportedSchedulerClassError
+from dgrid.scheduling.utils import fileparser, plugins
+from dgrid.scheduling.utils.Errors import ImportedSchedulerClassError, DefinitionError
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +51,15 @@ class Scheduler(object):
         """
         raise NotImplementedError
 
+    def run_array(self, jobs, concurrency=None):
+        """
+        Called to run a job array, in one process. Schedulers without job array support raise NotImplementedError
+        :param jobs: OrderedDict of array index to the sub-job's list of containers
+        :param concurrency: Most sub-jobs running at once
+        :return: Dictionary of array index to the sub-job's exit status, 0 when it succeeded
+        """
+        raise NotImplementedError("%s doesn't support job arrays" % type(self).__name__)
+
     @abstractmethod
     def checkpoint(self):
         """
@@ -86,12 +95,10 @@ class Scheduler(object):
         scheduler_class = settings.scheduler
 
         try:
-            # module importing from stackoverflow.com/a/547867/4345813
+            # Schedulers shipped with dgrid or installed as plugins, others are looked for in the schedulers package
             logger.debug('Loading scheduler class %s', scheduler_class)
-            module = __import__('dgrid.scheduling.schedulers.' + scheduler_class + '.'
-                                + scheduler_class, fromlist=scheduler_class)
-
-            klass = getattr(module, scheduler_class)
+            klass = plugins.load(plugins.SCHEDULERS, scheduler_class,
+                                 'dgrid.scheduling.schedulers.%s.%s:%s' % ((scheduler_class,) * 3))
             sched = klass(containers, hosts)
 
             # Return the scheduler
@@ -99,8 +106,8 @@ class Scheduler(object):
                 return sched
             raise ImportedSchedulerClassError("%s is not an instance and/or subclass of Scheduler class"
                                               % scheduler_class)
-        except ImportError:
-            logger.error("No Scheduler named %s. Check configuration files." % scheduler_class)
+        except ImportError as ex:
+            logger.error("No Scheduler named %s. Check configuration files. (%s)" % (scheduler_class, str(ex)))
             sys.exit(1)
 
     get_scheduler = staticmethod(get_scheduler)
@@ -113,10 +120,19 @@ class Job:
     Sets up signal handlers for termination and/or checkpoints
     Runs the job via execute method
     """
-    def __init__(self, dockerfile, hostfile=None):
+    def __init__(self, dockerfile, hostfile=None, array=None, concurrency=None):
+        """
+        :param dockerfile: Json docker definition file
+        :param hostfile: Hostfile for the job
+        :param array: List of array indices to run the job for, as a job array, or None for a single job
+        :param concurrency: Most sub-jobs of a job array running at once
+        """
         self.hf = hostfile
         self.df = dockerfile
+        self.array = array
+        self.concurrency = concurrency
         self.job = None
+        self.jobs = None
 
     def termination_handler(self, signum, frame):
         """
@@ -159,14 +175,22 @@ class Job:
             signal.signal(settings.checkpoint_signal, self.checkpoint_handler)
 
         # Run the task
-        self.job.run_job()
+        if self.array is None:
+            self.job.run_job()
+            return
+
+        results = self.job.run_array(self.jobs, self.concurrency)
+        sys.exit(0 if all(status == 0 for status in results.values()) else 1)
 
     def load(self):
         """
         Sets up scheduler class, for running the job, loads into class attribute job.
         :return:
         """
-        self.job = load_job(self.df, self.hf)
+        if self.array is None:
+            self.job = load_job(self.df, self.hf)
+        else:
+            self.job, self.jobs = load_array(self.df, self.array, self.hf)
 
 
 def load_job(dockerdef, hostfile=None):
@@ -176,6 +200,28 @@ def load_job(dockerdef, hostfile=None):
     :param dockerdef: Json docker definition file
     :return: Required scheduler
     """
-    containers, hosts = fileparser.load_data(dockerdef, hostfile)
+    try:
+        containers, hosts = fileparser.load_data(dockerdef, hostfile)
+    except DefinitionError as ex:
+        # Nothing has run on any host yet
+        logger.error("Invalid docker definition: " + str(ex))
+        sys.exit(1)
 
     return Scheduler.get_scheduler(containers, hosts)
+
+
+def load_array(dockerdef, indices, hostfile=None):
+    """
+    Loads the containers of every sub-job of a job array, and the hosts, and returns the required scheduler
+    :param dockerdef: Json docker definition file
+    :param indices: List of array indices
+    :param hostfile: Hostfile for the job
+    :return: Required scheduler, OrderedDict of array index to the sub-job's list of containers
+    """
+    try:
+        jobs = fileparser.get_array_containers(dockerdef, indices)
+    except DefinitionError as ex:
+        logger.error("Invalid docker definition: " + str(ex))
+        sys.exit(1)
+
+    return Scheduler.get_scheduler(None, fileparser.get_hosts(hostfile)), jobs
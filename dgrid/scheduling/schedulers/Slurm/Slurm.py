@@ -0,0 +1,80 @@
+"""
+Author: Robert Brennan
+Email:  robert.brnnn@gmail.com
+
+Implementation for docker execution on Slurm
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+
+from dgrid.scheduling.schedule import Scheduler
+from dgrid.scheduling.utils import plugins
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Slurm(Scheduler):
+    """
+    Implementation of scheduler class for Slurm, job arrays aren't supported
+    """
+    def __init__(self, containers, hosts=None):
+        Scheduler.__init__(self, containers, hosts)
+        self.containers = containers
+        self.hosts = hosts
+
+        # Get execution parameter, default to SRUN. Execution_Method is Torque's
+        exec_method = settings.slurm_execution_method
+        logger.debug('Loading %s executor' % exec_method)
+        self.executor_class = plugins.load(plugins.EXECUTORS, exec_method)
+
+        # A job array is loaded without containers, and refused by run_array
+        self.executor = self.executor_class(self.containers, self.hosts) if self.containers is not None else None
+
+    def run_job(self):
+        """
+        Called to run the Docker job
+        :return:
+        """
+        self.executor.run()
+
+    def checkpoint(self):
+        """
+        Called to checkpoint containers of the job
+        :return:
+        """
+        self.executor.checkpoint()
+
+    def restore(self):
+        """
+        Called to restore container of the job
+        :return:
+        """
+        self.executor.restore()
+
+    def terminate(self):
+        """
+        Called to terminate containers of the job
+        :return:
+        """
+        logger.debug("Terminate called")
+        if self.executor is None:
+            return
+        self.executor.terminate_clean()
+        logger.debug("Remove images")
+        self.executor.remove_images()
+        self.executor.remove_step_dir()
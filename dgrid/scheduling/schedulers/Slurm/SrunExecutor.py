@@ -0,0 +1,407 @@
+"""
+Author: Robert Brennan
+Executor used by the Slurm scheduler class, launching remote containers with job steps instead of SSH
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import string
+import sys
+import threading
+from collections import OrderedDict
+from subprocess import Popen, PIPE
+
+from dgrid.docker.engine import local_engine
+from dgrid.scheduling.utils.Errors import HostValueError, InteractiveContainerNotSpecified, RemoteExecutionError, \
+    PlacementError
+from dgrid.scheduling.utils.docker_netorking import add_networking, hostfile_name
+from dgrid.scheduling.utils.executor_base import ExecutorBase
+from dgrid.scheduling.utils.launch_script import build_launch_script
+from dgrid.scheduling.utils.nodelist import slurm_hosts
+from dgrid.scheduling.utils.output import stream_output, clock, STDERR
+from dgrid.scheduling.utils.placement import host_slots, place, placement_map
+from dgrid.scheduling.utils.teardown import teardown_command
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# srun --label prefixes each line of a task's output with the task's rank
+LABEL = re.compile(r'^\s*(\d+): ?(.*)$')
+
+# First line of every task's output, naming the node the task runs on
+NODE_MARKER = 'DGRID_NODE'
+
+
+def step_script(host_commands):
+    """
+    Builds the program every task of a step runs. Slurm numbers a step's tasks in its own node order,
+    so each task picks its node's commands by SLURMD_NODENAME rather than by rank
+    :param host_commands: OrderedDict of node to the shell commands to run on it
+    :return: Script as a string
+    """
+    lines = ['echo "%s $SLURMD_NODENAME"' % NODE_MARKER, 'case "$SLURMD_NODENAME" in']
+    for host, commands in host_commands.items():
+        lines.extend(["'%s')" % host, commands, ';;'])
+    lines.append('esac')
+    return '\n'.join(lines) + '\n'
+
+
+class SrunExecutor(ExecutorBase):
+    """
+    SrunExecutor class used by Slurm scheduler class to run a job.
+    The containers of every remote node are launched by one srun --multi-prog step, which Slurm fans out
+    through slurmd's tree instead of one connection per node, so launch time stays nearly flat as nodes are added.
+    Containers are placed in the job's cgroup with --cgroup-parent, so Slurm accounts for and limits them
+    without a pbs_track step
+    """
+
+    def __init__(self, containers, hosts=None, work_dir=None):
+        """
+        :param containers: List of container objects
+        :param hosts: list of hosts, read from SLURM_JOB_NODELIST and SLURM_TASKS_PER_NODE if None
+        :param work_dir: Directory the host list and the job steps' scripts are written to, SLURM_SUBMIT_DIR if None.
+                         It must be readable on every node
+        """
+        self.hosts = hosts
+        if self.hosts is None:
+            logger.debug("Retrieving assigned hosts with environment variable SLURM_JOB_NODELIST")
+            self.hosts = slurm_hosts(os.environ.get('SLURM_JOB_NODELIST'), os.environ.get('SLURM_TASKS_PER_NODE'),
+                                     settings.scontrol_binary)
+
+        self.containers = containers
+        # Slurm's name for this node, which may not be the hostname
+        self.hostname = os.environ.get('SLURMD_NODENAME') or socket.gethostname()
+        self.int_container = None
+
+        self.user = str(os.getuid())
+        self.job_id = os.environ.get('SLURM_JOB_ID')
+        self.work_dir = work_dir or os.environ.get('SLURM_SUBMIT_DIR')
+        self.srun = settings.srun_binary
+        self.srun_options = list(settings.srun_options)
+        cgroup_parent = settings.slurm_cgroup_parent
+        self.cgroup_parent = cgroup_parent.format(user=self.user, job_id=self.job_id) if cgroup_parent else None
+        # Scripts of the job steps, removed at the end of the job
+        self.step_dir = os.path.join(self.work_dir, '.dgrid-steps-%s' % self.job_id)
+
+        context = os.path.realpath(__file__)
+        path = re.sub('dgrid/scheduling/schedulers/Slurm/SrunExecutor\.py.*', "", context)
+        self.script_dir = path + "/dgrid-scripts/"
+
+        # Count the slots allocated on each host, current host must be one of them
+        logger.debug(self.hosts)
+        self.slots = host_slots(self.hosts)
+        if self.hostname not in self.slots:
+            raise HostValueError('Hostname of execution host not in assigned hosts list')
+        # The interactive container takes one of the current host's slots
+        self.slots[self.hostname] -= 1
+
+        self.containers, self.create_net = add_networking(self.containers, self.work_dir)
+        self.network_name = ""
+
+        # Get the interactive container, and remove from list
+        for container in self.containers:
+            if container.interactive == 'True':
+                self.int_container = container
+                self.containers.remove(self.int_container)
+
+        if self.int_container is None:
+            raise InteractiveContainerNotSpecified('An interactive container must be specified for logging')
+
+        self.local_run = False
+        # Client for this node's docker daemon, None to run the docker CLI instead
+        self.engine = local_engine()
+
+    def run(self):
+        """
+        Launches the remote containers, then runs the interactive container locally
+        :return: NULL
+        """
+        if self.create_net and not self.network_name:
+            self.network_name = ''.join([random.choice(string.ascii_letters + string.digits) for n in range(10)])
+
+        self.assign_execute()
+        self.job_execution()
+        self.job_termination()
+
+    def assign_execute(self):
+        """
+        Assigns nodes to containers set to be run on remote machines, and launches them
+        :return: Null
+        """
+        logger.info('-- Running remote containers --')
+        try:
+            assignments = place(self.containers, self.slots, settings.placement_strategy)
+        except PlacementError as pex:
+            logger.critical("Placement of containers failed: " + pex.message)
+            self.abort("Terminating")
+
+        logger.info('-- Container placement --')
+        for host, containers in placement_map(assignments).items():
+            logger.info("%s: %d of %d slots, %s" % (host, len(containers), self.slots[host],
+                                                    " ".join(container.name for container in containers)))
+
+        for host, container in assignments:
+            container.network = self.network_name if self.create_net else None
+            container.user = self.user
+            container.cgroup_parent = self.cgroup_parent
+
+        if self.create_net:
+            logger.debug("creating docker container network for job")
+            self.docker_network(create=True, remove=False)
+
+        self.launch(assignments)
+
+    def launch(self, assignments):
+        """
+        Launches the assigned containers on all nodes in one job step.
+        If any node fails to launch its containers, the job is torn down
+        :param assignments: List of (host, container) tuples
+        :return: Null
+        """
+        for host, container in assignments:
+            container.execution_host = host
+        host_containers = placement_map(assignments)
+
+        if not host_containers:
+            return
+
+        scripts = OrderedDict((host, build_launch_script(containers, None, self.job_id))
+                              for host, containers in host_containers.items())
+        outputs = self.finish_step(self.start_step('launch', scripts))
+
+        failed = False
+        for host, containers in host_containers.items():
+            try:
+                if outputs[host] is None:
+                    raise RemoteExecutionError("Launch step didn't run on " + host)
+                self.check_launch(host, containers, outputs[host])
+            except RemoteExecutionError as rex:
+                logger.critical("Remote execution of containers failed on " + host + ": " + rex.message)
+                failed = True
+
+        if failed:
+            self.abort("Terminating")
+
+    def start_step(self, name, host_commands):
+        """
+        Starts a job step running each node's commands, on all nodes at once in a single srun --multi-prog step
+        :param name: Name of the step, used for its scripts and job step name
+        :param host_commands: OrderedDict of node to the shell commands to run on it
+        :return: Step, for finish_step
+        """
+        if not os.path.isdir(self.step_dir):
+            os.makedirs(self.step_dir)
+        script = os.path.join(self.step_dir, name + '.sh')
+        with open(script, 'w') as f:
+            f.write(step_script(host_commands))
+        conf = os.path.join(self.step_dir, name + '.conf')
+        with open(conf, 'w') as f:
+            f.write('* sh %s\n' % script)
+
+        hosts = list(host_commands.keys())
+        command = [self.srun] + self.srun_options + ['--job-name=dgrid-' + name, '--nodes=%d' % len(hosts),
+                                                    '--ntasks=%d' % len(hosts), '--ntasks-per-node=1',
+                                                    '--nodelist=' + ','.join(hosts), '--label', '--multi-prog', conf]
+        logger.debug(" ".join(command))
+        process = Popen(command, stdout=PIPE, stderr=PIPE)
+
+        # Each task names its node first, the rest of its output is the node's
+        nodes = dict()
+        outputs = OrderedDict((host, None) for host in hosts)
+
+        def collect(stream, timestamp, line):
+            label = LABEL.match(line)
+            if label is None:
+                # srun's own messages
+                if stream == STDERR:
+                    logger.error("srun: " + line)
+                else:
+                    logger.info("srun: " + line)
+                return
+            rank, text = label.groups()
+            if text.startswith(NODE_MARKER + ' '):
+                nodes[rank] = text[len(NODE_MARKER) + 1:].strip()
+                if nodes[rank] in outputs:
+                    outputs[nodes[rank]] = []
+            elif outputs.get(nodes.get(rank)) is not None:
+                outputs[nodes[rank]].append(text)
+            else:
+                logger.info("%s: %s" % (nodes.get(rank, rank), text))
+
+        reader = threading.Thread(target=stream_output, args=(process, collect, settings.output_buffer_lines))
+        reader.daemon = True
+        reader.start()
+        return name, process, reader, outputs
+
+    def finish_step(self, step, deadline=None):
+        """
+        Waits for a step started by start_step, at most until the deadline, after which the step is killed
+        :param step: Step, from start_step
+        :param deadline: clock() time to stop waiting at, or None to wait until the step ends
+        :return: OrderedDict of node to the output of its commands, None for nodes the step didn't run on
+        """
+        name, process, reader, outputs = step
+        # Timed waits, an untimed one can't be interrupted by the job's termination signal on Python 2
+        while reader.is_alive() and (deadline is None or clock() < deadline):
+            reader.join(0.5)
+        if reader.is_alive():
+            logger.error("Job step %s passed its deadline, killing it" % name)
+            process.kill()
+            reader.join(5)
+
+        status = process.wait()
+        if status != 0:
+            logger.debug("Job step %s exited with status %d" % (name, status))
+        return OrderedDict((host, '\n'.join(lines) if lines is not None else None) for host, lines in outputs.items())
+
+    def job_execution(self):
+        """
+        Runs the interactive container, for any error the job is torn down
+        :return: Null
+        """
+        try:
+            self.run_int_container()
+        except Exception as ex:
+            exc = type(ex).__name__
+            logger.critical("Interactive container execution error: " + exc + " " + str(ex))
+            self.abort("Terminating")
+
+    def run_int_container(self):
+        """
+        Runs the interactive container on the node the job's batch script runs on
+        :return: Null
+        """
+        if self.create_net:
+            self.int_container.network = self.network_name
+        self.int_container.user = self.user
+        self.int_container.cgroup_parent = self.cgroup_parent
+
+        logger.debug(" ".join(self.int_container.run()))
+        if self.engine is not None:
+            self.engine_run(self.int_container)
+            self.local_run = True
+            logger.info("-- Interactive Container Output --")
+            self.engine.follow(self.int_container.name, self.log_output)
+        else:
+            proc = Popen(self.int_container.run(), stdout=PIPE, stderr=PIPE)
+            self.local_run = True
+            logger.info("-- Interactive Container Output --")
+            self.print_output(proc)
+        self.local_run = False
+
+    def job_termination(self):
+        """
+        Removes the job's containers and images, and exits
+        :return: Null
+        """
+        try:
+            self.terminate_clean()
+            self.remove_images()
+        finally:
+            self.remove_step_dir()
+        sys.exit(0)
+
+    def abort(self, message):
+        """
+        Tears the job down after a failure, and exits
+        :param message: Exit message
+        :return: Null
+        """
+        try:
+            self.terminate_clean()
+            self.remove_images()
+        finally:
+            self.remove_step_dir()
+        sys.exit(message)
+
+    def terminate_clean(self):
+        """
+        Stops and removes the remote containers in one job step, while the local interactive container is stopped
+        and removed. Containers get settings.stop_timeout seconds to stop, and the step is killed after
+        settings.teardown_deadline seconds, so the job finishes before Slurm kills it
+        :return: Null
+        """
+        stop_timeout = settings.stop_timeout
+        host_containers = placement_map([(container.execution_host, container) for container in self.containers
+                                         if container.execution_host is not None])
+
+        step = None
+        if host_containers:
+            logger.info("-- Stopping and removing remote containers --")
+            step = self.start_step('teardown', OrderedDict((host, teardown_command(containers, stop_timeout))
+                                                           for host, containers in host_containers.items()))
+        deadline = clock() + settings.teardown_deadline
+
+        if self.local_run is True:
+            logger.info("-- Terminating local interactive container --")
+            self.local_docker(self.int_container.terminate(stop_timeout),
+                              lambda: self.engine.stop_container(self.int_container.name, stop_timeout))
+
+        logger.info("-- Removing local interactive container --")
+        self.local_docker(self.int_container.cleanup(), lambda: self.engine.remove_container(self.int_container.name))
+
+        if step is not None:
+            for host, output in self.finish_step(step, deadline).items():
+                if output is None:
+                    logger.error("Containers may be left running on " + host)
+                    continue
+                for line in output.splitlines():
+                    logger.info(line)
+
+        if self.create_net:
+            logger.debug("Removing docker network " + self.network_name)
+            self.docker_network(create=False, remove=True)
+            hostfile = hostfile_name(os.environ.get("DGRID_HOSTFILE_FORMAT"))
+            if hostfile is not None and os.path.isfile(self.work_dir + "/" + hostfile):
+                os.remove(self.work_dir + "/" + hostfile)
+
+    def remove_images(self):
+        """
+        Removes images based on value set in settings file, taking each cleanup action once per node,
+        on all nodes in one job step
+        :return: Null
+        """
+        if settings.image_cleanup not in (1, 2, 3):
+            return
+
+        host_commands, command = self.cleanup_commands()
+        step = None
+        if host_commands:
+            step = self.start_step('cleanup', host_commands)
+
+        self.print_output(Popen(['sh', '-c', command], stdout=PIPE, stderr=PIPE))
+
+        if step is not None:
+            for host, output in self.finish_step(step).items():
+                if output is None:
+                    logger.error("Image cleanup didn't run on " + host)
+                    continue
+                for line in output.splitlines():
+                    logger.info(line)
+
+    def remove_step_dir(self):
+        # Removes the scripts of the job's steps
+        shutil.rmtree(self.step_dir, ignore_errors=True)
+
+    def checkpoint(self):
+        pass
+
+    def restore(self):
+        pass
@@ -0,0 +1,160 @@
+"""
+Author: Robert Brennan
+SSH execution class for use with Torque 6, driving the system ssh binary with multiplexed connections
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from subprocess import Popen, PIPE, STDOUT
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+from dgrid.scheduling.utils.cgroups import snapshot_command, parse_snapshot
+from dgrid.scheduling.utils.launch_script import build_launch_script
+from dgrid.scheduling.utils.numa import topology_command, parse_topology
+from dgrid.scheduling.utils.openssh import OpenSSHPool
+from dgrid.scheduling.utils.placement import placement_map
+
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSSHExecutor(SSHExecutor):
+    """
+    AsyncSSHExecutor class used by Torque scheduler class to run a job.
+    Runs remote commands through OpenSSH, with one ControlMaster connection per host,
+    and launches on every host at once from a single poll loop instead of a thread per host.
+    Termination and image cleanup are the same as SSHExecutor's, over the multiplexed connections
+    """
+
+    # Whether launched container processes are registered with the job by pbs_track
+    track_processes = True
+    # Whether this host's launch script runs in process, instead of through the pool
+    local_launch = True
+
+    def __init__(self, containers, hosts, work_dir=None):
+        """
+        :param containers: List of container objects
+        :param hosts: list of hosts
+        :param work_dir: Directory the host list is written to, PBS_O_WORKDIR if None
+        """
+        SSHExecutor.__init__(self, containers, hosts, work_dir)
+        self.pool = OpenSSHPool(settings.ssh_binary, control_persist=settings.ssh_control_persist)
+        self.concurrency = settings.ssh_concurrency
+
+    def launch_parallel(self, assignments):
+        """
+        Launches the assigned containers on all hosts at the same time, at most settings.ssh_concurrency at once.
+        Each host's containers are launched with a single script, which reads the job's cgroup limits itself.
+        Hosts whose cpus are split between their containers have their limits and NUMA topology read in one round
+        beforehand. Once a launch fails no further hosts are started,
+        and the containers already started are torn down
+        :param assignments: List of (host, container) tuples
+        :return: Null
+        """
+        for host, container in assignments:
+            container.execution_host = host
+        host_containers = placement_map(assignments)
+
+        if not host_containers:
+            return
+
+        try:
+            self.read_hosts(host_containers)
+        except RemoteExecutionError as rex:
+            logger.critical("Reading job limits failed: " + rex.message)
+            for host, container in assignments:
+                container.execution_host = None
+            self.abort("Terminating")
+
+        hosts = list(host_containers.keys())
+        scripts = []
+        for host in hosts:
+            limits = self.launch_limits(host, host_containers[host])
+            for container in host_containers[host]:
+                self.constrain(host, container, limits is None)
+            scripts.append((host, build_launch_script(host_containers[host],
+                                                       settings.pbs_track if self.track_processes else None,
+                                                       self.job_id, limits)))
+
+        # This host's script runs in process, alongside the other hosts' scripts
+        local = None
+        if self.local_launch and self.hostname in host_containers:
+            local = Popen(['sh', '-c', dict(scripts)[self.hostname]], stdout=PIPE, stderr=STDOUT)
+        remote = [(host, script) for host, script in scripts if local is None or host != self.hostname]
+        remote_results = iter(self.pool.run_all(remote, self.concurrency, stop_on_failure=True))
+        results = []
+        for host in hosts:
+            if local is not None and host == self.hostname:
+                output = local.communicate()[0].decode('utf-8', 'replace')
+                results.append((local.returncode, output))
+            else:
+                results.append(next(remote_results))
+
+        failed = False
+        for host, result in zip(hosts, results):
+            if result is None:
+                # Never started, nothing to tear down
+                for container in host_containers[host]:
+                    container.execution_host = None
+                continue
+
+            exit_code, output = result
+            try:
+                self.pool.result(host, 'Launch script', exit_code, output, warn_only=True)
+                self.check_launch(host, host_containers[host], output)
+            except RemoteExecutionError as rex:
+                logger.critical("Remote execution of containers failed on " + host + ": " + rex.message)
+                failed = True
+
+        if failed:
+            self.abort("Terminating")
+
+    def read_hosts(self, host_containers):
+        """
+        Reads the job's cgroup limits and NUMA topology of the remote hosts whose cpus are split between their
+        containers, with one command per host run on all of them at once. The other hosts' launch scripts read
+        the limits themselves. Results fill the caches used by get_limits and get_topology
+        :param host_containers: OrderedDict of host to the containers placed on it
+        :return: Null
+        """
+        shared = [host for host, containers in host_containers.items()
+                  if host != self.hostname and self.partitioned(host, containers)
+                  and (host not in self.host_limits or host not in self.host_topology)]
+
+        command = snapshot_command(settings.cgroup_dir, self.job_path) + '; ' + topology_command()
+        for host, output in self.run_hosts(shared, command):
+            self.host_limits[host] = parse_snapshot(settings.cgroup_dir, self.job_path, output)
+            self.host_topology[host] = parse_topology(output)
+            limits = self.host_limits[host]
+            logger.debug("cgroup v%d limits on %s: cpu shares %s, cpus %s, memory %s"
+                         % (limits.version, host, limits.cpu_shares, limits.cpu_set, limits.memory))
+
+    def run_hosts(self, hosts, command):
+        """
+        Runs one command on many hosts at once
+        Raises RemoteExecutionError if the command fails on any host
+        :param hosts: List of hosts
+        :param command: Command string to execute
+        :return: List of (host, output) tuples
+        """
+        results = self.pool.run_all([(host, command) for host in hosts], self.concurrency, stop_on_failure=True)
+        # Failures are raised before hosts left unstarted by them
+        outputs = [(host, self.pool.result(host, command, result[0], result[1]))
+                   for host, result in zip(hosts, results) if result is not None]
+        if len(outputs) != len(hosts):
+            raise RemoteExecutionError("Command not run on %d hosts" % (len(hosts) - len(outputs)))
+        return outputs
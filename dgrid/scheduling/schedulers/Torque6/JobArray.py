@@ -0,0 +1,234 @@
+"""
+Author: Robert Brennan
+Runs the sub-jobs of a job array from one dgrid process, for use with Torque 6
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import random
+import shutil
+import socket
+import string
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from dgrid.scheduling.utils.fileparser import get_hosts
+from dgrid.scheduling.utils.output import clock
+from dgrid.scheduling.utils.job_array import split_slots, lane_shares
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobArray(object):
+    """
+    Runs the sub-jobs of a job array with a bounded number at a time, each on its own share of the job's slots.
+    The sub-jobs share one set of connections, one image staging pass, one docker network and one image cleanup
+    """
+
+    def __init__(self, executor_class, jobs, hosts=None, concurrency=None):
+        """
+        :param executor_class: Executor class running each sub-job, i.e. SSHExecutor
+        :param jobs: OrderedDict of array index to the sub-job's list of containers
+        :param hosts: list of hosts, PBS_NODEFILE's hosts if None
+        :param concurrency: Most sub-jobs running at once, settings.array_concurrency if None
+        """
+        self.executor_class = executor_class
+        self.jobs = jobs
+        self.hosts = hosts if hosts is not None else get_hosts(os.environ.get("PBS_NODEFILE"))
+        self.concurrency = concurrency or settings.array_concurrency
+        self.hostname = socket.gethostname()
+        self.work_dir = os.environ.get("PBS_O_WORKDIR")
+
+        # Hosts of each lane, and each lane's share of the slots on its hosts
+        self.lanes = []
+        self.shares = []
+        # Executor of the first sub-job, whose connections and host information the other sub-jobs use
+        self.lead = None
+        self.running = dict()
+        self.results = dict()
+        # Containers of finished sub-jobs, for the image cleanup at the end of the array
+        self.finished = []
+        self.lock = threading.Lock()
+        self.terminating = False
+        self.cleaned_up = False
+
+    def run(self):
+        """
+        Runs every sub-job, then cleans up after the array
+        :return: Dictionary of array index to the sub-job's exit status, 0 when it succeeded
+        """
+        self.lanes = split_slots(self.hosts, self.concurrency, self.hostname)
+        self.shares = lane_shares(self.hosts, self.lanes)
+        indices = list(self.jobs.keys())
+        logger.info("-- Running %d sub-jobs, %d at a time --" % (len(indices), len(self.lanes)))
+
+        self.lead = self.sub_executor(indices[0], 0)
+        self.prepare()
+
+        # The first lane starts with the first sub-job, its executor was created for the lane's slots
+        queue = Queue()
+        for index in indices[1:]:
+            queue.put(index)
+
+        workers = ThreadPool(len(self.lanes))
+        pending = workers.map_async(lambda lane: self.run_lane(lane, queue, indices[0] if lane == 0 else None),
+                                    range(len(self.lanes)))
+        workers.close()
+        try:
+            self.lead.wait_for(pending)
+            workers.join()
+        finally:
+            self.finish()
+
+        failed = sorted(index for index, status in self.results.items() if status != 0)
+        logger.info("-- %d of %d sub-jobs succeeded --" % (len(self.results) - len(failed), len(indices)))
+        if failed:
+            logger.error("Failed sub-jobs: " + " ".join(str(index) for index in failed))
+        return self.results
+
+    def sub_executor(self, index, lane):
+        """
+        Creates the executor of a sub-job, its host list is written to its own directory.
+        The executor only splits its lane's share of each host's cpus between its containers
+        :param index: Array index of the sub-job
+        :param lane: Number of the lane the sub-job runs in
+        :return: Executor
+        """
+        work_dir = None
+        if self.work_dir is not None:
+            work_dir = os.path.join(self.work_dir, 'dgrid-array-%d' % index)
+            if not os.path.isdir(work_dir):
+                os.makedirs(work_dir)
+        executor = self.executor_class(self.jobs[index], self.lanes[lane], work_dir)
+        executor.slot_shares = self.shares[lane]
+        if self.lead is not None:
+            executor.share(self.lead)
+        return executor
+
+    def prepare(self):
+        """
+        Creates the array's docker network, and pulls the images of the sub-jobs on every host once,
+        as settings.prestage_images would for a single job
+        :return: Null
+        """
+        lead = self.lead
+        lead.in_array = True
+        if lead.create_net:
+            lead.network_name = ''.join([random.choice(string.ascii_letters + string.digits) for n in range(10)])
+
+        staging = None
+        if settings.prestage_images:
+            # Sub-jobs may be placed on any of the job's hosts
+            hosts = [host for host in OrderedDict.fromkeys(self.hosts) if host != self.hostname]
+            assignments = [(self.hostname, container) for container in [lead.int_container] + lead.containers]
+            assignments.extend((host, container) for host in hosts for container in lead.containers)
+            staging = lead.start_staging(assignments)
+
+        if lead.create_net:
+            logger.debug("creating docker container network for job array")
+            lead.docker_network(create=True, remove=False)
+
+        if staging is not None:
+            lead.finish_staging(*staging)
+
+    def run_lane(self, lane, queue, first=None):
+        """
+        Runs in a worker thread for each lane, running sub-jobs one after another until none are left
+        :param lane: Number of the lane
+        :param queue: Queue of the array indices not yet started
+        :param first: Array index of the lead sub-job, run before any from the queue
+        :return: Null
+        """
+        if first is not None:
+            self.run_sub_job(first, lane, self.lead)
+        while not self.terminating:
+            try:
+                index = queue.get_nowait()
+            except Empty:
+                return
+            self.run_sub_job(index, lane)
+
+    def run_sub_job(self, index, lane, executor=None):
+        """
+        Runs one sub-job, recording its exit status
+        :param index: Array index of the sub-job
+        :param lane: Number of the lane the sub-job runs in
+        :param executor: Executor already created for the sub-job, one is created if None
+        :return: Null
+        """
+        start = clock()
+        status = 1
+        try:
+            executor = executor or self.sub_executor(index, lane)
+            with self.lock:
+                self.running[index] = executor
+            executor.run()
+        except SystemExit as ex:
+            # Executors exit once their job is over, 0 when it succeeded
+            status = ex.code or 0
+        except Exception as ex:
+            logger.error("Sub-job %d failed: %s %s" % (index, type(ex).__name__, str(ex)))
+            if executor is not None:
+                executor.terminate_clean()
+        finally:
+            with self.lock:
+                self.running.pop(index, None)
+                self.results[index] = status
+                if executor is not None:
+                    self.finished.extend(container for container in executor.containers
+                                         if container.execution_host is not None)
+            if executor is not None and executor.work_dir != self.work_dir:
+                shutil.rmtree(executor.work_dir, ignore_errors=True)
+        logger.info("Sub-job %d finished in %.1fs with status %s" % (index, clock() - start, status))
+
+    def finish(self):
+        """
+        Removes the array's network, runs the image cleanup once for every sub-job, and closes the connections
+        :return: Null
+        """
+        lead = self.lead
+        if self.cleaned_up:
+            return
+        self.cleaned_up = True
+        try:
+            if lead.create_net:
+                logger.debug("Removing docker network " + lead.network_name)
+                lead.docker_network(create=False, remove=True)
+            lead.containers = self.finished
+            lead.remove_images()
+        finally:
+            lead.report_inventory()
+            lead.close_connections()
+
+    def terminate(self):
+        """
+        Called when the job is terminated, tears down the sub-jobs still running and cleans up after the array
+        :return: Null
+        """
+        self.terminating = True
+        with self.lock:
+            running = list(self.running.values())
+        for executor in running:
+            executor.terminate_clean()
+        if self.lead is not None:
+            self.finish()
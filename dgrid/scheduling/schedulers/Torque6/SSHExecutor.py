@@ -24,31 +24,46 @@ import random
 import socket
 import string
 import re
-from retry import retry
-from subprocess import Popen, PIPE, CalledProcessError
-from fabric.api import run, env
-from fabric.tasks import execute
-from fabric.network import disconnect_all
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from subprocess import Popen, PIPE, STDOUT, CalledProcessError
+from dgrid.docker.engine import local_engine
 from dgrid.scheduling.utils.Errors import HostValueError, InteractiveContainerNotSpecified, RemoteExecutionError, \
-    ProcessIdRetrievalFailure
-from dgrid.scheduling.utils.docker_netorking import add_networking
+    ProcessIdRetrievalFailure, PlacementError
+from dgrid.scheduling.utils.broadcast import relay_tree, relay, transfer_command
+from dgrid.scheduling.utils.cgroups import read_limits, read_remote_limits, limits_command
+from dgrid.scheduling.utils.cleanup_queue import enqueue, enqueue_command, drain_command, start_drain
+from dgrid.scheduling.utils.docker_netorking import add_networking, hostfile_name
+from dgrid.scheduling.utils.executor_base import ExecutorBase
 from dgrid.scheduling.utils.fileparser import get_hosts
+from dgrid.scheduling.utils.inventory import inventory_command, invalidate_command, parse_inventory, split_present, \
+    normalise
+from dgrid.scheduling.utils.launch_script import build_launch_script
+from dgrid.scheduling.utils.numa import read_topology, read_remote_topology, parse_cpu_list, format_cpu_list, \
+    partition, split_memory
+from dgrid.scheduling.utils.output import clock
+from dgrid.scheduling.utils.placement import host_slots, place, placement_map
+from dgrid.scheduling.utils.ssh_pool import SSHConnectionPool
+from dgrid.scheduling.utils.staging import host_images, pull_command
+from dgrid.scheduling.utils.teardown import teardown_command
 
 from dgrid.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
-class SSHExecutor:
+class SSHExecutor(ExecutorBase):
     """
     SSHExecutor class used by Torque scheduler class to run a job.
     Contains all the logic for execution, termination, and image cleanup
     """
 
-    def __init__(self, containers, hosts):
+    def __init__(self, containers, hosts, work_dir=None):
         """
         :param containers: List of container objects
         :param hosts: list of hosts
+        :param work_dir: Directory the host list is written to, PBS_O_WORKDIR if None
         """
         self.hosts = hosts
 
@@ -63,40 +78,39 @@ class SSHExecutor:
 
         self.user = os.popen("id -u $USER").read().replace("\n", "")
         self.job_id = os.environ.get('PBS_JOBID')
-        self.work_dir = os.environ.get("PBS_O_WORKDIR")
-
-        cgroups_dir = settings.cgroup_dir
-
-        self.cpu_shares = ['cat', cgroups_dir + '/cpu/torque/'
-                           + self.job_id + '/cpu.shares']
-
-        self.cpus = ['cat', cgroups_dir + '/cpuset/torque/'
-                     + self.job_id + '/cpuset.cpus']
-
-        self.memory = ['cat', cgroups_dir + '/memory/torque/'
-                       + self.job_id + '/memory.limit_in_bytes']
-
-        self.memory_swappiness = ['cat', cgroups_dir + '/memory/torque/'
-                                  + self.job_id + '/memory.swappiness']
-
-        self.memory_swap_limit = ['cat', cgroups_dir + '/memory/torque/'
-                                  + self.job_id + '/memory.memsw.limit_in_bytes']
-
-        self.kernel_memory_limit = ['cat', cgroups_dir + '/memory/torque/'
-                                    + self.job_id + '/memory.kmem.limit_in_bytes']
+        self.work_dir = work_dir or os.environ.get("PBS_O_WORKDIR")
+        # Sub-jobs of a job array leave the network, connections, staging and image cleanup to the array
+        self.in_array = False
+
+        # Job's cgroup limits on each host, read once per host
+        self.job_path = settings.cgroup_job_path.format(job_id=self.job_id)
+        self.host_limits = dict()
+        # Containers placed on each remote host, and each host's split of the job's cpus between its containers
+        self.placement = dict()
+        self.host_topology = dict()
+        self.host_partitions = dict()
+        # Share of each host's slots held by this sub-job's lane of a job array, as (first, count, total) tuples
+        self.slot_shares = dict()
+        # Hosts every needed image was pulled on before launch
+        self.staged_hosts = set()
+        # Images already on each host, and how often they saved a pull
+        self.host_inventory = dict()
+        self.inventory_stats = {'hits': 0, 'misses': 0, 'cached': 0}
+        self.inventory_lock = threading.Lock()
 
         context = os.path.realpath(__file__)
         path = re.sub('dgrid/scheduling/schedulers/Torque6/SSHExecutor\.py.*', "", context)
         self.script_dir = path + "/dgrid-scripts/"
         logger.debug("script directory is: " + self.script_dir)
 
-        # Strip out current host from list
-        try:
-            logger.debug(self.hosts)
-            self.hosts.remove(self.hostname)
-            logger.debug(self.hosts)
-        except ValueError:
+        # Count the slots allocated on each host, current host must be one of them
+        logger.debug(self.hosts)
+        self.slots = host_slots(self.hosts)
+        if self.hostname not in self.slots:
             raise HostValueError('Hostname of execution host not in assigned hosts list')
+        # The interactive container takes one of the current host's slots
+        self.slots[self.hostname] -= 1
+        logger.debug(self.slots)
 
         # The method add_networking will randomise container names.
         # If networking has been defined by the user,env variables, volumes mapping required will be added to container
@@ -114,8 +128,14 @@ class SSHExecutor:
 
         self.local_run = False
         self.local_pid = None
-        # Get Fabric to throw an RemoteExecutionError when remote commands fail, instead of aborting
-        env.abort_exception = RemoteExecutionError
+        # Hosts teardown of the remote containers has finished on
+        self.torn_down = set()
+        inventory_path = settings.image_inventory_path
+        self.inventory_path = inventory_path.format(user=self.user)
+        # One connection per assigned host, reused by every phase of the job
+        self.pool = SSHConnectionPool(shell=settings.ssh_shell)
+        # Client for this host's docker daemon, None to run the docker CLI instead
+        self.engine = local_engine()
 
     def run(self):
         """
@@ -123,10 +143,8 @@ class SSHExecutor:
         After all hosts have been assigned a container, spin up interactive container locally
         :return: NULL
         """
-        if self.create_net:
-            logger.debug("creating docker container network for job")
+        if self.create_net and not self.network_name:
             self.network_name = ''.join([random.choice(string.ascii_letters + string.digits) for n in range(10)])
-            self.docker_network(create=True, remove=False)
 
         self.assign_execute()
         self.job_execution()
@@ -135,34 +153,351 @@ class SSHExecutor:
     def assign_execute(self):
         """
         Assigns nodes to containers set to be run on remote machines.
+        With settings.prestage_images each host's images are pulled before launch, while the job's network is created.
         In the case of checkpoint restoration,
         previous execution host is overwritten with new ones assigned to the job
         :return:
         """
         logger.info('-- Running remote containers --')
-        for x in range(len(self.containers)):
+        try:
+            assignments = place(self.containers, self.slots, settings.placement_strategy)
+        except PlacementError as pex:
+            logger.critical("Placement of containers failed: " + pex.message)
+            self.abort("Terminating")
+
+        logger.info('-- Container placement --')
+        self.placement = placement_map(assignments)
+        for host, containers in self.placement.items():
+            logger.info("%s: %d of %d slots, %s" % (host, len(containers), self.slots[host],
+                                                    " ".join(container.name for container in containers)))
+
+        for host, container in assignments:
+            container.network = self.network_name if self.create_net else None
+            logger.debug("Setting user to " + str(self.user))
+            container.user = str(self.user)
+
+        # Images are pulled on every host while the job's network is created
+        staging = None
+        if settings.prestage_images and not self.in_array:
+            staging = self.start_staging(assignments + [(self.hostname, self.int_container)])
+
+        if self.create_net and not self.in_array:
+            logger.debug("creating docker container network for job")
+            self.docker_network(create=True, remove=False)
+
+        if staging is not None:
+            self.finish_staging(*staging)
+
+        if settings.parallel_launch:
+            self.launch_parallel(assignments)
+        else:
+            self.launch_serial(assignments)
+
+    def start_staging(self, assignments):
+        """
+        Starts staging the distinct images needed on each host, in the background.
+        Each host pulls its images from the registry, or with settings.image_distribution set to broadcast,
+        the head node pulls them once and relays them to the other hosts
+        :param assignments: List of (host, container) tuples, including the interactive container
+        :return: Worker pool, and the pending result of the staging
+        """
+        images = host_images(assignments)
+        distribution = settings.image_distribution
+        logger.info('-- Pre-staging images on %d hosts, by %s --' % (len(images), distribution))
+        stage = self.broadcast_images if distribution == 'broadcast' else self.pull_images
+        worker = ThreadPool(1)
+        return worker, worker.apply_async(stage, (images,))
+
+    def finish_staging(self, workers, pending):
+        """
+        Waits for the staging started by start_staging, logging how long each host took.
+        A failed pull is only logged, docker run pulls the image again at launch
+        :param workers: Worker pool running the staging
+        :param pending: Pending result of the staging
+        :return: Null
+        """
+        try:
+            self.wait_for(pending)
+            results = pending.get()
+        finally:
+            workers.close()
+            workers.join()
+
+        for host, images, elapsed, error in results:
+            if error is None:
+                logger.info("Staged %d images on %s in %.1fs" % (len(images), host, elapsed))
+                self.staged_hosts.add(host)
+            else:
+                logger.error("Staging images on %s failed after %.1fs: %s" % (host, elapsed, error))
+
+    def pull_images(self, images):
+        """
+        Pulls each host's images from the registry, on all hosts at the same time,
+        using a pool of at most settings.launch_pool_size hosts
+        :param images: OrderedDict of host to list of images needed on it
+        :return: List of (host, images, seconds taken, error message or None) tuples
+        """
+        workers = ThreadPool(max(1, min(settings.launch_pool_size, len(images))))
+        try:
+            return workers.map(lambda host: self.stage_host(host, images[host]), list(images.keys()))
+        finally:
+            workers.close()
+            workers.join()
+
+    def broadcast_images(self, images):
+        """
+        Pulls every image once on this host, then relays each image to the hosts needing it over a tree with
+        settings.broadcast_fanout children per host, streamed with docker save and docker load.
+        Hosts the relay fails to reach pull their images from the registry instead
+        :param images: OrderedDict of host to list of images needed on it
+        :return: List of (host, images, seconds taken, error message or None) tuples
+        """
+        start = clock()
+        # Only images missing from a host are relayed to it
+        remote = [host for host in images.keys() if host != self.hostname]
+        workers = ThreadPool(max(1, min(settings.launch_pool_size, len(remote))))
+        try:
+            needed = dict(workers.map(lambda host: (host, self.missing_images(host, images[host])), remote))
+        finally:
+            workers.close()
+            workers.join()
+
+        everything = list(images.get(self.hostname, []))
+        for host in remote:
+            everything.extend(image for image in needed[host] if image not in everything)
+
+        head = self.stage_host(self.hostname, everything)
+        if head[3] is not None:
+            logger.warning("Pulling images on %s failed, pulling on every host instead" % self.hostname)
+            return self.pull_images(images)
+
+        fanout = settings.broadcast_fanout
+        ssh = settings.ssh_binary
+        received = dict((host, (0.0, None)) for host in images.keys())
+        for image in everything:
+            # Images are relayed one after another, times are from the start of staging
+            offset = clock() - start
+            hosts = [host for host in remote if image in needed[host]]
+            if not hosts:
+                continue
+            tree = relay_tree(self.hostname, hosts, fanout)
+            logger.debug("Relaying %s to %d hosts, %d per host" % (image, len(tree) - 1, fanout))
+            command = lambda child: transfer_command(image, child, ssh, invalidate_command(self.inventory_path))
+            results = relay(tree, lambda parent, child: self.run_on_host(parent, command(child)),
+                            settings.launch_pool_size)
+            for host, (elapsed, error, present) in results.items():
+                logger.debug("%s on %s: %s" % (image, host, 'present' if present else error or 'received'))
+                received[host] = (offset + elapsed, received[host][1] or error)
+                if error is None:
+                    self.add_images(host, [image])
+
+        staged = []
+        missed = OrderedDict()
+        for host in images.keys():
+            if host == self.hostname:
+                staged.append((host, images[host], head[2], None))
+            elif received[host][1] is None:
+                staged.append((host, images[host], received[host][0], None))
+            else:
+                logger.warning("Relaying images to %s failed, pulling from the registry: %s"
+                               % (host, received[host][1]))
+                missed[host] = images[host]
+        if missed:
+            staged.extend(self.pull_images(missed))
+        return staged
+
+    def stage_host(self, host, images):
+        """
+        Runs in a worker thread for each host during pre-staging, pulling the host's images in one command
+        :param host: Host to pull images on
+        :param images: List of images needed on the host
+        :return: Tuple of host, images, seconds taken, and the error message if the pull failed
+        """
+        start = clock()
+        try:
+            needed = self.missing_images(host, images)
+            if needed:
+                self.run_on_host(host, self.stage_command(needed))
+                self.add_images(host, needed)
+        except Exception as ex:
+            # Connection failures surface as paramiko/socket errors, not only RemoteExecutionError
+            return host, images, clock() - start, type(ex).__name__ + " " + str(ex)
+        return host, images, clock() - start, None
+
+    def stage_command(self, images):
+        """
+        Builds the command pulling images on a host, which also invalidates the host's cached image inventory,
+        as it no longer lists all of the host's images
+        :param images: List of images to pull
+        :return: Command string, exiting with the pull's exit code
+        """
+        return '%s; status=$?; %s; exit $status' % (pull_command(images), invalidate_command(self.inventory_path))
+
+    def get_inventory(self, host):
+        """
+        Returns the images on a host, read on first use and cached for the rest of the job.
+        The host keeps the list in settings.image_inventory_path for settings.image_inventory_ttl seconds,
+        so later jobs on the host don't need to ask docker again.
+        :param host: Host to get the images of
+        :return: Dictionary of image reference to image id, or None with settings.image_inventory disabled
+        """
+        if not settings.image_inventory:
+            return None
+
+        if host not in self.host_inventory:
+            command = inventory_command(self.inventory_path, settings.image_inventory_ttl)
             try:
-                host = self.hosts[x] if isinstance(self.hosts, list) else self.hosts
-            except IndexError:
-                logger.critical("Not enough hosts assigned to job. One host per container is required")
-                self.terminate_clean()
-                self.remove_images()
-                sys.exit("Terminating")
+                inventory, cached = parse_inventory(self.run_on_host(host, command))
+            except Exception as ex:
+                # Nothing is known to be present, so every image is pulled as before
+                logger.warning("Reading the image inventory of %s failed: %s" % (host, str(ex)))
+                inventory, cached = dict(), False
+            self.record_inventory(host, inventory, cached)
+        return self.host_inventory[host]
+
+    def record_inventory(self, host, inventory, cached):
+        """
+        Caches the images read on a host, unless another thread read them first
+        :param host: Host the images are on
+        :param inventory: Dictionary of image reference to image id
+        :param cached: Whether the host's cached image list was read, instead of asking docker
+        :return: Null
+        """
+        with self.inventory_lock:
+            self.host_inventory.setdefault(host, inventory)
+            self.inventory_stats['cached'] += 1 if cached else 0
+        logger.debug("%d images on %s%s" % (len(inventory), host, ", from cache" if cached else ""))
 
-            container = self.containers[x]
-            container.network = self.network_name if self.create_net else None
+    def missing_images(self, host, images):
+        """
+        Finds the images a host still needs, counting the images found as inventory hits, and the rest as misses
+        :param host: Host the images are needed on
+        :param images: List of images
+        :return: List of images missing from the host, all of them with settings.image_inventory disabled
+        """
+        inventory = self.get_inventory(host)
+        if inventory is None:
+            return list(images)
+
+        with self.inventory_lock:
+            present, needed = split_present(images, inventory)
+            self.inventory_stats['hits'] += len(present)
+            self.inventory_stats['misses'] += len(needed)
+        return needed
+
+    def add_images(self, host, images):
+        """
+        Records images as present on a host, once they have been pulled or relayed there
+        :param host: Host the images are on
+        :param images: List of images
+        :return: Null
+        """
+        with self.inventory_lock:
+            inventory = self.host_inventory.get(host)
+            if inventory is not None:
+                inventory.update((normalise(image), None) for image in images)
+
+    def run_on_host(self, host, command, warn_only=False):
+        """
+        Runs a shell command on a host, directly when it is this host, otherwise over the host's pooled connection
+        Raises RemoteExecutionError if the command fails
+        :param host: Host to run the command on
+        :param command: Command string to execute
+        :param warn_only: Log a warning instead of raising when the command fails
+        :return: Output of the command
+        """
+        if host != self.hostname:
+            return self.pool.run(host, command, warn_only=warn_only)
+
+        proc = Popen(['sh', '-c', command], stdout=PIPE, stderr=STDOUT)
+        output = proc.communicate()[0].decode('utf-8', 'replace').rstrip('\r\n')
+        if proc.returncode != 0:
+            message = "%s failed on %s with exit code %d: %s" % (command, host, proc.returncode, output)
+            if not warn_only:
+                raise RemoteExecutionError(message)
+            logger.warning(message)
+        return output
+
+    def launch_serial(self, assignments):
+        """
+        Launches the assigned containers one at a time, stopping at the first failure
+        :param assignments: List of (host, container) tuples
+        :return: Null
+        """
+        for host, container in assignments:
             try:
                 container.execution_host = host
-                logger.debug("Setting user to " + str(self.user))
-                container.user = str(self.user)
-                execute(self.run_container, container, host=host)
+                self.launch_containers(host, [container])
             except RemoteExecutionError as rex:
                 logger.critical("Remote execution of containers failed: " + rex.message)
-                self.terminate_clean()
-                self.remove_images()
-                sys.exit("Terminating")
-            finally:
-                disconnect_all()
+                self.abort("Terminating")
+
+    def launch_parallel(self, assignments):
+        """
+        Launches the assigned containers on all hosts at the same time, using a pool of at most
+        settings.launch_pool_size hosts. Once a launch fails no further containers are started,
+        and the containers already started are torn down
+        :param assignments: List of (host, container) tuples
+        :return: Null
+        """
+        for host, container in assignments:
+            container.execution_host = host
+        host_containers = placement_map(assignments)
+
+        if not host_containers:
+            return
+
+        # Set by the first launch to fail
+        abort_launch = threading.Event()
+        pool_size = min(settings.launch_pool_size, len(host_containers))
+        workers = ThreadPool(pool_size)
+        try:
+            results = workers.map(lambda host: self.launch_host(host, host_containers[host], abort_launch),
+                                  list(host_containers.keys()))
+        finally:
+            workers.close()
+            workers.join()
+
+        launched = set()
+        failed = False
+        for host, result in zip(host_containers.keys(), results):
+            launched.update(result['launched'])
+            if result['error'] is not None:
+                logger.critical("Remote execution of containers failed on " + host + ": " + result['error'])
+                failed = True
+
+        # Only containers a launch was attempted for need to be torn down
+        for host, container in assignments:
+            if container.name not in launched:
+                container.execution_host = None
+
+        if failed:
+            self.abort("Terminating")
+
+    def launch_host(self, host, containers, abort_launch):
+        """
+        Runs in a worker thread for each host during a parallel launch.
+        Runs the host's containers in order, unless another host has already failed
+        :param host: Host to launch containers on
+        :param containers: List of containers to run on the host
+        :param abort_launch: threading Event set once any launch fails
+        :return: Dictionary with the names of the containers launched, and the error message if one failed
+        """
+        launched = []
+        # A batched launch starts all of the host's containers in one remote command
+        batches = [containers] if settings.batched_launch else [[c] for c in containers]
+        for batch in batches:
+            if abort_launch.is_set():
+                break
+            # Recorded before running, a failure part way through can still leave the containers running
+            launched.extend(container.name for container in batch)
+            try:
+                self.launch_containers(host, batch)
+            except Exception as ex:
+                # Connection failures surface as paramiko/socket errors, not only RemoteExecutionError
+                abort_launch.set()
+                return {'launched': launched, 'error': type(ex).__name__ + " " + str(ex)}
+        return {'launched': launched, 'error': None}
 
     def job_execution(self):
         """
@@ -180,73 +515,243 @@ class SSHExecutor:
             '''
             exc = type(ex).__name__
             logger.critical("Interactive container execution error: " + exc + " " + ex.message)
-            self.terminate_clean()
-            self.remove_images()
-            sys.exit("Terminating")
-        finally:
-            disconnect_all()
+            self.abort("Terminating")
 
     def job_termination(self):
         """
         Runs the termination steps of execution.
         Terminates docker containers and removes the container and any volumes used
-        Runs the configured image cleanup scripts
+        Runs the configured image cleanup scripts, or queues them with settings.deferred_cleanup
         :return:
         """
         try:
             self.terminate_clean()
-            self.remove_images()
+            if not self.in_array:
+                self.remove_images()
         except RemoteExecutionError as rex:
             logger.error("Termination of containers failed / Image removal failed. " + rex.message)
             sys.exit("Aborting")
         finally:
-            disconnect_all()
+            if not self.in_array:
+                self.report_inventory()
+                self.close_connections()
         sys.exit(0)
 
-    def docker_network(self, create=False, remove=False):
+    def abort(self, message):
         """
-        Creates or removes a docker network
-        :param create: boolean parameter, defines whether docker network should be created
-        :param remove: boolean parameter, defines whether docker network should be destroyed
-        :return:
+        Tears the job down after a failure, and exits
+        :param message: Exit message
+        :return: Null
         """
-        command = []
-        if create:
-            command = ['docker', 'network', 'create', '--driver=overlay', self.network_name]
-        if remove:
-            command = ['docker', 'network', 'rm', self.network_name]
+        self.terminate_clean()
+        if not self.in_array:
+            self.remove_images()
+        sys.exit(message)
+
+    def share(self, lead):
+        """
+        Makes this sub-job of a job array use the connections, and what is known about the hosts, of the array's
+        first sub-job. The job's cgroup limits are the same for every sub-job
+        :param lead: Executor of the array's first sub-job
+        :return: Null
+        """
+        if self.pool is not lead.pool:
+            self.pool.close_all()
+        self.pool = lead.pool
+        self.engine = lead.engine
+        self.host_limits = lead.host_limits
+        self.host_topology = lead.host_topology
+        self.staged_hosts = lead.staged_hosts
+        self.host_inventory = lead.host_inventory
+        self.inventory_stats = lead.inventory_stats
+        self.inventory_lock = lead.inventory_lock
+        self.network_name = lead.network_name
+        self.in_array = True
+
+    def launch_containers(self, host, containers):
+        """
+        Runs a list of containers on a remote host, in a single launch script when settings.batched_launch is set
+        :param host: Host to run the containers on
+        :param containers: List of containers to run
+        :return: Null
+        """
+        if settings.batched_launch:
+            self.run_containers_batched(host, containers)
+        else:
+            for container in containers:
+                self.run_container(container, host)
+
+    def get_limits(self, host):
+        """
+        Returns the job's cgroup limits on a host, read on first use and cached for the rest of the job.
+        The limits on this host are read in process, remote hosts' limits in a single remote command
+        :param host: Host to get limits for
+        :return: CgroupLimits
+        """
+        if host not in self.host_limits:
+            if host == self.hostname:
+                limits = read_limits(settings.cgroup_dir, self.job_path)
+            else:
+                limits = read_remote_limits(lambda command: self.pool.run(host, command),
+                                            settings.cgroup_dir, self.job_path)
+            logger.debug("cgroup v%d limits on %s: cpu shares %s, cpus %s, memory %s"
+                         % (limits.version, host, limits.cpu_shares, limits.cpu_set, limits.memory))
+            self.host_limits[host] = limits
+        return self.host_limits[host]
+
+    def shared_host(self, host):
+        """
+        Whether a host's slots are split between the lanes of a job array, each lane getting part of its cpus
+        :param host: Host to check
+        :return: boolean
+        """
+        share = self.slot_shares.get(host)
+        return share is not None and share[1] < share[2]
+
+    def partitioned(self, host, containers):
+        """
+        Whether a host's cpus are split between its containers, which needs the host's limits before launch
+        :param host: Host the containers are placed on
+        :param containers: List of containers placed on the host
+        :return: boolean
+        """
+        return settings.numa_partitioning and (len(containers) > 1 or self.shared_host(host))
+
+    def launch_limits(self, host, containers):
+        """
+        Returns the commands reading the job's cgroup limits inside a host's launch script, so no round trip
+        is spent reading them beforehand. Not used when the limits are already known, or are needed to split
+        the host's cpus between its containers
+        :param host: Host the containers are launched on
+        :param containers: List of containers launched on the host
+        :return: Command string, or None when the containers are constrained before launch
+        """
+        if host == self.hostname or host in self.host_limits or self.partitioned(host, containers):
+            return None
+        return limits_command(settings.cgroup_dir, self.job_path, settings.enforce_memory_limits)
+
+    def get_partition(self, host):
+        """
+        Returns the split of the job's cpus between the containers on a host, worked out on first use
+        :param host: Host to get the split for
+        :return: Dictionary of container name to (cpuset cpus, cpuset mems, memory limit) tuple
+        """
+        if host not in self.host_partitions:
+            containers = list(self.placement.get(host, []))
+            if host == self.hostname:
+                containers.insert(0, self.int_container)
+            self.host_partitions[host] = self.partition_host(host, containers)
+        return self.host_partitions[host]
+
+    def get_topology(self, host):
+        """
+        Returns the NUMA topology of a host, read on first use and cached for the rest of the job
+        :param host: Host to get the topology of
+        :return: OrderedDict of NUMA node number to its cpus
+        """
+        if host not in self.host_topology:
+            if host == self.hostname:
+                self.host_topology[host] = read_topology()
+            else:
+                self.host_topology[host] = read_remote_topology(lambda command: self.pool.run(host, command))
+        return self.host_topology[host]
+
+    def partition_host(self, host, containers):
+        """
+        Splits the job's cpuset on a host into disjoint slices that stay inside NUMA nodes, one per container.
+        The job's memory limit is split in proportion to each container's cpus. On a host shared by the lanes
+        of a job array, the cpuset is first split by slot and only this lane's slots are split between its containers
+        :param host: Host the containers are placed on
+        :param containers: List of containers placed on the host
+        :return: Dictionary of container name to (cpuset cpus, cpuset mems, memory limit) tuple
+        """
+        limits = self.get_limits(host)
+        if (len(containers) < 2 and not self.shared_host(host)) or limits.cpu_set is None:
+            return dict()
+
+        cpus = parse_cpu_list(limits.cpu_set)
+        memory_limit = int(limits.memory.rstrip('b')) if limits.memory is not None else None
+        if self.shared_host(host):
+            first, count, total = self.slot_shares[host]
+            slots = partition(cpus, self.get_topology(host), total)
+            if slots is None:
+                logger.warning("Fewer cpus than slots on %s, sub-jobs will share the job's cpuset" % host)
+                return dict()
+            cpus = sorted(cpu for slot_cpus, nodes in slots[first:first + count] for cpu in slot_cpus)
+            if memory_limit is not None:
+                memory_limit = sum(split_memory(memory_limit, slots)[first:first + count])
+
+        slices = partition(cpus, self.get_topology(host), len(containers))
+        if slices is None:
+            logger.warning("Fewer cpus than containers on %s, containers will share the job's cpuset" % host)
+            return dict()
+
+        memory = [None] * len(slices)
+        if memory_limit is not None:
+            memory = [str(limit) + 'b' for limit in split_memory(memory_limit, slices)]
+
+        shares = dict()
+        for container, (cpus, nodes), container_memory in zip(containers, slices, memory):
+            mems = format_cpu_list(nodes) if nodes is not None else None
+            shares[container.name] = (format_cpu_list(cpus), mems, container_memory)
+            logger.debug("%s on %s: cpus %s, memory nodes %s" % (container.name, host, shares[container.name][0], mems))
+        return shares
+
+    def constrain(self, host, container, cgroup_limits=True):
+        """
+        Assigns the constraints placed on the job by Torque on a host to one of the host's containers.
+        With settings.numa_partitioning co-located containers get their own slice of the job's cpus and memory
+        :param host: Host the container runs on
+        :param container: Container to constrain
+        :param cgroup_limits: Whether the job's cgroup limits are assigned, False when the launch script reads them
+        :return: Null
+        """
+        if cgroup_limits:
+            self.get_limits(host).apply(container, settings.enforce_memory_limits)
+
+        if settings.numa_partitioning:
+            share = self.get_partition(host).get(container.name)
+            if share is not None:
+                container.cpu_set, container.cpu_mems, memory = share
+                if settings.enforce_memory_limits and memory is not None:
+                    container.memory = memory
 
-        proc = Popen(command, stdout=PIPE, stderr=PIPE)
-        self.print_output(proc)
+    def run_containers_batched(self, host, containers):
+        """
+        Runs containers on a remote machine in a single round trip.
+        One script reads the constraints placed on the job by Torque, unless they are already known,
+        then runs each container with them and registers its process with pbs_track
+        :param host: Host to run the containers on
+        :param containers: List of containers to run
+        :return: Null
+        """
+        limits = self.launch_limits(host, containers)
+        for container in containers:
+            self.constrain(host, container, limits is None)
 
-    def run_container(self, container):
+        script = build_launch_script(containers, settings.pbs_track, self.job_id, limits)
+        output = self.run_on_host(host, script, warn_only=True)
+        self.check_launch(host, containers, output)
+
+    def run_container(self, container, host=None):
         """
-        Runs containers on remote machines
+        Runs containers on remote machines, or in process on this host
         Gets the constraints placed on the container by Torque and assigns them to the container
         Runs the container after, constraints have been assigned
         :param container: Container to be run
+        :param host: Host to run the container on, defaults to Fabric's current host when run as a Fabric task
         :return: Null
         """
-        cpushares = run(' '.join(self.cpu_shares))
-        cpus = run(' '.join(self.cpus))
-        container.cpu_shares = cpushares
-        container.cpu_set = cpus
-
-        if settings.enforce_memory_limits:
-            memory = run(' '.join(self.memory))
-            memory_swappiness = run(' '.join(self.memory_swappiness))
-            memory_swap_limit = run(' '.join(self.memory_swap_limit))
-            kernel_memory = run(' '.join(self.kernel_memory_limit))
+        if host is None:
+            from fabric.api import env
+            host = env.host_string
 
-            container.memory = memory + "b"
-            container.memory_swappiness = memory_swappiness
-            container.memory_swap = memory_swap_limit + "b"
-            container.kernel_memory = kernel_memory + "b"
+        self.constrain(host, container)
 
-        run(" ".join(container.run()))
+        self.run_on_host(host, " ".join(container.run()))
         # Call pbs_track to monitor processes
-        container_id = run("docker inspect --format '{{ .State.Pid }}' %s" % container.name)
-        run("%s -j %s -a '%s'" % (settings.pbs_track, self.job_id, container_id))
+        container_id = self.run_on_host(host, "docker inspect --format '{{ .State.Pid }}' %s" % container.name)
+        self.run_on_host(host, "%s -j %s -a '%s'" % (settings.pbs_track, self.job_id, container_id))
 
     def run_int_container(self):
         """
@@ -257,10 +762,11 @@ class SSHExecutor:
         # Setup CGroup constraints set by torque
         self.setup_constraints()
 
-        # Pull the image first
+        # Pull the image first, unless it was pre-staged or is already here
         # Image pulling during docker run sends to stdout
-        result = Popen(["docker", "pull", self.int_container.image], stdout=PIPE, stderr=PIPE)
-        self.print_output(result)
+        if self.hostname not in self.staged_hosts and self.missing_images(self.hostname, [self.int_container.image]):
+            self.local_docker(["docker", "pull", self.int_container.image],
+                              lambda: self.engine.pull(self.int_container.image))
 
         # Add created docker network to container
         if self.create_net:
@@ -271,13 +777,22 @@ class SSHExecutor:
 
         # Run the interactive container
         logger.debug(" ".join(self.int_container.run()))
-        proc = Popen(self.int_container.run(), stdout=PIPE, stderr=PIPE)
-        self.local_run = True
-        self.local_pid = proc.pid
-        logger.debug("Local process id: " + str(self.local_pid))
-        self.track_int_container()
-        logger.info("-- Interactive Container Output --")
-        self.print_output(proc)
+        if self.engine is not None:
+            # Created and started by the daemon, its output is read from the daemon as it is written
+            container_id = self.engine_run(self.int_container)
+            self.local_run = True
+            logger.debug("Local container id: " + container_id)
+            self.track_int_container()
+            logger.info("-- Interactive Container Output --")
+            self.engine.follow(self.int_container.name, self.log_output)
+        else:
+            proc = Popen(self.int_container.run(), stdout=PIPE, stderr=PIPE)
+            self.local_run = True
+            self.local_pid = proc.pid
+            logger.debug("Local process id: " + str(self.local_pid))
+            self.track_int_container()
+            logger.info("-- Interactive Container Output --")
+            self.print_output(proc)
 
         self.local_run = False
 
@@ -287,23 +802,8 @@ class SSHExecutor:
         Assigns the values to the interactive container
         :return: Null
         """
-        cpushares = Popen(self.cpu_shares, stdout=PIPE)
-        cpus = Popen(self.cpus, stdout=PIPE)
-        self.int_container.cpu_shares = cpushares.stdout.read().replace("\n", "")
-        self.int_container.cpu_set = cpus.stdout.read().replace("\n", "")
-
-        if settings.enforce_memory_limits:
-            memory = Popen(self.memory, stdout=PIPE)
-            memory_swappiness = Popen(self.memory_swappiness, stdout=PIPE)
-            memory_swap_limit = Popen(self.memory_swap_limit, stdout=PIPE)
-            kernel_memory = Popen(self.kernel_memory_limit, stdout=PIPE)
+        self.constrain(self.hostname, self.int_container)
 
-            self.int_container.memory = memory.stdout.read().replace("\n", "") + "b"
-            self.int_container.memory_swappiness = memory_swappiness.stdout.read().replace("\n", "")
-            self.int_container.memory_swap = memory_swap_limit.stdout.read().replace("\n", "") + "b"
-            self.int_container.kernel_memory = kernel_memory.stdout.read().replace("\n", "") + "b"
-
-    @retry((CalledProcessError, OSError, ProcessIdRetrievalFailure), tries=3, delay=2)
     def track_int_container(self):
         """
         Calls pbs_track to monitor interactive container process
@@ -312,9 +812,22 @@ class SSHExecutor:
         Delay between retries = 2 seconds
         :return:
         """
+        # retry is only needed once the interactive container runs
+        from retry.api import retry_call
+        retry_call(self.pbs_track_int_container, exceptions=(CalledProcessError, OSError, ProcessIdRetrievalFailure),
+                   tries=3, delay=2)
+
+    def pbs_track_int_container(self):
+        """
+        Calls pbs_track once to monitor interactive container process
+        :return:
+        """
 
-        pid = os.popen("docker inspect --format '{{ .State.Pid }}' %s" % self.int_container.name)\
-            .read().replace("\n", "")
+        if self.engine is not None:
+            pid = str(self.engine.container_pid(self.int_container.name) or '')
+        else:
+            pid = os.popen("docker inspect --format '{{ .State.Pid }}' %s" % self.int_container.name)\
+                .read().replace("\n", "")
 
         # Raise error if PID retrieval failed
         if pid == '':
@@ -332,107 +845,232 @@ class SSHExecutor:
 
     def terminate_clean(self):
         """
-        Iterates through all remote containers and runs 'docker stop <container>' on each remote.
+        Stops and removes the remote containers with one command per host, on all hosts at the same time,
+        while the local interactive container is stopped and removed.
+        Containers get settings.stop_timeout seconds to stop, and the hosts still tearing down after
+        settings.teardown_deadline seconds are left behind, so the job finishes before Torque kills it
         :return: Null
         """
+        stop_timeout = settings.stop_timeout
+        host_containers = placement_map([(container.execution_host, container) for container in self.containers
+                                         if container.execution_host is not None])
+
+        logger.info("-- Stopping and removing remote containers --")
+        workers, pending = self.start_teardown(host_containers, stop_timeout)
+        deadline = clock() + settings.teardown_deadline
+
         # Check if local interactive container is still running
         if self.local_run is True:
             logger.info("-- Terminating local interactive container --")
-            terminate = Popen(self.int_container.terminate(), stdout=PIPE, stderr=PIPE)
-            self.print_output(terminate)
+            self.local_docker(self.int_container.terminate(stop_timeout),
+                              lambda: self.engine.stop_container(self.int_container.name, stop_timeout))
 
         # Remove the interactive container
         logger.info("-- Removing local interactive container --")
-        container_cleanup = Popen(self.int_container.cleanup(), stdout=PIPE, stderr=PIPE)
-        self.print_output(container_cleanup)
-
-        logger.info("-- Stopping and removing remote containers --")
-        for container in self.containers:
-            if container.execution_host is not None:
-                logger.debug('Removing container: ' + container.name + " On " + container.execution_host)
-                command = ' '.join(container.terminate()) + " && " + ' '.join(container.cleanup())
-                execute(self.execute_remote, command, host=container.execution_host)
-
-        # Remove docker network if one was created
+        self.local_docker(self.int_container.cleanup(), lambda: self.engine.remove_container(self.int_container.name))
+
+        if self.wait_for(pending, deadline):
+            workers.join()
+            for host, elapsed, error in pending.get():
+                if error is None:
+                    logger.debug("Removed %d containers on %s in %.1fs" % (len(host_containers[host]), host, elapsed))
+                else:
+                    logger.error("Removing containers on %s failed after %.1fs: %s" % (host, elapsed, error))
+        else:
+            # The workers are daemon threads, they don't keep the job alive
+            logger.error("Teardown deadline passed, containers may be left running on: "
+                         + " ".join(host for host in host_containers.keys() if host not in self.torn_down))
+
+        # Remove docker network if one was created, a job array's network is removed by the array
         if self.create_net:
-            host_file_format = os.environ.get("DGRID_HOSTFILE_FORMAT")
-            logger.debug("Removing docker network " + self.network_name)
-            self.docker_network(create=False, remove=True)
-            if host_file_format == 'json':
-                os.remove(self.work_dir + "/hostfile.json")
-            if host_file_format == 'list':
-                os.remove(self.work_dir + "/hostfile")
+            hostfile = hostfile_name(os.environ.get("DGRID_HOSTFILE_FORMAT"))
+            if not self.in_array:
+                logger.debug("Removing docker network " + self.network_name)
+                self.docker_network(create=False, remove=True)
+            if hostfile is not None and os.path.isfile(self.work_dir + "/" + hostfile):
+                os.remove(self.work_dir + "/" + hostfile)
+
+    def start_teardown(self, host_containers, stop_timeout=None):
+        """
+        Starts stopping and removing each host's containers in the background, on all hosts at the same time,
+        using a pool of at most settings.launch_pool_size hosts
+        :param host_containers: OrderedDict of host to the containers placed on it
+        :param stop_timeout: Seconds the containers get to stop before they are killed
+        :return: Closed worker pool, and the pending list of (host, seconds taken, error message or None) tuples
+        """
+        workers = ThreadPool(max(1, min(settings.launch_pool_size, len(host_containers))))
+        pending = workers.map_async(lambda host: self.teardown_host(host, host_containers[host], stop_timeout),
+                                    list(host_containers.keys()))
+        workers.close()
+        return workers, pending
+
+    def teardown_host(self, host, containers, stop_timeout=None):
+        """
+        Runs in a worker thread for each host during teardown, stopping and removing the host's containers together
+        :param host: Host the containers run on
+        :param containers: List of containers on the host
+        :param stop_timeout: Seconds the containers get to stop before they are killed
+        :return: Tuple of host, seconds taken, and the error message if teardown failed
+        """
+        start = clock()
+        logger.debug("Removing containers on %s: %s" % (host, " ".join(container.name for container in containers)))
+        try:
+            for line in self.run_on_host(host, teardown_command(containers, stop_timeout)).splitlines():
+                logger.info(line)
+        except Exception as ex:
+            # Connection failures surface as paramiko/socket errors, not only RemoteExecutionError
+            return host, clock() - start, type(ex).__name__ + " " + str(ex)
+        finally:
+            self.torn_down.add(host)
+        return host, clock() - start, None
 
     def remove_images(self):
         """
         Removes images based on value set in settings file.
-        Runs scripts from scripts directory
+        Runs scripts from scripts directory, or the image garbage collector, taking each cleanup action once per host
+        with all of the host's images removed by one docker rmi, on all hosts at the same time.
+        With settings.deferred_cleanup the work is queued on each host instead, to run after the job
         :return:
         """
-        unref_command = ['sh', self.script_dir + settings.unreferenced_containers_script]
+        if settings.image_cleanup not in (1, 2, 3):
+            return
+
+        if settings.deferred_cleanup:
+            self.defer_cleanup()
+            return
+
+        logger.debug({1: "Removing all unused images", 2: "Removing images associated with job",
+                      3: "Removing least recently used images above the disk watermark"}[settings.image_cleanup])
+        host_commands, command = self.cleanup_commands()
+        workers, pending = self.start_cleanup(host_commands)
 
-        if settings.image_cleanup == 1:
-            logger.debug("Removing all unused images")
-            base_command = ['sh', self.script_dir + settings.unused_images_script]
-            commands = []
+        image_cleanup = Popen(['sh', '-c', command], stdout=PIPE, stderr=PIPE)
+        self.print_output(image_cleanup)
 
-            if settings.remove_unreferenced_containers:
-                commands.append(unref_command)
-                commands.append(base_command)
+        if os.path.exists(self.inventory_path):
+            os.remove(self.inventory_path)
+
+        self.wait_for(pending)
+        workers.join()
+        for host, elapsed, error in pending.get():
+            if error is None:
+                logger.debug("Cleaned up images on %s in %.1fs" % (host, elapsed))
             else:
-                commands.append(base_command)
-
-            for command in commands:
-                image_cleanup = Popen(command, stdout=PIPE, stderr=PIPE)
-                self.print_output(image_cleanup)
-
-            for container in self.containers:
-                if container.execution_host is not None and settings.remove_unreferenced_containers:
-                    execute(self.execute_remote, " ".join(unref_command), host=container.execution_host)
-                    execute(self.execute_remote, " ".join(base_command), host=container.execution_host)
-                if container.execution_host is not None and not settings.remove_unreferenced_containers:
-                    execute(self.execute_remote, " ".join(base_command), host=container.execution_host)
-
-        if settings.image_cleanup == 2:
-            logger.debug("Removing images associated with job")
-            for container in self.containers:
-                if container.execution_host is not None and settings.remove_unreferenced_containers:
-                    execute(self.execute_remote, ' '.join(unref_command), host=container.execution_host)
-                    execute(self.execute_remote, ' '.join(container.image_cleanup), host=container.execution_host)
-                if container.execution_host is not None and not settings.remove_unreferenced_containers:
-                    execute(self.execute_remote, ' '.join(container.image_cleanup), host=container.execution_host)
-
-            commands = []
-            if settings.remove_unreferenced_containers:
-                commands.append(unref_command)
-                commands.append(self.int_container.image_cleanup)
+                logger.error("Cleaning up images on %s failed after %.1fs: %s" % (host, elapsed, error))
+
+    def cleanup_commands(self):
+        """
+        Builds the image cleanup commands for settings.image_cleanup, each host's also invalidating its image inventory
+        :return: OrderedDict of remote host to its cleanup command string, this host's cleanup command string
+        """
+        host_commands, local_command = ExecutorBase.cleanup_commands(self)
+        # Removing images leaves the hosts' cached inventories out of date
+        return OrderedDict((host, command + '; ' + invalidate_command(self.inventory_path))
+                           for host, command in host_commands.items()), local_command
+
+    def defer_cleanup(self):
+        """
+        Queues the image cleanup on each host, in settings.cleanup_queue_dir, instead of running it during the job.
+        The queues are drained by a Torque epilogue, or with settings.cleanup_drain set to background,
+        by a worker started in its own session on each host
+        :return: Null
+        """
+        queue_dir = settings.cleanup_queue_dir.format(user=self.user)
+        background = settings.cleanup_drain == 'background'
+        logger.debug("Queueing image cleanup in " + queue_dir)
+
+        host_commands, local_command = self.cleanup_commands()
+        queue = dict()
+        for host, command in host_commands.items():
+            queue[host] = enqueue_command(queue_dir, self.job_id, [command])
+            if background:
+                queue[host] += '; ' + drain_command(sys.executable, queue_dir)
+        workers, pending = self.start_cleanup(queue)
+
+        enqueue(queue_dir, self.job_id, [local_command, invalidate_command(self.inventory_path)])
+        if background:
+            start_drain(sys.executable, queue_dir)
+
+        self.wait_for(pending)
+        workers.join()
+        for host, elapsed, error in pending.get():
+            if error is None:
+                logger.debug("Queued image cleanup on %s in %.1fs" % (host, elapsed))
             else:
-                commands.append(self.int_container.image_cleanup)
+                logger.error("Queueing image cleanup on %s failed after %.1fs: %s" % (host, elapsed, error))
 
-            for command in commands:
-                image_cleanup = Popen(command, stdout=PIPE, stderr=PIPE)
-                self.print_output(image_cleanup)
+    def start_cleanup(self, host_commands):
+        """
+        Starts running each host's cleanup command in the background, on all hosts at the same time,
+        using a pool of at most settings.launch_pool_size hosts
+        :param host_commands: Dictionary of host to its cleanup command string
+        :return: Closed worker pool, and the pending list of (host, seconds taken, error message or None) tuples
+        """
+        workers = ThreadPool(max(1, min(settings.launch_pool_size, len(host_commands))))
+        pending = workers.map_async(lambda host: self.cleanup_host(host, host_commands[host]),
+                                    list(host_commands.keys()))
+        workers.close()
+        return workers, pending
 
-    def print_output(self, process):
+    def cleanup_host(self, host, command):
         """
-        Prints the output from a subprocess Popen
-        :param process: An instance of Subprocess.Popen
-        :return:
+        Runs in a worker thread for each host during image cleanup
+        :param host: Host to clean up
+        :param command: Command taking the host's cleanup actions
+        :return: Tuple of host, seconds taken, and the error message if cleanup failed
         """
-        for line in iter(process.stdout.readline, ''):
-            logger.info(line)
-        for line in iter(process.stderr.readline, ''):
-            logger.error(line)
+        start = clock()
+        try:
+            self.execute_remote(host, command)
+        except Exception as ex:
+            # Connection failures surface as paramiko/socket errors, not only RemoteExecutionError
+            return host, clock() - start, type(ex).__name__ + " " + str(ex)
+        return host, clock() - start, None
 
-    def execute_remote(self, command):
+    def wait_for(self, pending, deadline=None):
         """
-        Task that executes a given command on remote host
+        Waits for the pending result of a worker pool, at most until the deadline.
+        Waits are timed, an untimed one can't be interrupted by the job's termination signal on Python 2
+        :param pending: Pending result of a worker pool
+        :param deadline: clock() time to stop waiting at, or None to wait until the result is ready
+        :return: Whether the result is ready
+        """
+        while not pending.ready() and (deadline is None or clock() < deadline):
+            pending.wait(0.5 if deadline is None else min(0.5, max(0, deadline - clock())))
+        return pending.ready()
+
+    def execute_remote(self, host, command):
+        """
+        Executes a given command on remote host, over the host's pooled connection, or in process on this host.
+        Failures are logged, not raised
+        :param host: Host to execute command on
         :param command: Command to execute
         :return: Null
         """
-        env.warn_only = True
-        run(command.decode('utf-8'))
-        env.warn_only = False
+        output = self.run_on_host(host, command.decode('utf-8'), warn_only=True)
+        for line in output.splitlines():
+            logger.info(line)
+
+    def report_inventory(self):
+        """
+        Logs how many image pulls the hosts' image inventories saved during the job
+        :return: Null
+        """
+        if settings.image_inventory:
+            logger.info("Image inventory: %d hits, %d misses, %d of %d hosts read from cache"
+                        % (self.inventory_stats['hits'], self.inventory_stats['misses'],
+                           self.inventory_stats['cached'], len(self.host_inventory)))
+
+    def close_connections(self):
+        """
+        Closes the pooled connections, logging how often they were reused during the job
+        :return: Null
+        """
+        stats = self.pool.stats()
+        logger.debug("SSH connections opened: %d, reused: %d" % (stats['opened'], stats['reused']))
+        self.pool.close_all()
+        if self.engine is not None:
+            self.engine.close()
 
     def checkpoint(self):
         pass
@@ -0,0 +1,229 @@
+"""
+Author: Robert Brennan
+Runs a Torque job's remote containers through the task manager with pbsdsh, instead of over SSH
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from dgrid.scheduling.schedulers.Torque6.AsyncSSHExecutor import AsyncSSHExecutor
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+from dgrid.scheduling.utils.fileparser import get_hosts
+from dgrid.scheduling.utils.inventory import inventory_command, parse_inventory
+from dgrid.scheduling.utils.output import clock
+from dgrid.scheduling.utils.teardown import teardown_command
+from dgrid.scheduling.utils.tm import TMPool
+
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TMExecutor(AsyncSSHExecutor):
+    """
+    TMExecutor class used by Torque scheduler class to run a job.
+    Remote commands run as tasks of the job, spawned by pbsdsh through Torque's task manager, so no SSH is needed.
+    Every host's containers are launched, its images pulled, and its containers torn down and images cleaned up
+    in a single pbsdsh fan-out each, and with settings.tm_cgroup_parent the containers are placed in the job's cgroup,
+    instead of their processes being registered with pbs_track.
+    Broadcast image distribution still relays images between hosts over ssh
+    """
+
+    # This host's tasks are spawned by its own MOM, so its containers are launched in the same fan-out
+    local_launch = False
+
+    def __init__(self, containers, hosts, work_dir=None):
+        """
+        :param containers: List of container objects
+        :param hosts: list of hosts
+        :param work_dir: Directory the host list is written to, PBS_O_WORKDIR if None
+        """
+        SSHExecutor.__init__(self, containers, hosts, work_dir)
+        # Tasks are numbered over all of the job's nodes, a job array's sub-jobs are given only some of them
+        vnodes = get_hosts(os.environ.get("PBS_NODEFILE")) or self.hosts
+        # Fan-out scripts are read by every node, from the job's directory which outlives a sub-job's
+        job_dir = os.environ.get("PBS_O_WORKDIR")
+        script_dir = os.path.join(job_dir, '.dgrid-tm-%s' % self.job_id) if job_dir else None
+        self.pool = TMPool(vnodes, settings.pbsdsh_binary, settings.pbsdsh_options, script_dir)
+        self.concurrency = None
+
+        cgroup_parent = settings.tm_cgroup_parent
+        self.cgroup_parent = cgroup_parent.format(job_path=self.job_path, job_id=self.job_id) \
+            if cgroup_parent else None
+        # Containers outside the job's cgroup are still tracked with pbs_track
+        self.track_processes = self.cgroup_parent is None
+
+    def launch_serial(self, assignments):
+        """
+        Launches the assigned containers. pbsdsh starts every host at once, so this is the parallel launch
+        :param assignments: List of (host, container) tuples
+        :return: Null
+        """
+        self.launch_parallel(assignments)
+
+    def run_fanout(self, host_commands, warn_only=False):
+        """
+        Runs each host's command in one pbsdsh fan-out
+        :param host_commands: OrderedDict of host to command string
+        :param warn_only: Log a warning instead of failing when a command fails
+        :return: List of (host, seconds taken, output, error message or None) tuples in the order of host_commands
+        """
+        start = clock()
+        jobs = list(host_commands.items())
+        try:
+            results = self.pool.run_all(jobs) if jobs else []
+        except Exception as ex:
+            # pbsdsh couldn't be started, no host ran its command
+            return [(host, clock() - start, '', type(ex).__name__ + " " + str(ex)) for host, command in jobs]
+
+        outcomes = []
+        for (host, command), (exit_code, output) in zip(jobs, results):
+            try:
+                outcomes.append((host, clock() - start, self.pool.result(host, command, exit_code, output, warn_only),
+                                 None))
+            except RemoteExecutionError as rex:
+                outcomes.append((host, clock() - start, '', rex.message))
+        return outcomes
+
+    def read_inventories(self, hosts):
+        """
+        Reads the image inventories of the hosts not read yet in one fan-out, filling the cache used by get_inventory
+        :param hosts: List of hosts
+        :return: Null
+        """
+        if not settings.image_inventory:
+            return
+
+        command = inventory_command(self.inventory_path, settings.image_inventory_ttl)
+        unread = OrderedDict((host, command) for host in hosts if host not in self.host_inventory)
+        for host, elapsed, output, error in self.run_fanout(unread):
+            if error is None:
+                self.record_inventory(host, *parse_inventory(output))
+            else:
+                # Nothing is known to be present, so every image is pulled as before
+                logger.warning("Reading the image inventory of %s failed: %s" % (host, error))
+                self.record_inventory(host, dict(), False)
+
+    def pull_images(self, images):
+        """
+        Pulls each host's images from the registry, on every host in one fan-out
+        :param images: OrderedDict of host to list of images needed on it
+        :return: List of (host, images, seconds taken, error message or None) tuples
+        """
+        self.read_inventories(list(images.keys()))
+        needed = OrderedDict((host, self.missing_images(host, host_images)) for host, host_images in images.items())
+        outcomes = self.run_fanout(OrderedDict((host, self.stage_command(host_images))
+                                               for host, host_images in needed.items() if host_images))
+        pulled = dict((host, (elapsed, error)) for host, elapsed, output, error in outcomes)
+
+        staged = []
+        for host in images.keys():
+            elapsed, error = pulled.get(host, (0.0, None))
+            if error is None and needed[host]:
+                self.add_images(host, needed[host])
+            staged.append((host, images[host], elapsed, error))
+        return staged
+
+    def broadcast_images(self, images):
+        """
+        Reads the hosts' image inventories in one fan-out, then relays the images as SSHExecutor does.
+        The relay streams images from host to host over ssh, so the nodes still need passwordless ssh between them
+        :param images: OrderedDict of host to list of images needed on it
+        :return: List of (host, images, seconds taken, error message or None) tuples
+        """
+        self.read_inventories(list(images.keys()))
+        return SSHExecutor.broadcast_images(self, images)
+
+    def start_teardown(self, host_containers, stop_timeout=None):
+        """
+        Starts stopping and removing the containers of every host in one fan-out, in the background
+        :param host_containers: OrderedDict of host to the containers placed on it
+        :param stop_timeout: Seconds the containers get to stop before they are killed
+        :return: Closed worker pool, and the pending list of (host, seconds taken, error message or None) tuples
+        """
+        commands = OrderedDict((host, teardown_command(containers, stop_timeout))
+                               for host, containers in host_containers.items())
+        worker = ThreadPool(1)
+        pending = worker.apply_async(self.teardown_fanout, (commands,))
+        worker.close()
+        return worker, pending
+
+    def teardown_fanout(self, host_commands):
+        """
+        Runs in a worker thread during teardown, running every host's teardown command in one fan-out
+        :param host_commands: OrderedDict of host to its teardown command
+        :return: List of (host, seconds taken, error message or None) tuples
+        """
+        try:
+            return self.log_fanout(self.run_fanout(host_commands))
+        finally:
+            self.torn_down.update(host_commands.keys())
+
+    def start_cleanup(self, host_commands):
+        """
+        Starts running every host's cleanup command in one fan-out, in the background
+        :param host_commands: Dictionary of host to its cleanup command string
+        :return: Closed worker pool, and the pending list of (host, seconds taken, error message or None) tuples
+        """
+        worker = ThreadPool(1)
+        pending = worker.apply_async(lambda: self.log_fanout(self.run_fanout(OrderedDict(host_commands), True)))
+        worker.close()
+        return worker, pending
+
+    def log_fanout(self, outcomes):
+        # Logs the output of each host's command, as the other executors do
+        for host, elapsed, output, error in outcomes:
+            for line in output.splitlines():
+                logger.info(line)
+        return [(host, elapsed, error) for host, elapsed, output, error in outcomes]
+
+    def constrain(self, host, container, cgroup_limits=True):
+        """
+        Assigns the constraints placed on the job by Torque on a host to one of the host's containers,
+        and places the container in the job's cgroup
+        :param host: Host the container runs on
+        :param container: Container to constrain
+        :param cgroup_limits: Whether the job's cgroup limits are assigned, False when the launch script reads them
+        :return: Null
+        """
+        SSHExecutor.constrain(self, host, container, cgroup_limits)
+        container.cgroup_parent = self.cgroup_parent
+
+    def track_int_container(self):
+        """
+        Calls pbs_track to monitor the interactive container process,
+        unless the container was placed in the job's cgroup
+        :return:
+        """
+        if self.track_processes:
+            SSHExecutor.track_int_container(self)
+        else:
+            logger.debug("Interactive container placed in cgroup " + self.cgroup_parent)
+
+    def close_connections(self):
+        """
+        Removes the pool's scripts, logging how many fan-outs ran during the job, and closes the docker daemon's
+        connection
+        :return: Null
+        """
+        stats = self.pool.stats()
+        logger.debug("pbsdsh fan-outs: %d, tasks: %d" % (stats['fanouts'], stats['tasks']))
+        self.pool.close_all()
+        if self.engine is not None:
+            self.engine.close()
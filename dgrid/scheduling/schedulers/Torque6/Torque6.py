@@ -22,8 +22,7 @@ Implementation for docker execution on Torque 6.X series
 import logging
 
 from dgrid.scheduling.schedule import Scheduler
-from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
-
+from dgrid.scheduling.utils import plugins
 from dgrid.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -37,12 +36,15 @@ class Torque6(Scheduler):
         Scheduler.__init__(self, containers, hosts)
         self.containers = containers
         self.hosts = hosts
+        self.array = None
 
-        # Get execution parameter, default to SSH
+        # Get execution parameter, default to SSH. Executors are plugins too, only the one used is imported
         exec_method = getattr(settings, 'Execution_Method', 'SSH')
-        if exec_method.upper() == 'SSH':
-            logger.debug('Loading SSH executor')
-            self.executor = SSHExecutor(self.containers, self.hosts)
+        logger.debug('Loading %s executor' % exec_method)
+        self.executor_class = plugins.load(plugins.EXECUTORS, exec_method)
+
+        # A job array's executors are created for each of its sub-jobs
+        self.executor = self.executor_class(self.containers, self.hosts) if self.containers is not None else None
 
     def run_job(self):
         """
@@ -51,6 +53,17 @@ class Torque6(Scheduler):
         """
         self.executor.run()
 
+    def run_array(self, jobs, concurrency=None):
+        """
+        Called to run a job array
+        :param jobs: OrderedDict of array index to the sub-job's list of containers
+        :param concurrency: Most sub-jobs running at once, settings.array_concurrency if None
+        :return: Dictionary of array index to the sub-job's exit status
+        """
+        from dgrid.scheduling.schedulers.Torque6.JobArray import JobArray
+        self.array = JobArray(self.executor_class, jobs, self.hosts, concurrency)
+        return self.array.run()
+
     def checkpoint(self):
         """
         Called to checkpoint containers of the job
@@ -71,6 +84,9 @@ class Torque6(Scheduler):
         :return:
         """
         logger.debug("Terminate called")
+        if self.array is not None:
+            self.array.terminate()
+            return
         self.executor.terminate_clean()
         logger.debug("Remove images")
         self.executor.remove_images()
@@ -39,3 +39,37 @@ class ProcessIdRetrievalFailure(Exception):
 class ImportedSchedulerClassError(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
+
+
+class PlacementError(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+class DefinitionError(ValueError):
+    def __init__(self, field, problem, path=None):
+        """
+        :param field: Location of the invalid field in the definition, i.e. containers[1].scale
+        :param problem: What is wrong with it
+        :param path: Path of the definition file
+        """
+        location = field if path is None else '%s: %s' % (path, field)
+        ValueError.__init__(self, '%s: %s' % (location, problem))
+        self.field = field
+        self.problem = problem
+        self.path = path
+
+
+class PluginNotFoundError(ImportError):
+    def __init__(self, *args, **kwargs):
+        ImportError.__init__(self, *args, **kwargs)
+
+
+class DockerAPIError(Exception):
+    def __init__(self, message, status=None):
+        """
+        :param message: Error message
+        :param status: HTTP status the daemon returned, None for errors reported in a response's body
+        """
+        Exception.__init__(self, message)
+        self.status = status
@@ -0,0 +1,124 @@
+"""
+Author: Robert Brennan
+Relays images from the head node to the other hosts over a k-ary tree, each host forwarding to its children
+once it has the image itself
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from dgrid.scheduling.utils.output import clock
+
+logger = logging.getLogger(__name__)
+
+# Reported by the transfer command when the receiving host already has the image
+PRESENT_MARKER = 'DGRID_PRESENT'
+
+
+def relay_tree(root, hosts, fanout):
+    """
+    Arranges hosts in a k-ary tree below the root, in the order given, so the tree has a depth of log k of the hosts
+    :param root: Host the image starts on
+    :param hosts: List of hosts to relay the image to
+    :param fanout: Number of children of each host
+    :return: OrderedDict of host to list of its children, for every host in the tree
+    """
+    if fanout < 1:
+        raise ValueError("Relay fan-out must be at least 1, got %d" % fanout)
+
+    nodes = [root] + [host for host in hosts if host != root]
+    tree = OrderedDict((host, []) for host in nodes)
+    for index, host in enumerate(nodes[1:], 1):
+        tree[nodes[(index - 1) // fanout]].append(host)
+    return tree
+
+
+def descendants(tree, host):
+    # Every host below a host in the tree
+    below = []
+    for child in tree[host]:
+        below.append(child)
+        below.extend(descendants(tree, child))
+    return below
+
+
+def transfer_command(image, child, ssh='ssh', after=None):
+    """
+    Builds a shell command, run on the sending host, streaming an image to a child host with docker save and load.
+    Nothing is sent when the child already has the same image, docker load skips layers the child already has
+    :param image: Image name
+    :param child: Host to send the image to
+    :param ssh: ssh binary on the sending host
+    :param after: Command run on the child once the image is loaded
+    :return: Command string
+    """
+    inspect = "docker image inspect --format '{{.Id}}' %s" % image
+    remote = '%s -o BatchMode=yes %s' % (ssh, child)
+    load = 'docker load' if after is None else 'docker load && ' + after
+    return ('id=$(%s) || exit 1; '
+            'if [ "$(%s "%s" 2>/dev/null)" = "$id" ]; then echo %s; exit 0; fi; '
+            'docker save %s | %s "%s"') % (inspect, remote, inspect, PRESENT_MARKER, image, remote, load)
+
+
+def relay(tree, transfer, pool_size=32):
+    """
+    Sends an image down a relay tree. Each host starts sending to its children as soon as it has received the image,
+    with at most pool_size transfers running at any one time. Hosts below a failed transfer are not sent the image
+    :param tree: OrderedDict of host to list of its children, from relay_tree
+    :param transfer: Called with (parent, child) to send the image, returns its output or raises on failure
+    :param pool_size: Maximum number of transfers running at once
+    :return: Dictionary of host to (seconds from the start until received, error message or None, whether it was
+             already present) for every host below the root
+    """
+    root = list(tree.keys())[0]
+    results = dict()
+    finished = threading.Condition()
+    start = clock()
+    workers = ThreadPool(max(1, min(pool_size, len(tree) - 1)))
+
+    def send(parent, child):
+        try:
+            output = transfer(parent, child)
+        except Exception as ex:
+            return parent, child, type(ex).__name__ + " " + str(ex), False
+        return parent, child, None, PRESENT_MARKER in (output or '')
+
+    def received(result):
+        # Runs on the pool's result thread, queues the child's own transfers once it has the image
+        parent, child, error, present = result
+        with finished:
+            results[child] = (clock() - start, error, present)
+            if error is None:
+                for grandchild in tree[child]:
+                    workers.apply_async(send, (child, grandchild), callback=received)
+            else:
+                for host in descendants(tree, child):
+                    results[host] = (clock() - start, "Not reached, relay to %s failed" % child, False)
+            finished.notify()
+
+    try:
+        with finished:
+            for child in tree[root]:
+                workers.apply_async(send, (root, child), callback=received)
+            while len(results) < len(tree) - 1:
+                # A timed wait, an untimed one can't be interrupted by the job's termination signal on Python 2
+                finished.wait(0.5)
+    finally:
+        workers.close()
+        workers.join()
+    return results
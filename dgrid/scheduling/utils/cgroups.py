@@ -0,0 +1,239 @@
+"""
+Author: Robert Brennan
+Reads the cgroup limits placed on a job, from either the cgroup v1 hierarchies or the cgroup v2 unified hierarchy
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Present at the root of a cgroup v2 unified hierarchy only
+V2_MARKER = 'cgroup.controllers'
+
+# cgroup v1 files, relative to the cgroup directory, with the job's path formatted in
+V1_FILES = {'cpu_shares': 'cpu/%s/cpu.shares',
+            'cpu_set': 'cpuset/%s/cpuset.cpus',
+            'memory': 'memory/%s/memory.limit_in_bytes',
+            'memory_swappiness': 'memory/%s/memory.swappiness',
+            'memory_swap': 'memory/%s/memory.memsw.limit_in_bytes',
+            'kernel_memory': 'memory/%s/memory.kmem.limit_in_bytes'}
+
+# cgroup v2 files, relative to the cgroup directory, with the job's path formatted in
+V2_FILES = {'cpu_weight': '%s/cpu.weight',
+            'cpu_set': '%s/cpuset.cpus.effective',
+            'memory': '%s/memory.max',
+            'memory_swap': '%s/memory.swap.max'}
+
+
+class CgroupLimits(object):
+    """
+    Snapshot of a job's cgroup limits on one host, as values for the matching docker run options.
+    Limits that are not set, or not available, are None
+    """
+
+    def __init__(self, version, cpu_shares=None, cpu_set=None, memory=None, memory_swappiness=None,
+                 memory_swap=None, kernel_memory=None):
+        self.version = version
+        self.cpu_shares = cpu_shares
+        self.cpu_set = cpu_set
+        self.memory = memory
+        self.memory_swappiness = memory_swappiness
+        self.memory_swap = memory_swap
+        self.kernel_memory = kernel_memory
+
+    def apply(self, container, memory_limits=False):
+        """
+        Assigns the limits to a container
+        :param container: Container to constrain
+        :param memory_limits: Whether memory limits are applied as well as cpu limits
+        :return: Null
+        """
+        container.cpu_shares = self.cpu_shares
+        container.cpu_set = self.cpu_set
+
+        if memory_limits:
+            container.memory = self.memory
+            container.memory_swappiness = self.memory_swappiness
+            container.memory_swap = self.memory_swap
+            container.kernel_memory = self.kernel_memory
+
+
+def job_files(cgroup_dir, job_path):
+    """
+    Lists every file limits may be read from, for both cgroup versions
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy i.e. torque/<job id>
+    :return: Dictionary of v1 files, dictionary of v2 files, path of the v2 marker file
+    """
+    v1 = dict((name, cgroup_dir + '/' + path % job_path) for name, path in V1_FILES.items())
+    v2 = dict((name, cgroup_dir + '/' + path % job_path) for name, path in V2_FILES.items())
+    return v1, v2, cgroup_dir + '/' + V2_MARKER
+
+
+def limits_from_files(cgroup_dir, job_path, files):
+    """
+    Builds the limits snapshot from the contents of the job's cgroup files
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :param files: Dictionary of file path to contents, for the files that could be read
+    :return: CgroupLimits
+    """
+    v1, v2, marker = job_files(cgroup_dir, job_path)
+
+    def value(path):
+        content = files.get(path)
+        return content.strip() if content is not None and content.strip() != '' else None
+
+    if marker not in files:
+        return CgroupLimits(1,
+                            cpu_shares=value(v1['cpu_shares']),
+                            cpu_set=value(v1['cpu_set']),
+                            memory=with_unit(value(v1['memory'])),
+                            memory_swappiness=value(v1['memory_swappiness']),
+                            memory_swap=with_unit(value(v1['memory_swap'])),
+                            kernel_memory=with_unit(value(v1['kernel_memory'])))
+
+    # cgroup v2 has no per cgroup swappiness or kernel memory limit
+    memory = value(v2['memory'])
+    memory = None if memory == 'max' else memory
+    swap = value(v2['memory_swap'])
+    if memory is None or swap is None:
+        memory_swap = None
+    elif swap == 'max':
+        memory_swap = '-1'
+    else:
+        # docker's --memory-swap is memory and swap combined, memory.swap.max is swap alone
+        memory_swap = str(int(memory) + int(swap))
+
+    return CgroupLimits(2,
+                        cpu_shares=weight_to_shares(value(v2['cpu_weight'])),
+                        cpu_set=value(v2['cpu_set']),
+                        memory=with_unit(memory),
+                        memory_swap=with_unit(memory_swap))
+
+
+def with_unit(value):
+    # docker expects byte values with a unit, -1 is left as is to mean unlimited
+    return value + 'b' if value is not None and value != '-1' else value
+
+
+def weight_to_shares(weight):
+    """
+    Converts a cgroup v2 cpu.weight to the equivalent cgroup v1 cpu.shares, as used by docker's --cpu-shares.
+    Inverse of runc's shares to weight conversion, rounded up so converting back gives the same weight
+    :param weight: cpu.weight value, 1 - 10000
+    :return: cpu.shares value as a string, or None
+    """
+    if weight is None:
+        return None
+    return str(2 - (-(int(weight) - 1) * 262142 // 9999))
+
+
+def read_limits(cgroup_dir, job_path):
+    """
+    Reads the job's limits on this machine, directly from the cgroup files
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :return: CgroupLimits
+    """
+    v1, v2, marker = job_files(cgroup_dir, job_path)
+    files = dict()
+    for path in list(v1.values()) + list(v2.values()) + [marker]:
+        try:
+            with open(path, 'r') as f:
+                files[path] = f.read()
+        except (IOError, OSError):
+            continue
+    return limits_from_files(cgroup_dir, job_path, files)
+
+
+def snapshot_command(cgroup_dir, job_path):
+    """
+    Builds a single shell command printing every readable cgroup file of the job, as path=contents lines
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :return: Command string
+    """
+    v1, v2, marker = job_files(cgroup_dir, job_path)
+    paths = sorted(list(v1.values()) + list(v2.values())) + [marker]
+    return 'for f in %s; do [ -r "$f" ] && echo "$f=$(cat "$f")"; done; true' % ' '.join(paths)
+
+
+def read_remote_limits(run, cgroup_dir, job_path):
+    """
+    Reads the job's limits on a remote machine in a single command
+    :param run: Callable running a command string on the remote machine, and returning its output
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :return: CgroupLimits
+    """
+    return parse_snapshot(cgroup_dir, job_path, run(snapshot_command(cgroup_dir, job_path)))
+
+
+def limits_command(cgroup_dir, job_path, memory_limits=False):
+    """
+    Builds shell commands reading the job's limits where they run, into the docker run options matching
+    CgroupLimits.apply, so a launch script can constrain its containers without the limits being read beforehand.
+    The options are left in the limit_args variable, unquoted expansions of it add them to a command
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :param memory_limits: Whether memory limits are applied as well as cpu limits
+    :return: Command string
+    """
+    v1, v2, marker = job_files(cgroup_dir, job_path)
+    lines = ['limit() { [ -r "$1" ] && tr -d " \\n" < "$1"; true; }',
+             'unit() { case "$1" in ""|-1) echo "$1" ;; *) echo "${1}b" ;; esac; }',
+             'add_limit() { [ -z "$2" ] || limit_args="$limit_args $1=$2"; }',
+             'limit_args=""',
+             'if [ -e "%s" ]; then' % marker,
+             # cgroup v2, see limits_from_files and weight_to_shares
+             'weight=$(limit "%s")' % v2['cpu_weight'],
+             'add_limit --cpu-shares "${weight:+$((2 + ((weight - 1) * 262142 + 9998) / 9999))}"',
+             'add_limit --cpuset-cpus "$(limit "%s")"' % v2['cpu_set']]
+    if memory_limits:
+        lines += ['memory=$(limit "%s"); [ "$memory" != max ] || memory=""' % v2['memory'],
+                  'swap=$(limit "%s")' % v2['memory_swap'],
+                  'add_limit --memory "$(unit "$memory")"',
+                  'if [ -n "$memory" ] && [ -n "$swap" ]; then',
+                  '[ "$swap" = max ] && swap=-1 || swap=$((memory + swap))',
+                  'add_limit --memory-swap "$(unit "$swap")"',
+                  'fi']
+    lines += ['else',
+              'add_limit --cpu-shares "$(limit "%s")"' % v1['cpu_shares'],
+              'add_limit --cpuset-cpus "$(limit "%s")"' % v1['cpu_set']]
+    if memory_limits:
+        lines += ['add_limit --memory "$(unit "$(limit "%s")")"' % v1['memory'],
+                  'add_limit --memory-swap "$(unit "$(limit "%s")")"' % v1['memory_swap'],
+                  'add_limit --memory-swappiness "$(limit "%s")"' % v1['memory_swappiness'],
+                  'add_limit --kernel-memory "$(unit "$(limit "%s")")"' % v1['kernel_memory']]
+    lines.append('fi')
+    return '\n'.join(lines)
+
+
+def parse_snapshot(cgroup_dir, job_path, output):
+    """
+    Builds the limits snapshot from the output of the snapshot command
+    :param cgroup_dir: The machine's cgroup directory
+    :param job_path: Path of the job's cgroup below each hierarchy
+    :param output: Output of the command built by snapshot_command
+    :return: CgroupLimits
+    """
+    files = dict()
+    for line in output.splitlines():
+        if '=' in line:
+            path, content = line.split('=', 1)
+            files[path] = content
+    return limits_from_files(cgroup_dir, job_path, files)
@@ -0,0 +1,199 @@
+"""
+Author: Robert Brennan
+Node-local queue of cleanup work left by finished jobs, drained later by a Torque epilogue or a background worker.
+Drains queues when run as python -m dgrid.scheduling.utils.cleanup_queue <queue directory>...
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from subprocess import Popen
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+logger = logging.getLogger(__name__)
+
+# Queue entries are only read once complete, they are written under a temporary name and renamed
+SUFFIX = '.json'
+LOCK = '.lock'
+
+# Times an entry is drained before its failing commands are given up on
+MAX_ATTEMPTS = 3
+
+
+def entry(job_id, commands, now=None):
+    """
+    Builds a queue entry
+    :param job_id: Id of the job the cleanup is for
+    :param commands: List of shell commands to run, in order
+    :param now: Time the entry was queued at, the current time if None
+    :return: Entry name, entry contents as JSON
+    """
+    now = time.time() if now is None else now
+    name = '%d-%s%s' % (int(now * 1000), job_id, SUFFIX)
+    return name, json.dumps({'job_id': job_id, 'created': now, 'commands': commands, 'attempts': 0})
+
+
+def enqueue(queue_dir, job_id, commands, now=None):
+    """
+    Queues cleanup work on this node
+    :param queue_dir: Queue directory
+    :param job_id: Id of the job the cleanup is for
+    :param commands: List of shell commands to run, in order
+    :param now: Time the entry was queued at, the current time if None
+    :return: Path of the entry
+    """
+    name, contents = entry(job_id, commands, now)
+    if not os.path.isdir(queue_dir):
+        os.makedirs(queue_dir)
+    path = os.path.join(queue_dir, name)
+    with open(path + '.tmp', 'w') as f:
+        f.write(contents)
+    os.rename(path + '.tmp', path)
+    return path
+
+
+def enqueue_command(queue_dir, job_id, commands, now=None):
+    """
+    Builds a shell command queueing cleanup work on the node it runs on
+    :param queue_dir: Queue directory
+    :param job_id: Id of the job the cleanup is for
+    :param commands: List of shell commands to run, in order
+    :param now: Time the entry was queued at, the current time if None
+    :return: Command string
+    """
+    name, contents = entry(job_id, commands, now)
+    path = queue_dir + '/' + name
+    return 'mkdir -p %s && printf %%s %s > %s.tmp && mv %s.tmp %s' \
+           % (quote(queue_dir), quote(contents), quote(path), quote(path), quote(path))
+
+
+def drain_command(python, queue_dir):
+    """
+    Builds a shell command starting a worker that drains a queue in the background, in its own session so it
+    outlives the job's session. Torque MOMs with cgroups enabled still kill it with the job's cgroup
+    :param python: Python interpreter with dgrid installed on the node
+    :param queue_dir: Queue directory
+    :return: Command string
+    """
+    return 'setsid %s -m dgrid.scheduling.utils.cleanup_queue %s < /dev/null > /dev/null 2>&1 &' \
+        % (python, quote(queue_dir))
+
+
+def start_drain(python, queue_dir):
+    """
+    Starts a worker draining a queue on this host, in its own session as with drain_command
+    :param python: Python interpreter with dgrid installed
+    :param queue_dir: Queue directory
+    :return: Popen of the worker
+    """
+    with open(os.devnull, 'r+') as devnull:
+        return Popen([python, '-m', 'dgrid.scheduling.utils.cleanup_queue', queue_dir], stdin=devnull,
+                     stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid)
+
+
+def next_entry(queue_dir, seen):
+    # Oldest entry not yet drained, entries queued while draining are picked up too
+    paths = sorted(set(glob.glob(os.path.join(queue_dir, '*' + SUFFIX))) - seen)
+    return paths[0] if paths else None
+
+
+def run_shell(command):
+    # Runs a shell command, returning its exit code
+    return Popen(['sh', '-c', command]).wait()
+
+
+def drain(queue_dir, run=run_shell, job_id=None):
+    """
+    Runs the queued cleanup work, oldest first. Entries are removed once all of their commands succeed,
+    or after MAX_ATTEMPTS drains. Only one drain runs on a queue at a time, others return straight away
+    :param queue_dir: Queue directory
+    :param run: Callable running a shell command, and returning its exit code
+    :param job_id: Only drain the entries of this job, all entries if None
+    :return: Number of entries completed, number of entries left in the queue
+    """
+    if not os.path.isdir(queue_dir):
+        return 0, 0
+
+    with open(os.path.join(queue_dir, LOCK), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            logger.info("Queue %s is already being drained" % queue_dir)
+            return 0, len(glob.glob(os.path.join(queue_dir, '*' + SUFFIX)))
+
+        completed = 0
+        left = 0
+        seen = set()
+        for path in iter(lambda: next_entry(queue_dir, seen), None):
+            seen.add(path)
+            try:
+                with open(path, 'r') as f:
+                    work = json.load(f)
+            except (IOError, OSError, ValueError) as ex:
+                logger.error("Dropping unreadable queue entry %s: %s" % (path, str(ex)))
+                os.remove(path)
+                continue
+
+            if job_id is not None and work['job_id'] != job_id:
+                left += 1
+                continue
+
+            failed = [command for command in work['commands'] if run(command) != 0]
+            work['attempts'] += 1
+            if not failed or work['attempts'] >= MAX_ATTEMPTS:
+                if failed:
+                    logger.error("Giving up on cleanup of job %s after %d attempts: %s"
+                                 % (work['job_id'], work['attempts'], '; '.join(failed)))
+                os.remove(path)
+                completed += 1
+            else:
+                # Only the failed commands are retried
+                work['commands'] = failed
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(work, f)
+                os.rename(path + '.tmp', path)
+                left += 1
+    return completed, left
+
+
+def main(argv=None):
+    """
+    Command line entry point, run by a Torque epilogue or a background worker
+    :param argv: Command line arguments, sys.argv if None
+    :return: Null
+    """
+    parser = argparse.ArgumentParser(description='Runs the cleanup work queued by finished dgrid jobs')
+    parser.add_argument('queues', nargs='+', help="Queue directories")
+    parser.add_argument('--job', default=None, help="Only run the cleanup of this job")
+    args = parser.parse_args(argv)
+
+    for queue_dir in args.queues:
+        completed, left = drain(queue_dir, job_id=args.job)
+        logger.info("%s: %d entries completed, %d left" % (queue_dir, completed, left))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
@@ -0,0 +1,235 @@
+"""
+Author: Robert Brennan
+Validates docker definition files against a schema before any host is touched
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import logging
+import re
+import shlex
+from collections import OrderedDict
+
+from dgrid.docker.container import ContainerTemplate
+from dgrid.scheduling.utils.Errors import DefinitionError
+from dgrid.scheduling.utils.docker_netorking import HOSTFILES
+
+logger = logging.getLogger(__name__)
+
+# Docker's rule for container names, dgrid appends a random suffix to them
+NAME = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+
+try:
+    text_types = (str, unicode)
+except NameError:
+    text_types = (str,)
+
+
+class Invalid(Exception):
+    # Raised by a field check, the loader adds the field's location
+    pass
+
+
+def string(value):
+    if not isinstance(value, text_types) or not value:
+        raise Invalid("expected a non-empty string, got %s" % json.dumps(value))
+    return value
+
+
+def name(value):
+    if not isinstance(value, text_types) or not NAME.match(value):
+        raise Invalid("expected a container name of letters, digits, '_', '.' and '-', got %s" % json.dumps(value))
+    return value
+
+
+def string_list(value):
+    if not isinstance(value, list):
+        raise Invalid("expected a list of strings, got %s" % json.dumps(value))
+    for index, item in enumerate(value):
+        if not isinstance(item, text_types):
+            raise Invalid("item %d: expected a string, got %s" % (index, json.dumps(item)))
+    return value
+
+
+def flag(value):
+    # "True" and "False" as in the documentation, JSON booleans are accepted too
+    if value in ('True', 'False'):
+        return value
+    if isinstance(value, bool):
+        return 'True' if value else 'False'
+    raise Invalid('expected "True" or "False", got %s' % json.dumps(value))
+
+
+def command(value):
+    # A command given as one string is split as the shell would
+    if isinstance(value, text_types):
+        return shlex.split(value)
+    return string_list(value)
+
+
+def scale(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise Invalid("expected an integer of at least 1, got %s" % json.dumps(value))
+    return value
+
+
+def host_to_list(value):
+    if value == 'True' or value is True:
+        return 'True'
+    for index, item in enumerate(string_list(value)):
+        if '=' not in item:
+            raise Invalid('item %d: expected "key=value", got %s' % (index, json.dumps(item)))
+    return value
+
+
+def links(value):
+    for index, item in enumerate(string_list(value)):
+        if len(item.split(':')) != 2 or not all(item.split(':')):
+            raise Invalid('item %d: expected "container_name:ENVIRONMENT_VARIABLE", got %s'
+                          % (index, json.dumps(item)))
+    return value
+
+
+def compile_schema(fields):
+    """
+    Compiles a schema once, into the checks run on every definition
+    :param fields: List of (field name, check, whether it is required)
+    :return: OrderedDict of field name to (check, required)
+    """
+    return OrderedDict((field, (check, required)) for field, check, required in fields)
+
+
+CONTAINER_SCHEMA = compile_schema([
+    ('name', name, True),
+    ('image', string, True),
+    ('interactive', flag, True),
+    ('checkpointing', flag, False),
+    ('run_cmd', command, False),
+    ('volumes', string_list, False),
+    ('environment_variables', string_list, False),
+    ('work_dir', string, False),
+    ('scale', scale, False),
+    ('host_to_list', host_to_list, False),
+    ('host_list_location', string, False),
+    ('links', links, False),
+])
+
+
+class Definition(object):
+    """
+    Canonical form of a docker definition file, shared by every job loading the same contents
+    """
+    __slots__ = ('templates', 'hostfile_format')
+
+    def __init__(self, templates, hostfile_format):
+        """
+        :param templates: Tuple of (ContainerTemplate, number of replicas), in the order of the file
+        :param hostfile_format: Format of the host list, None if the file doesn't set one
+        """
+        self.templates = templates
+        self.hostfile_format = hostfile_format
+
+
+def check_container(container, location):
+    """
+    Checks a container entry against the schema
+    :param container: Container entry from the definition
+    :param location: Location of the entry, used in errors
+    :return: Normalised copy of the entry
+    """
+    if not isinstance(container, dict):
+        raise DefinitionError(location, "expected an object, got %s" % json.dumps(container))
+
+    checked = dict()
+    for field, (check, required) in CONTAINER_SCHEMA.items():
+        if field not in container:
+            if required:
+                raise DefinitionError(location + '.' + field, "required field is missing")
+            continue
+        try:
+            checked[field] = check(container[field])
+        except Invalid as ex:
+            raise DefinitionError(location + '.' + field, str(ex))
+
+    for field in container:
+        if field not in CONTAINER_SCHEMA:
+            logger.warning("%s.%s: unknown field, ignored" % (location, field))
+    return checked
+
+
+def check_definition(data):
+    """
+    Checks a parsed definition file against the schema, including the rules between containers
+    :param data: Parsed JSON of the definition file
+    :return: Definition
+    """
+    if not isinstance(data, dict):
+        raise DefinitionError('(top level)', "expected an object, got %s" % json.dumps(data))
+
+    hostfile_format = data.get('hostfile_format')
+    if 'hostfile_format' in data and hostfile_format not in HOSTFILES:
+        raise DefinitionError('hostfile_format', "expected one of %s, got %s"
+                              % (", ".join(sorted(HOSTFILES)), json.dumps(hostfile_format)))
+
+    entries = data.get('containers')
+    if not isinstance(entries, list) or not entries:
+        raise DefinitionError('containers', "expected a non-empty list of containers, got %s" % json.dumps(entries))
+
+    containers = [check_container(container, 'containers[%d]' % index) for index, container in enumerate(entries)]
+
+    scales = dict((container['name'], container.get('scale', 1)) for container in containers)
+    for index, container in enumerate(containers):
+        for position, link in enumerate(container.get('links', [])):
+            target = link.split(':')[0]
+            location = 'containers[%d].links[%d]' % (index, position)
+            if target not in scales:
+                raise DefinitionError(location, "links to %s, which isn't defined" % json.dumps(target))
+            if scales[target] != 1:
+                raise DefinitionError(location, "links to %s, which is scaled" % json.dumps(target))
+
+        options = container.get('host_to_list')
+        if isinstance(options, list):
+            keys = dict(option.split('=', 1) for option in options)
+            if hostfile_format == 'json' and 'tag' not in keys:
+                raise DefinitionError('containers[%d].host_to_list' % index,
+                                      'a "tag=..." entry is needed for json host lists')
+            if hostfile_format == 'machinefile' and 'slots' in keys:
+                try:
+                    scale(int(keys['slots']))
+                except (ValueError, Invalid):
+                    raise DefinitionError('containers[%d].host_to_list' % index,
+                                          "slots must be an integer of at least 1, got %s" % json.dumps(keys['slots']))
+
+    templates = tuple((ContainerTemplate(container), container.get('scale', 1)) for container in containers)
+    return Definition(templates, hostfile_format)
+
+
+def load_definition(path):
+    """
+    Reads and checks a docker definition file
+    :param path: Path of the json docker definition file
+    :return: Definition
+    """
+    with open(path, 'rb') as f:
+        contents = f.read()
+
+    try:
+        data = json.loads(contents.decode('utf-8'))
+    except ValueError as ex:
+        raise DefinitionError('(file)', "not valid JSON: %s" % str(ex), path)
+    try:
+        return check_definition(data)
+    except DefinitionError as ex:
+        raise DefinitionError(ex.field, ex.problem, path)
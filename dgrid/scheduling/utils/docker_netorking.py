@@ -21,19 +21,36 @@ import string
 import json
 import os
 import logging
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# File name of the host list written for each hostfile format
+HOSTFILES = {'list': 'hostfile', 'json': 'hostfile.json', 'machinefile': 'machinefile'}
+
+
+def hostfile_name(formatter):
+    """
+    Gives the name of the host list file written for a format
+    :param formatter: Format for hostfile. i.e. list | json | machinefile
+    :return: File name, None for an unknown format
+    """
+    return HOSTFILES.get(formatter)
+
 
 def add_networking(containers, write_directory):
     """
-    Reads container objects and modifies them to support docker multi-host networks
+    Reads container objects and modifies them to support docker multi-host networks.
+    The host list is built in memory and written once, after every container has been named
     :param containers: List of containers to add networking logic to
     :param write_directory: Directory to write host file to
     :return:
     """
     format_used = os.environ.get("DGRID_HOSTFILE_FORMAT")
+    hostfile = hostfile_name(format_used)
+    debug = logger.isEnabledFor(logging.DEBUG)
     create_network = False
+    entries = []
     container_mapping = dict()
     for container in containers:
         original_name = container.name
@@ -55,86 +72,75 @@ def add_networking(containers, write_directory):
                 environment_variables.append("%s=%s" % (parts[1], container_name))
                 # set container environment variables to new environment variable list
                 container.environment_vars = environment_variables
-                logger.debug("Container environment variables " + " ".join(container.environment_vars))
-                logger.debug("Container run command " + " ".join(container.run()))
+                if debug:
+                    logger.debug("Container environment variables " + " ".join(container.environment_vars))
+                    logger.debug("Container run command " + " ".join(container.run()))
 
         if container.host_to_list is not None:
             create_network = True
             # add container host name to list
-            if format_used == "json":
-                htl = dict()
-                for val in container.host_to_list:
-                    parts = val.split("=")
-                    htl[parts[0]] = parts[1]
-                add_to_hostlist(container.name, write_directory, tag=htl['tag'], formatter=format_used)
-
-            if format_used == "list":
-                add_to_hostlist(container.name, write_directory, formatter=format_used)
+            entries.append((container.name, list_options(container.host_to_list)))
 
         if container.host_list_location is not None:
             create_network = True
             # add volume mapping for host list
-            if format_used == 'json':
-                hostfile = write_directory + "/" + "hostfile.json"
+            if hostfile is not None:
                 volumes = container.volumes if hasattr(container, 'volumes') else []
-                volumes.append('%s:%s' % (hostfile, container.host_list_location + "hostfile.json"))
+                volumes.append('%s:%s' % (write_directory + "/" + hostfile, container.host_list_location + hostfile))
                 container.volumes = volumes
 
-            if format_used == 'list':
-                hostfile = write_directory + "/" + "hostfile"
-                volumes = container.volumes if hasattr(container, 'volumes') else []
-                volumes.append('%s:%s' % (hostfile, container.host_list_location + "hostfile"))
-                container.volumes = volumes
+    if entries and hostfile is not None:
+        write_hostfile(write_directory + "/" + hostfile, format_hostfile(entries, format_used))
 
     return containers, create_network
 
 
-def add_to_hostlist(name, write_directory, tag=None, formatter=None):
+def list_options(host_to_list):
     """
-    Adds container names to host list used by containers
-    :param name: Hostname to write to file
-    :param write_directory: directory to write file to
-    :param tag: In the case of json, the list name to add host to
-    :param formatter: Format for hostfile. i.e. list | json
-    :return:
+    Reads a container's host_to_list value
+    :param host_to_list: "True", or a list of key=value options, i.e. ["tag=green"] or ["slots=4"]
+    :return: Dictionary of options
+    """
+    options = dict()
+    if isinstance(host_to_list, (list, tuple)):
+        for val in host_to_list:
+            parts = val.split("=", 1)
+            if len(parts) == 2:
+                options[parts[0]] = parts[1]
+    return options
+
+
+def format_hostfile(entries, formatter):
+    """
+    Builds the contents of a host list
+    :param entries: List of (container name, options) tuples, in the order containers were defined
+    :param formatter: Format for hostfile. i.e. list | json | machinefile
+    :return: Contents of the host list
     """
     if formatter == "list":
-        hf = "hostfile"
-        with open(write_directory + '/' + hf, 'a+') as hf:
-            hf.write(name + '\n')
+        return ''.join(name + '\n' for name, options in entries)
 
     if formatter == "json":
-        hf = "hostfile.json"
-        json_writer(write_directory + '/' + hf, name, tag)
+        tags = OrderedDict()
+        for name, options in entries:
+            tags.setdefault(options.get('tag'), []).append(name)
+        return json.dumps(tags)
+
+    if formatter == "machinefile":
+        # MPI style, i.e. read by mpirun -machinefile, one container per line with its number of slots
+        return ''.join('%s slots=%s\n' % (name, options.get('slots', 1)) for name, options in entries)
 
+    raise ValueError("Unknown hostfile format %s" % formatter)
 
-def json_writer(file, name, tag):
+
+def write_hostfile(path, contents):
     """
-    Adds host names to a json host list for use in docker containers
-    :param file: Json file to write hosts to
-    :param name: Hostname to add to file
-    :param tag: List to add hostname to
+    Writes a host list, replacing any previous one in a single rename so containers never see part of a list
+    :param path: Path of the host list
+    :param contents: Contents of the host list
     :return: Null
     """
-
-    if not os.path.isfile(file):
-        # Create the file, and entry
-        data = '{"%s": ["%s"]}' % (tag, name)
-        with open(file, 'w') as f:
-            f.write(data)
-    else:
-        # Read the file
-        with open(file, 'r') as f:
-            data = json.load(f)
-
-        if tag not in data:
-            # if the tag doesn't exist create it and append to it
-            data[tag] = []
-            data[tag].append("%s" % name)
-        else:
-            # append to existing tag
-            data[tag].append("%s" % name)
-
-        with open(file, 'w') as f:
-            # write the new data to the file overwriting the existing one
-            json.dump(data, f)
+    temporary = '%s.%d' % (path, os.getpid())
+    with open(temporary, 'w') as f:
+        f.write(contents)
+    os.rename(temporary, path)
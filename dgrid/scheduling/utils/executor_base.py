@@ -0,0 +1,145 @@
+"""
+Author: Robert Brennan
+Parts shared by the executors: local docker operations, output logging, launch checks and image cleanup plans
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import sys
+from collections import OrderedDict
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils.Errors import RemoteExecutionError, DockerAPIError
+from dgrid.scheduling.utils.launch_script import parse_launch_results
+from dgrid.scheduling.utils.output import stream_output, STDERR
+from dgrid.scheduling.utils.teardown import cleanup_plan, cleanup_command, UNREFERENCED, UNUSED, GC
+from dgrid.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBase(object):
+    """
+    Base class of the executors, for the parts that don't depend on how remote hosts are reached.
+    Executors set engine, network_name, containers, int_container, script_dir and user
+    """
+
+    def docker_network(self, create=False, remove=False):
+        """
+        Creates or removes a docker network
+        :param create: boolean parameter, defines whether docker network should be created
+        :param remove: boolean parameter, defines whether docker network should be destroyed
+        :return:
+        """
+        if create:
+            self.local_docker(['docker', 'network', 'create', '--driver=overlay', self.network_name],
+                              lambda: self.engine.create_network(self.network_name))
+        if remove:
+            self.local_docker(['docker', 'network', 'rm', self.network_name],
+                              lambda: self.engine.remove_network(self.network_name))
+
+    def local_docker(self, command, request):
+        """
+        Runs a docker operation on this host, through the docker daemon's Engine API when settings.docker_api
+        is enabled, otherwise with the docker CLI. Failures are logged
+        :param command: docker CLI command
+        :param request: Callable making the same request with the Engine API client
+        :return: Null
+        """
+        if self.engine is None:
+            self.print_output(Popen(command, stdout=PIPE, stderr=PIPE))
+            return
+        try:
+            request()
+        except Exception as ex:
+            # Connection failures surface as socket errors, not only DockerAPIError
+            logger.error("%s failed: %s %s" % (" ".join(command), type(ex).__name__, str(ex)))
+
+    def engine_run(self, container):
+        """
+        Creates and starts a container through the Engine API. The API doesn't pull a missing image as docker run
+        does, so the image is pulled when the create request finds none, and the container created again
+        :param container: Container to run on this host
+        :return: Container id
+        """
+        try:
+            container_id = self.engine.create_container(container.name, container.api_config())
+        except DockerAPIError as ex:
+            if ex.status != 404:
+                raise
+            logger.debug("Image %s not found, pulling it" % container.image)
+            self.engine.pull(container.image)
+            container_id = self.engine.create_container(container.name, container.api_config())
+        self.engine.start_container(container.name)
+        return container_id
+
+    def check_launch(self, host, containers, output):
+        """
+        Checks the results reported by a host's launch script, and sets the limits the script applied on the containers
+        Raises RemoteExecutionError if any of the containers failed to launch
+        :param host: Host the script ran on
+        :param containers: List of containers the script launched
+        :param output: Output of the launch script
+        :return: Null
+        """
+        launched, error = parse_launch_results(output)
+
+        if error is not None:
+            raise RemoteExecutionError("Launch on %s failed at step %s of container %s"
+                                       % (host, error.get('step'), error.get('name', '-')))
+        if len(launched) != len(containers):
+            raise RemoteExecutionError("Launch on %s reported %d of %d containers"
+                                       % (host, len(launched), len(containers)))
+
+        # The script launches the containers in order, replicas can share a name
+        for container, result in zip(containers, launched):
+            for attribute, value in result['limits'].items():
+                setattr(container, attribute, value)
+            logger.debug("Launched %s on %s, container id %s pid %s, run %.1fms, track %.1fms, limits %s"
+                         % (result['name'], host, result['container_id'], result['pid'],
+                            int(result['run_ns']) / 1e6, int(result['track_ns']) / 1e6,
+                            ' '.join('%s=%s' % limit for limit in sorted(result['limits'].items())) or 'none'))
+
+    def cleanup_commands(self):
+        """
+        Builds the image cleanup commands for settings.image_cleanup, taking each cleanup action once per host.
+        This host's actions, for the interactive container and any containers placed here, are run locally
+        :return: OrderedDict of remote host to its cleanup command string, this host's cleanup command string
+        """
+        unref_command = ['sh', self.script_dir + settings.unreferenced_containers_script]
+        base_command = ['sh', self.script_dir + settings.unused_images_script]
+        gc_command = [sys.executable, '-m', 'dgrid.scheduling.utils.image_gc', '--index', settings.image_gc_index,
+                      '--root', settings.docker_root, '--high', str(settings.image_gc_high),
+                      '--low', str(settings.image_gc_low)]
+        scripts = {UNREFERENCED: ' '.join(unref_command), UNUSED: ' '.join(base_command), GC: ' '.join(gc_command)}
+        plan = cleanup_plan(self.containers, settings.image_cleanup, settings.remove_unreferenced_containers,
+                            self.hostname, [self.int_container])
+        command = cleanup_command(plan.pop(self.hostname), scripts)
+        return OrderedDict((host, cleanup_command(actions, scripts)) for host, actions in plan.items()), command
+
+    def print_output(self, process):
+        """
+        Prints the output from a subprocess Popen, stdout and stderr are read at the same time
+        :param process: An instance of Subprocess.Popen
+        :return: Exit code of the process
+        """
+        return stream_output(process, self.log_output, settings.output_buffer_lines)
+
+    def log_output(self, stream, timestamp, line):
+        # Logs a line of output, stderr as errors
+        if stream == STDERR:
+            logger.error(line)
+        else:
+            logger.info(line)
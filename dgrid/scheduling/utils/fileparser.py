@@ -19,11 +19,13 @@ Utilities for parsing docker definition files and host file
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import json
 import logging
 import os
+from collections import OrderedDict
 
 from dgrid.docker.container import Container
+from dgrid.scheduling.utils.definition import load_definition
+from dgrid.scheduling.utils.job_array import ARRAY_INDEX
 
 logger = logging.getLogger(__name__)
 
@@ -34,25 +36,55 @@ def get_containers(dockerdef):
     :param dockerdef: Json docker definition file
     :return: Container array
     """
-    containers = []
     logger.debug('Loading container definition file')
-    with open(dockerdef) as data_file:
-        data = json.load(data_file)
+    # Raises DefinitionError, naming the field, for definitions that don't match the schema
+    definition = load_definition(dockerdef)
+
+    if definition.hostfile_format is not None:
+        os.environ['DGRID_HOSTFILE_FORMAT'] = definition.hostfile_format
 
-    for cont in data["containers"]:
-        # key error will be thrown if required values are missing from the json, no need to catch error
-        if 'scale' in cont:
-            for i in range(cont['scale']):
-                containers.append(Container(cont))
-        else:
-            containers.append(Container(cont))
+    return build_containers(definition)
 
-    if 'hostfile_format' in data:
-        os.environ['DGRID_HOSTFILE_FORMAT'] = data["hostfile_format"]
 
+def build_containers(definition):
+    """
+    Builds the containers of a job from its definition
+    :param definition: Definition, from load_definition
+    :return: Container array
+    """
+    containers = []
+    # Replicas of a scaled container share one template
+    for template, replicas in definition.templates:
+        for i in range(replicas):
+            containers.append(Container(template))
     return containers
 
 
+def get_array_containers(dockerdef, indices):
+    """
+    Builds the containers of each sub-job of a job array, from one read of the definition file.
+    Every container gets its sub-job's index in the DGRID_ARRAY_INDEX environment variable
+    :param dockerdef: Json docker definition file
+    :param indices: List of array indices
+    :return: OrderedDict of array index to container array
+    """
+    definition = load_definition(dockerdef)
+    if definition.hostfile_format is not None:
+        os.environ['DGRID_HOSTFILE_FORMAT'] = definition.hostfile_format
+
+    jobs = OrderedDict()
+    for index in indices:
+        containers = build_containers(definition)
+        for container in containers:
+            variable = "%s=%d" % (ARRAY_INDEX, index)
+            if hasattr(container, 'environment_vars'):
+                container.environment_vars.append(variable)
+            else:
+                container.environment_vars = [variable]
+        jobs[index] = containers
+    return jobs
+
+
 def get_hosts(hostfile=None):
     """
     Reads hostfile, and returns an array of hosts
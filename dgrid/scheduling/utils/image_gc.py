@@ -0,0 +1,224 @@
+"""
+Author: Robert Brennan
+Garbage collects a node's docker images, least recently used first, once disk usage passes a high watermark.
+Runs on the node itself, as python -m dgrid.scheduling.utils.image_gc. The node's last used index is shared by every
+user's jobs, collections lock it while they read, update and rewrite it
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import sys
+import time
+from subprocess import check_output, CalledProcessError
+
+from dgrid.scheduling.utils.inventory import normalise
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the line reporting the result of a collection
+RESULT_MARKER = 'DGRID_GC'
+
+
+def run_docker(args):
+    # Runs a docker command, returning its output as text
+    return check_output(['docker'] + args).decode('utf-8')
+
+
+def list_images(run):
+    """
+    Lists every image on the node with two docker commands, however many images there are
+    :param run: Callable running docker with a list of arguments, and returning its output
+    :return: List of dictionaries with each image's id, tags and size in bytes
+    """
+    ids = []
+    for image_id in run(['images', '-q', '--no-trunc']).split():
+        if image_id not in ids:
+            ids.append(image_id)
+    if not ids:
+        return []
+
+    return [{'id': image['Id'], 'tags': image.get('RepoTags') or [], 'size': image.get('Size', 0)}
+            for image in json.loads(run(['image', 'inspect'] + ids))]
+
+
+def images_in_use(run):
+    """
+    Finds the images used by any container on the node, running or not, with two docker commands
+    :param run: Callable running docker with a list of arguments, and returning its output
+    :return: Set of image ids
+    """
+    containers = run(['ps', '-aq', '--no-trunc']).split()
+    if not containers:
+        return set()
+    return set(run(['inspect', '--format', '{{.Image}}'] + containers).split())
+
+
+def open_index(path):
+    """
+    Opens the node's last used index for reading and writing, creating it writable by every user's jobs
+    :param path: Path of the index file
+    :return: File object
+    """
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        # The umask applies on creation, only the file's owner can widen it again
+        os.fchmod(descriptor, 0o666)
+    except OSError:
+        pass
+    return os.fdopen(descriptor, 'r+')
+
+
+def read_index(f):
+    """
+    Reads the node's last used index from an open index file
+    :param f: File object, from open_index
+    :return: Dictionary of image id to the time it was last used, empty if the index is empty or unreadable
+    """
+    f.seek(0)
+    try:
+        return json.load(f)
+    except ValueError:
+        return dict()
+
+
+def write_index(f, index):
+    """
+    Rewrites the node's last used index in place, the file is replaced rather than renamed over so any user's
+    jobs can keep writing to it
+    :param f: File object, from open_index
+    :param index: Dictionary of image id to the time it was last used
+    :return: Null
+    """
+    f.seek(0)
+    f.truncate()
+    json.dump(index, f)
+    f.flush()
+
+
+def load_index(path):
+    """
+    Reads the node's last used index, waiting for any collection writing it
+    :param path: Path of the index file
+    :return: Dictionary of image id to the time it was last used, empty if there is no readable index
+    """
+    try:
+        with open(path, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            return read_index(f)
+    except (IOError, OSError):
+        return dict()
+
+
+def disk_usage(path):
+    """
+    Returns how full the filesystem holding a path is
+    :param path: Path on the filesystem, i.e. docker's root directory
+    :return: Percentage of the filesystem in use
+    """
+    stats = os.statvfs(path)
+    return 100.0 * (stats.f_blocks - stats.f_bavail) / stats.f_blocks if stats.f_blocks else 0.0
+
+
+def eviction_order(images, in_use, index):
+    """
+    Orders the images that may be removed, least recently used first, the largest first among images used at the
+    same time. Images never recorded as used are removed before any that were
+    :param images: List of image dictionaries, from list_images
+    :param in_use: Set of ids of images used by containers, these are never removed
+    :param index: Dictionary of image id to the time it was last used
+    :return: List of image dictionaries
+    """
+    candidates = [image for image in images if image['id'] not in in_use]
+    return sorted(candidates, key=lambda image: (index.get(image['id'], 0), -image['size']))
+
+
+def collect(run, index_path, docker_root, high, low, used=(), now=None, usage=disk_usage):
+    """
+    Records the images just used, then removes images least recently used first while the disk docker stores
+    images on is above the high watermark, until it is down to the low watermark
+    :param run: Callable running docker with a list of arguments, and returning its output
+    :param index_path: Path of the node's last used index
+    :param docker_root: docker's root directory
+    :param high: Disk usage percentage that starts removal
+    :param low: Disk usage percentage that stops removal
+    :param used: List of image references used by the job that just finished
+    :param now: Time to record images as used at, the current time if None
+    :param usage: Callable returning the disk usage percentage of a path
+    :return: List of ids of the images removed, disk usage percentage afterwards
+    """
+    now = time.time() if now is None else now
+    with open_index(index_path) as f:
+        # Held until the index is written back, so jobs ending together on the node don't lose each other's updates
+        fcntl.flock(f, fcntl.LOCK_EX)
+        previous = read_index(f)
+        images = list_images(run)
+        in_use = images_in_use(run)
+
+        # Only images still on the node are kept in the index
+        index = dict((image['id'], previous[image['id']]) for image in images if image['id'] in previous)
+        used = set(normalise(reference) for reference in used)
+        for image in images:
+            if image['id'] in in_use or used.intersection(image['tags']):
+                index[image['id']] = now
+
+        removed = []
+        current = usage(docker_root)
+        if current >= high:
+            for image in eviction_order(images, in_use, index):
+                if current <= low:
+                    break
+                try:
+                    # Removing every tag removes the image, untagged images are removed by id
+                    run(['rmi'] + (image['tags'] or [image['id']]))
+                except (CalledProcessError, OSError) as ex:
+                    logger.warning("Removing image %s failed: %s" % (image['id'], str(ex)))
+                    continue
+                removed.append(image['id'])
+                index.pop(image['id'], None)
+                current = usage(docker_root)
+
+        write_index(f, index)
+    return removed, current
+
+
+def main(argv=None):
+    """
+    Command line entry point, run on a node at the end of a job
+    :param argv: Command line arguments, sys.argv if None
+    :return: Null
+    """
+    parser = argparse.ArgumentParser(description='Removes least recently used docker images above a disk watermark')
+    parser.add_argument('--index', required=True, help="Path of the node's last used index, shared by all users")
+    parser.add_argument('--root', default='/var/lib/docker', help="docker's root directory")
+    parser.add_argument('--high', type=float, default=85, help="Disk usage percentage that starts removal")
+    parser.add_argument('--low', type=float, default=70, help="Disk usage percentage that stops removal")
+    parser.add_argument('used', nargs='*', help="Images used by the job")
+    args = parser.parse_args(argv)
+
+    try:
+        removed, current = collect(run_docker, args.index, args.root, args.high, args.low, args.used)
+    except (CalledProcessError, OSError, ValueError) as ex:
+        logger.error("Image garbage collection failed: " + str(ex))
+        sys.exit(1)
+    print("%s removed=%d usage=%.1f" % (RESULT_MARKER, len(removed), current))
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main(sys.argv[1:])
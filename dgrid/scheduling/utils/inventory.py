@@ -0,0 +1,95 @@
+"""
+Author: Robert Brennan
+Lists the images a host already has in one command, caching the list on the host's own disk for a time
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# First line of the inventory output when it was read from the host's cache file
+CACHED_MARKER = 'DGRID_CACHED'
+
+# One image per line, references and digests are matched against both of the first two fields
+LIST_FORMAT = '{{.Repository}}:{{.Tag}} {{.Repository}}@{{.Digest}} {{.ID}}'
+
+
+def normalise(image):
+    """
+    Gives an image reference the tag docker would assume, i.e. ubuntu is ubuntu:latest
+    :param image: Image reference
+    :return: Image reference with a tag or digest
+    """
+    if '@' in image or ':' in image.rsplit('/', 1)[-1]:
+        return image
+    return image + ':latest'
+
+
+def inventory_command(cache_path, ttl):
+    """
+    Builds a shell command printing the images on a host. The list is read from the host's cache file
+    when that is younger than ttl seconds, otherwise docker is asked and the cache file rewritten
+    :param cache_path: Path of the cache file on the host
+    :param ttl: Seconds a cached list is used for
+    :return: Command string
+    """
+    return ('f=%s; '
+            'if [ -f "$f" ] && [ $(($(date +%%s) - $(stat -c %%Y "$f"))) -lt %d ]; then echo %s; '
+            "else docker images --no-trunc --format '%s' > \"$f.$$\" && mv \"$f.$$\" \"$f\" || exit 1; fi; "
+            'cat "$f"') % (cache_path, ttl, CACHED_MARKER, LIST_FORMAT)
+
+
+def invalidate_command(cache_path):
+    """
+    Builds a shell command removing a host's cache file, once its images have changed
+    :param cache_path: Path of the cache file on the host
+    :return: Command string
+    """
+    return 'rm -f %s' % cache_path
+
+
+def parse_inventory(output):
+    """
+    Reads the output of the inventory command
+    :param output: Output of the command built by inventory_command
+    :return: Dictionary of image reference to image id, whether the list came from the cache
+    """
+    images = dict()
+    cached = False
+    for line in output.splitlines():
+        if line.strip() == CACHED_MARKER:
+            cached = True
+            continue
+        parts = line.split()
+        if len(parts) != 3:
+            continue
+        tagged, digested, image_id = parts
+        # Untagged images, and images without a registry digest, list <none> in place of a tag or digest
+        for reference in (tagged, digested):
+            if '<none>' not in reference:
+                images[reference] = image_id
+    return images, cached
+
+
+def split_present(images, inventory):
+    """
+    Splits images into those a host has, and those it doesn't
+    :param images: List of image references
+    :param inventory: Dictionary of image reference to image id, from parse_inventory
+    :return: List of images present, list of images missing
+    """
+    present = [image for image in images if normalise(image) in inventory]
+    return present, [image for image in images if normalise(image) not in inventory]
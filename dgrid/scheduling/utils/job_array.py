@@ -0,0 +1,100 @@
+"""
+Author: Robert Brennan
+Reads job array specifications, and splits a job's slots between the sub-jobs of an array running at the same time
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+from collections import OrderedDict
+
+from dgrid.scheduling.utils.Errors import HostValueError
+
+logger = logging.getLogger(__name__)
+
+# Environment variable holding a sub-job's array index, in every one of its containers
+ARRAY_INDEX = 'DGRID_ARRAY_INDEX'
+
+
+def parse_array(spec):
+    """
+    Reads a job array specification, in Torque's qsub -t syntax, i.e. 0-999, 1,4,10-20 or 0-999%8.
+    Ranges may have a step, i.e. 0-99:10
+    :param spec: Array specification
+    :return: List of array indices in order, without repeats, and the limit after % or None
+    """
+    limit = None
+    if '%' in spec:
+        spec, limit = spec.rsplit('%', 1)
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("Array limit must be a positive integer, got %s" % limit)
+        limit = int(limit)
+
+    indices = []
+    seen = set()
+    for part in spec.split(','):
+        part, step = part.split(':', 1) if ':' in part else (part, '1')
+        first, last = part.split('-', 1) if '-' in part else (part, part)
+        if not (first.isdigit() and last.isdigit() and step.isdigit()) or int(step) < 1 or int(first) > int(last):
+            raise ValueError("Invalid array range %s, expected i.e. 0-999, 1,4,10-20 or 0-99:10" % part)
+        for index in range(int(first), int(last) + 1, int(step)):
+            if index not in seen:
+                seen.add(index)
+                indices.append(index)
+    return indices, limit
+
+
+def split_slots(hosts, lanes, head):
+    """
+    Splits a job's slots into lanes, each running one sub-job of an array at a time. Every lane gets one of the
+    head node's slots for its interactive container, the other slots are dealt out between the lanes in turn
+    :param hosts: List of hosts, one entry per slot as in PBS_NODEFILE
+    :param lanes: Number of lanes wanted
+    :param head: Host the interactive containers run on
+    :return: List of host lists, one per lane, fewer than wanted when the head node has fewer slots
+    """
+    head_slots = hosts.count(head)
+    if head_slots == 0:
+        raise HostValueError('Hostname of execution host not in assigned hosts list')
+    if head_slots < lanes:
+        logger.warning("Only %d slots on %s for interactive containers, running %d sub-jobs at a time instead of %d"
+                       % (head_slots, head, head_slots, lanes))
+        lanes = head_slots
+
+    split = [[head] for lane in range(lanes)]
+    rest = list(hosts)
+    for lane in range(lanes):
+        rest.remove(head)
+    for position, host in enumerate(rest):
+        split[position % lanes].append(host)
+    return split
+
+
+def lane_shares(hosts, lanes):
+    """
+    Works out which of each host's slots every lane holds, so lanes sharing a host can be given disjoint parts
+    of the job's cpus on it. A host's slots are numbered in lane order
+    :param hosts: List of hosts, one entry per slot as in PBS_NODEFILE
+    :param lanes: List of host lists, one per lane, as returned by split_slots
+    :return: List of dictionaries, one per lane, of host to (first slot, number of slots, host's total slots) tuple
+    """
+    taken = dict()
+    shares = []
+    for lane in lanes:
+        share = dict()
+        for host in OrderedDict.fromkeys(lane):
+            share[host] = (taken.get(host, 0), lane.count(host), hosts.count(host))
+            taken[host] = taken.get(host, 0) + lane.count(host)
+        shares.append(share)
+    return shares
@@ -0,0 +1,99 @@
+"""
+Author: Robert Brennan
+Builds the shell script that launches a host's containers in a single remote command, and parses its results
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+
+from dgrid.docker.container import Container
+
+logger = logging.getLogger(__name__)
+
+# Prefixes of the lines the script reports results on, all other output is left as is
+LAUNCH_MARKER = 'DGRID_LAUNCH'
+ERROR_MARKER = 'DGRID_ERROR'
+
+# Container attributes holding the limits applied to a container, reported by their docker run option without --
+LIMITS = dict((attribute, option[2:]) for attribute, option in Container.RUN_OPTIONS
+              if attribute in ('cpu_shares', 'cpu_set', 'cpu_mems', 'memory', 'memory_swap', 'memory_swappiness',
+                               'kernel_memory'))
+
+
+def applied_limits(container):
+    # The limits a container already has, as reported on its result line
+    return ''.join(' %s=%s' % (option, getattr(container, attribute)) for attribute, option in sorted(LIMITS.items())
+                   if getattr(container, attribute) is not None)
+
+
+def build_launch_script(containers, pbs_track, job_id, limits=None):
+    """
+    Builds a script that runs, inspects and tracks each container in turn, reporting each container's id, pid,
+    step timings and the limits applied to it on a result line.
+    Containers must already have the job's cgroup limits applied, unless the script reads them itself.
+    :param containers: List of containers to launch on the host
+    :param pbs_track: Path to the pbs_track binary, or None when containers are placed in the job's cgroup instead
+    :param job_id: Job id to track container processes under
+    :param limits: Commands reading the job's limits into limit_args, as built by cgroups.limits_command,
+                   to add them to each docker run. None when the containers already have them
+    :return: Script as a string
+    """
+    lines = ['now() { date +%s%N; }']
+    if limits is not None:
+        lines.append(limits)
+        lines.append('applied=""; for arg in $limit_args; do applied="$applied ${arg#--}"; done')
+
+    for container in containers:
+        fail = '{ echo "%s name=%s step=%%s"; exit 1; }' % (ERROR_MARKER, container.name)
+        run = container.run()
+        if limits is not None:
+            run = run[:2] + ['$limit_args'] + run[2:]
+        lines.append('t0=$(now)')
+        lines.append('container_id=$(%s) || %s' % (' '.join(run), fail % 'run'))
+        lines.append('t1=$(now)')
+        lines.append("pid=$(docker inspect --format '{{ .State.Pid }}' %s) || %s" % (container.name, fail % 'inspect'))
+        if pbs_track is not None:
+            lines.append('%s -j %s -a "$pid" || %s' % (pbs_track, job_id, fail % 'pbs_track'))
+        lines.append('t2=$(now)')
+        lines.append('echo "%s name=%s container_id=$container_id pid=$pid run_ns=$((t1 - t0)) track_ns=$((t2 - t1))%s"'
+                     % (LAUNCH_MARKER, container.name, applied_limits(container) if limits is None else '$applied'))
+
+    return '\n'.join(lines)
+
+
+def parse_launch_results(output):
+    """
+    Reads the result lines reported by a launch script
+    :param output: Output of the launch script
+    :return: List of dictionaries for each container launched, with the limits applied to it in 'limits'
+             as a dictionary of container attribute to value, error dictionary or None
+    """
+    launched = []
+    error = None
+
+    for line in output.splitlines():
+        parts = line.strip().split(' ')
+        if parts[0] not in (LAUNCH_MARKER, ERROR_MARKER):
+            continue
+
+        values = dict(part.split('=', 1) for part in parts[1:] if '=' in part)
+        if parts[0] == LAUNCH_MARKER:
+            values['limits'] = dict((attribute, values.pop(option)) for attribute, option in LIMITS.items()
+                                    if option in values)
+            launched.append(values)
+        else:
+            error = values
+
+    return launched, error
@@ -0,0 +1,146 @@
+"""
+Author: Robert Brennan
+Reads Slurm's node lists, i.e. node[01-04,07],gpu1, and task counts, i.e. 2(x3),1, into host lists
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import re
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils.Errors import HostValueError
+
+logger = logging.getLogger(__name__)
+
+# A task count, repeated for several nodes when followed by (xN)
+COUNT = re.compile(r'^(\d+)(?:\(x(\d+)\))?$')
+
+
+def split_top(nodelist):
+    # Splits a node list at the commas outside brackets
+    parts = ['']
+    depth = 0
+    for char in nodelist:
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth < 0:
+                raise ValueError("Unbalanced ] in node list %s" % nodelist)
+        if char == ',' and depth == 0:
+            parts.append('')
+        else:
+            parts[-1] += char
+    if depth != 0:
+        raise ValueError("Unbalanced [ in node list %s" % nodelist)
+    return parts
+
+
+def expand_range(ranges):
+    """
+    Expands the inside of a bracket, keeping the zero padding of each range's first number
+    :param ranges: i.e. 01-04,07
+    :return: List of numbers as strings, i.e. ['01', '02', '03', '04', '07']
+    """
+    numbers = []
+    for part in ranges.split(','):
+        first, last = part.split('-', 1) if '-' in part else (part, part)
+        if not (first.isdigit() and last.isdigit()) or int(first) > int(last):
+            raise ValueError("Invalid node range %s" % part)
+        numbers.extend(str(number).zfill(len(first)) for number in range(int(first), int(last) + 1))
+    return numbers
+
+
+def expand_name(name):
+    """
+    Expands one name of a node list, each bracket multiplies the names, i.e. rack[1-2]-node[1-2] is 4 nodes
+    :param name: Name, with brackets or without
+    :return: List of node names
+    """
+    start = name.find('[')
+    if start < 0:
+        if ']' in name or not name:
+            raise ValueError("Invalid node name %s" % name)
+        return [name]
+    end = name.index(']', start)
+    rests = expand_name(name[end + 1:]) if name[end + 1:] else ['']
+    return [name[:start] + number + rest for number in expand_range(name[start + 1:end]) for rest in rests]
+
+
+def expand_nodelist(nodelist):
+    """
+    Expands a node list in Slurm's compressed form, i.e. node[01-04,07],gpu[1-2]-ib,login1
+    :param nodelist: Node list, as in SLURM_JOB_NODELIST
+    :return: List of node names, in order
+    """
+    nodes = []
+    for name in split_top(nodelist.strip()):
+        nodes.extend(expand_name(name))
+    return nodes
+
+
+def expand_counts(counts):
+    """
+    Expands a task count list, as in SLURM_TASKS_PER_NODE, i.e. 2(x3),1 for 2 tasks on 3 nodes then 1 on a fourth
+    :param counts: Count list
+    :return: List of counts, one per node
+    """
+    expanded = []
+    for part in counts.split(','):
+        match = COUNT.match(part.strip())
+        if match is None:
+            raise ValueError("Invalid task count %s" % part)
+        expanded.extend([int(match.group(1))] * int(match.group(2) or 1))
+    return expanded
+
+
+def read_nodelist(nodelist, scontrol='scontrol'):
+    """
+    Expands a node list, asking scontrol for any syntax not read here
+    :param nodelist: Node list, as in SLURM_JOB_NODELIST
+    :param scontrol: scontrol binary
+    :return: List of node names, in order
+    """
+    try:
+        return expand_nodelist(nodelist)
+    except ValueError as ex:
+        logger.debug("%s, expanding with scontrol" % str(ex))
+
+    proc = Popen([scontrol, 'show', 'hostnames', nodelist], stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise HostValueError("Can't expand node list %s: %s" % (nodelist, err.decode('utf-8').strip()))
+    return out.decode('utf-8').split()
+
+
+def slurm_hosts(nodelist, tasks_per_node=None, scontrol='scontrol'):
+    """
+    Builds the job's host list, with each node repeated once per task as Torque's PBS_NODEFILE does
+    :param nodelist: Node list, as in SLURM_JOB_NODELIST
+    :param tasks_per_node: Task counts, as in SLURM_TASKS_PER_NODE, one task per node if None
+    :param scontrol: scontrol binary
+    :return: List of hosts
+    """
+    if not nodelist:
+        raise HostValueError('SLURM_JOB_NODELIST is not set, dgrid must run inside a Slurm allocation')
+    nodes = read_nodelist(nodelist, scontrol)
+    counts = expand_counts(tasks_per_node) if tasks_per_node else [1] * len(nodes)
+    if len(counts) != len(nodes):
+        raise HostValueError("%d task counts for %d nodes in %s" % (len(counts), len(nodes), nodelist))
+
+    hosts = []
+    for node, count in zip(nodes, counts):
+        hosts.extend([node] * count)
+    return hosts
@@ -0,0 +1,188 @@
+"""
+Author: Robert Brennan
+Splits a job's cpuset into disjoint slices for co-located containers, keeping each slice inside NUMA nodes
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import glob
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+NODE_DIR = '/sys/devices/system/node'
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parses a kernel cpu list i.e. 0-3,8,10-11
+    :param cpu_list: cpu list string
+    :return: Sorted list of cpu numbers
+    """
+    cpus = set()
+    for part in cpu_list.strip().split(','):
+        if part == '':
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """
+    Formats cpu numbers as a kernel cpu list, collapsing consecutive numbers into ranges
+    :param cpus: Iterable of cpu numbers
+    :return: cpu list string
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(start) if start == end else '%d-%d' % (start, end) for start, end in ranges)
+
+
+def read_topology(node_dir=NODE_DIR):
+    """
+    Reads the cpus of each NUMA node on this machine from sysfs
+    :param node_dir: sysfs NUMA node directory
+    :return: OrderedDict of node number to list of cpus, empty when there is no NUMA information
+    """
+    nodes = dict()
+    for path in glob.glob(node_dir + '/node[0-9]*/cpulist'):
+        with open(path, 'r') as f:
+            nodes[int(os.path.basename(os.path.dirname(path))[4:])] = parse_cpu_list(f.read())
+    return OrderedDict(sorted(nodes.items()))
+
+
+def topology_command(node_dir=NODE_DIR):
+    """
+    Builds a shell command printing each NUMA node's cpus as node=cpulist lines
+    :param node_dir: sysfs NUMA node directory
+    :return: Command string
+    """
+    return 'for d in %s/node[0-9]*; do [ -r "$d/cpulist" ] && echo "${d##*/node}=$(cat "$d/cpulist")"; done; true' \
+           % node_dir
+
+
+def read_remote_topology(run, node_dir=NODE_DIR):
+    """
+    Reads the NUMA topology of a remote machine in a single command
+    :param run: Callable running a command string on the remote machine, and returning its output
+    :param node_dir: sysfs NUMA node directory
+    :return: OrderedDict of node number to list of cpus
+    """
+    return parse_topology(run(topology_command(node_dir)))
+
+
+def parse_topology(output):
+    """
+    Reads the NUMA topology from the output of the topology command, other lines are skipped
+    :param output: Output of the command built by topology_command
+    :return: OrderedDict of node number to list of cpus
+    """
+    nodes = dict()
+    for line in output.splitlines():
+        node, sep, cpu_list = line.partition('=')
+        if sep and node.isdigit():
+            nodes[int(node)] = parse_cpu_list(cpu_list)
+    return OrderedDict(sorted(nodes.items()))
+
+
+def split_evenly(items, count):
+    # Splits a list into count consecutive chunks, sizes differing by at most one
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def allocate(count, sizes):
+    """
+    Shares out count containers among NUMA nodes in proportion to their cpus, never more than a node has cpus.
+    Uses the largest remainder method
+    :param count: Number of containers
+    :param sizes: List of cpu counts of each node
+    :return: List of container counts for each node
+    """
+    total = sum(sizes)
+    shares = [count * size / float(total) for size in sizes]
+    counts = [min(int(share), size) for share, size in zip(shares, sizes)]
+    order = sorted(range(len(sizes)), key=lambda i: shares[i] - counts[i], reverse=True)
+    while sum(counts) < count:
+        for i in order:
+            if sum(counts) < count and counts[i] < sizes[i]:
+                counts[i] += 1
+    return counts
+
+
+def partition(cpus, topology, count):
+    """
+    Splits a cpuset into disjoint slices, one per container.
+    With fewer containers than NUMA nodes each container gets whole nodes,
+    otherwise the containers are shared out among the nodes and each node's cpus are split between its containers.
+    :param cpus: List of the job's cpus on the host
+    :param topology: OrderedDict of NUMA node number to its cpus, may be empty
+    :param count: Number of containers to split the cpuset between
+    :return: List of (cpus, memory nodes) tuples, memory nodes is None without NUMA information.
+             None when there are fewer cpus than containers
+    """
+    if count < 1 or len(cpus) < count:
+        return None
+
+    job_cpus = set(cpus)
+    groups = [(node, sorted(job_cpus.intersection(node_cpus))) for node, node_cpus in topology.items()]
+    groups = [(node, node_cpus) for node, node_cpus in groups if node_cpus]
+
+    # cpus missing from the topology are kept together, without a memory node
+    known = set(cpu for node, node_cpus in groups for cpu in node_cpus)
+    unknown = sorted(job_cpus - known)
+    if unknown:
+        groups.append((None, unknown))
+
+    slices = []
+    if count <= len(groups):
+        for chunk in split_evenly(groups, count):
+            nodes = [node for node, node_cpus in chunk]
+            slice_cpus = [cpu for node, node_cpus in chunk for cpu in node_cpus]
+            slices.append((slice_cpus, None if None in nodes else nodes))
+    else:
+        counts = allocate(count, [len(node_cpus) for node, node_cpus in groups])
+        for (node, node_cpus), node_count in zip(groups, counts):
+            if node_count == 0:
+                continue
+            for slice_cpus in split_evenly(node_cpus, node_count):
+                slices.append((slice_cpus, None if node is None else [node]))
+    return slices
+
+
+def split_memory(memory, slices):
+    """
+    Splits a memory limit between slices, in proportion to each slice's cpus
+    :param memory: Memory limit in bytes
+    :param slices: List of (cpus, memory nodes) tuples
+    :return: List of memory limits in bytes
+    """
+    total = sum(len(slice_cpus) for slice_cpus, nodes in slices)
+    return [memory * len(slice_cpus) // total for slice_cpus, nodes in slices]
@@ -0,0 +1,209 @@
+"""
+Author: Robert Brennan
+Runs remote commands through the system ssh binary, multiplexed over one ControlMaster connection per host.
+Commands for many hosts are kept in flight at once on a single poll loop.
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import select
+import shutil
+import tempfile
+import threading
+from collections import deque
+from subprocess import Popen, PIPE, STDOUT
+
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+logger = logging.getLogger(__name__)
+
+
+def split_host(host):
+    """
+    Splits a Fabric style host string
+    :param host: Host string i.e. user@host:port
+    :return: user or None, hostname, port or None
+    """
+    user = None
+    if '@' in host:
+        user, host = host.split('@', 1)
+    port = None
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+    return user, host, port
+
+
+class OpenSSHPool(object):
+    """
+    Runs commands over the system ssh binary.
+    The first command to a host opens a ControlMaster connection that later commands are multiplexed over.
+    Has the same run, stats and close_all methods as SSHConnectionPool, plus run_all for running many at once.
+    """
+
+    def __init__(self, ssh_binary='ssh', options=None, control_persist='10m'):
+        """
+        :param ssh_binary: Path to the ssh binary
+        :param options: List of extra ssh options i.e. ['-o', 'StrictHostKeyChecking=no']
+        :param control_persist: How long an idle master connection is kept open for
+        """
+        self.ssh_binary = ssh_binary
+        self.options = options or []
+        self.control_persist = control_persist
+        # Kept short, unix socket paths are limited to around 100 characters
+        self.control_dir = tempfile.mkdtemp(prefix='dgrid-ssh-')
+        self.lock = threading.Lock()
+        self.hosts = set()
+        self.opened = 0
+        self.reused = 0
+
+    def ssh_command(self, host, command):
+        """
+        Builds the ssh command line to run a command on a host
+        :param host: Host string i.e. user@host:port
+        :param command: Command string to execute
+        :return: Command list for Popen
+        """
+        user, hostname, port = split_host(host)
+        ssh = [self.ssh_binary,
+               '-o', 'ControlMaster=auto',
+               '-o', 'ControlPath=' + self.control_dir + '/%r@%h:%p',
+               '-o', 'ControlPersist=' + self.control_persist,
+               '-o', 'BatchMode=yes'] + self.options
+        if port is not None:
+            ssh += ['-p', port]
+        if user is not None:
+            ssh += ['-l', user]
+        return ssh + [hostname, command]
+
+    def count(self, host):
+        # Counts whether a command opens a host's master connection, or reuses it
+        with self.lock:
+            if host in self.hosts:
+                self.reused += 1
+            else:
+                self.hosts.add(host)
+                self.opened += 1
+
+    def start(self, host, command):
+        # Starts a command, stdin is closed so ssh never waits on it
+        self.count(host)
+        with open(os.devnull, 'r') as devnull:
+            return Popen(self.ssh_command(host, command), stdin=devnull, stdout=PIPE, stderr=STDOUT)
+
+    def run(self, host, command, warn_only=False):
+        """
+        Runs a command on a host, stderr is combined with stdout
+        :param host: Host to run command on
+        :param command: Command string to execute
+        :param warn_only: Log a warning instead of raising when the command fails
+        :return: Output of the command, with trailing newlines removed
+        """
+        process = self.start(host, command)
+        output = process.communicate()[0]
+        return self.result(host, command, process.returncode, output, warn_only)
+
+    def run_all(self, jobs, concurrency=256, stop_on_failure=False):
+        """
+        Runs many commands at once, at most concurrency at a time, reading their output on one poll loop
+        :param jobs: List of (host, command) tuples
+        :param concurrency: Maximum number of commands running at once
+        :param stop_on_failure: Start no further commands once one has failed
+        :return: List of (exit code, output) tuples in the order of jobs, None for jobs never started
+        """
+        results = [None] * len(jobs)
+        pending = deque(enumerate(jobs))
+        running = dict()
+        poller = select.poll()
+        failed = False
+
+        while pending or running:
+            while pending and len(running) < concurrency and not (stop_on_failure and failed):
+                index, (host, command) = pending.popleft()
+                process = self.start(host, command)
+                running[process.stdout.fileno()] = (index, process, [])
+                poller.register(process.stdout.fileno(), select.POLLIN | select.POLLHUP)
+
+            if not running:
+                break
+
+            for fd, event in poller.poll(500):
+                index, process, chunks = running[fd]
+                data = os.read(fd, 65536)
+                if data:
+                    chunks.append(data)
+                    continue
+
+                # EOF, the command has finished
+                poller.unregister(fd)
+                del running[fd]
+                process.stdout.close()
+                exit_code = process.wait()
+                results[index] = (exit_code, self.decode(b''.join(chunks)))
+                failed = failed or exit_code != 0
+        return results
+
+    def decode(self, output):
+        # Output as text, with trailing newlines removed
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
+        return output.rstrip('\r\n')
+
+    def result(self, host, command, exit_code, output, warn_only=False):
+        """
+        Logs the output of a command, and checks its exit code
+        :param host: Host the command ran on
+        :param command: Command string executed
+        :param exit_code: Exit code of the command
+        :param output: Output of the command
+        :param warn_only: Log a warning instead of raising when the command failed
+        :return: Output of the command, with trailing newlines removed
+        """
+        output = self.decode(output)
+        for line in output.splitlines():
+            logger.debug("[%s] out: %s" % (host, line))
+
+        if exit_code != 0:
+            message = "%s failed on %s with exit code %d" % (command, host, exit_code)
+            if not warn_only:
+                raise RemoteExecutionError(message)
+            logger.warning(message)
+        return output
+
+    def stats(self):
+        """
+        Returns how many master connections were opened, and how many commands reused one
+        :return: Dictionary of connection counts
+        """
+        with self.lock:
+            return {'opened': self.opened, 'reused': self.reused}
+
+    def close_all(self):
+        """
+        Closes every master connection, and removes their control sockets
+        :return: Null
+        """
+        with self.lock:
+            hosts = list(self.hosts)
+            self.hosts.clear()
+
+        for host in hosts:
+            logger.debug("Closing SSH master connection to " + host)
+            command = self.ssh_command(host, '')
+            # Replace the remote command with the master's exit request
+            command = command[:-2] + ['-O', 'exit', command[-2]]
+            with open(os.devnull, 'w') as devnull:
+                Popen(command, stdout=devnull, stderr=devnull).wait()
+        shutil.rmtree(self.control_dir, ignore_errors=True)
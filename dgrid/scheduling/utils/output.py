@@ -0,0 +1,84 @@
+"""
+Author: Robert Brennan
+Streams the stdout and stderr of a subprocess at the same time, in the order lines are written
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+# Seconds from an arbitrary point, unaffected by changes to the system clock. time.monotonic is Python 3 only,
+# on Python 2 os.times' elapsed real time is used, counted in clock ticks (1/100s on Linux)
+clock = getattr(time, 'monotonic', lambda: os.times()[4])
+
+
+def read_lines(pipe, stream, lines):
+    # Reads a pipe until EOF, queueing each line tagged with its stream and the time it was read
+    try:
+        for line in iter(pipe.readline, b''):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            lines.put((stream, clock(), line.rstrip('\r\n')))
+    finally:
+        pipe.close()
+        lines.put((stream, clock(), None))
+
+
+def stream_output(process, handle, buffer_lines=1000):
+    """
+    Drains a process's stdout and stderr at the same time on reader threads, so neither pipe can fill and stall it.
+    Lines are handed on in the order they were read. When the handler falls behind, the readers block once
+    buffer_lines lines are waiting, leaving the rest in the pipes
+    :param process: An instance of Subprocess.Popen, with stdout and/or stderr set to PIPE
+    :param handle: Called with (stream, timestamp, line) for each line, stream is STDOUT or STDERR
+    :param buffer_lines: Maximum number of lines read ahead of the handler
+    :return: Exit code of the process
+    """
+    lines = Queue(buffer_lines)
+    readers = []
+    for pipe, stream in ((process.stdout, STDOUT), (process.stderr, STDERR)):
+        if pipe is not None:
+            reader = threading.Thread(target=read_lines, args=(pipe, stream, lines))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+
+    open_streams = len(readers)
+    while open_streams > 0:
+        try:
+            # A timed wait, an untimed one can't be interrupted by the job's termination signal on Python 2
+            stream, timestamp, line = lines.get(True, 0.5)
+        except Empty:
+            continue
+        if line is None:
+            open_streams -= 1
+        else:
+            handle(stream, timestamp, line)
+
+    for reader in readers:
+        reader.join()
+    return process.wait()
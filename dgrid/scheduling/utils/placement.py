@@ -0,0 +1,124 @@
+"""
+Author: Robert Brennan
+Places containers onto the slots the scheduler allocated on each host
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+from collections import OrderedDict
+
+from dgrid.scheduling.utils.Errors import PlacementError
+
+logger = logging.getLogger(__name__)
+
+
+def host_slots(hosts):
+    """
+    Counts the slots allocated on each host. Schedulers such as Torque list a host once per allocated core
+    :param hosts: List of hosts, with a host repeated for each slot allocated on it
+    :return: OrderedDict of host to slot count, in order of each host's first appearance
+    """
+    slots = OrderedDict()
+    for host in hosts:
+        slots[host] = slots.get(host, 0) + 1
+    return slots
+
+
+def pack(count, slots):
+    """
+    Fills each host's slots before moving on to the next host
+    :param count: Number of containers to place
+    :param slots: OrderedDict of host to free slot count
+    :return: List of hosts, one per container
+    """
+    placement = []
+    for host, free in slots.items():
+        placement += [host] * min(free, count - len(placement))
+    return placement
+
+
+def spread(count, slots):
+    """
+    Places each container on the host with the most free slots remaining
+    :param count: Number of containers to place
+    :param slots: OrderedDict of host to free slot count
+    :return: List of hosts, one per container
+    """
+    free = OrderedDict(slots)
+    placement = []
+    for i in range(count):
+        # max returns the first host in order on a tie
+        host = max(free, key=lambda h: free[h])
+        placement.append(host)
+        free[host] -= 1
+    return placement
+
+
+def round_robin(count, slots):
+    """
+    Places one container on each host with a free slot in turn
+    :param count: Number of containers to place
+    :param slots: OrderedDict of host to free slot count
+    :return: List of hosts, one per container
+    """
+    free = OrderedDict(slots)
+    placement = []
+    while len(placement) < count:
+        for host in free:
+            if free[host] > 0 and len(placement) < count:
+                placement.append(host)
+                free[host] -= 1
+    return placement
+
+
+# Placement strategies by name, as set in settings.placement_strategy.
+# A strategy takes the number of containers and an OrderedDict of host to free slots, and returns a host per container
+STRATEGIES = {'pack': pack,
+              'spread': spread,
+              'round-robin': round_robin}
+
+
+def place(containers, slots, strategy='pack'):
+    """
+    Assigns a host to each container
+    :param containers: List of containers to place
+    :param slots: OrderedDict of host to free slot count
+    :param strategy: Name of the placement strategy to use
+    :return: List of (host, container) tuples
+    """
+    if strategy not in STRATEGIES:
+        raise PlacementError("Unknown placement strategy %s, expected one of %s"
+                             % (strategy, ", ".join(sorted(STRATEGIES))))
+
+    available = sum(free for free in slots.values() if free > 0)
+    if len(containers) > available:
+        raise PlacementError("Not enough slots assigned to job. %d containers for %d free slots"
+                             % (len(containers), available))
+
+    free = OrderedDict((host, count) for host, count in slots.items() if count > 0)
+    hosts = STRATEGIES[strategy](len(containers), free)
+    return list(zip(hosts, containers))
+
+
+def placement_map(assignments):
+    """
+    Groups a placement by host
+    :param assignments: List of (host, container) tuples
+    :return: OrderedDict of host to the list of containers placed on it
+    """
+    hosts = OrderedDict()
+    for host, container in assignments:
+        hosts.setdefault(host, []).append(container)
+    return hosts
@@ -0,0 +1,141 @@
+"""
+Author: Robert Brennan
+Registry of scheduler and executor backends. Backends shipped with dgrid are known without looking,
+others are discovered once from installed packages' entry points, and only the selected backend is imported
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib
+import logging
+import threading
+
+from dgrid.scheduling.utils.Errors import PluginNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Entry point groups packages register backends in, as name = module:Class
+SCHEDULERS = 'dgrid.schedulers'
+EXECUTORS = 'dgrid.executors'
+
+# Backends shipped with dgrid, also registered in setup.py. Listed here so they are found without scanning
+# the installed packages, and from a source checkout
+BUILTIN = {
+    SCHEDULERS: {
+        'Torque6': 'dgrid.scheduling.schedulers.Torque6.Torque6:Torque6',
+        'Slurm': 'dgrid.scheduling.schedulers.Slurm.Slurm:Slurm',
+    },
+    EXECUTORS: {
+        'SSH': 'dgrid.scheduling.schedulers.Torque6.SSHExecutor:SSHExecutor',
+        'ASYNC_SSH': 'dgrid.scheduling.schedulers.Torque6.AsyncSSHExecutor:AsyncSSHExecutor',
+        'TM': 'dgrid.scheduling.schedulers.Torque6.TMExecutor:TMExecutor',
+        'SRUN': 'dgrid.scheduling.schedulers.Slurm.SrunExecutor:SrunExecutor',
+    },
+}
+
+_discovered = dict()
+_lock = threading.Lock()
+
+
+def entry_points(group):
+    """
+    Reads the entry points of a group from the installed packages, with importlib.metadata where available
+    and pkg_resources otherwise
+    :param group: Entry point group
+    :return: List of (name, module:attribute) tuples
+    """
+    try:
+        from importlib.metadata import entry_points as installed
+    except ImportError:
+        import pkg_resources
+        return [(point.name, '%s:%s' % (point.module_name, '.'.join(point.attrs)))
+                for point in pkg_resources.iter_entry_points(group)]
+
+    points = installed()
+    points = points.select(group=group) if hasattr(points, 'select') else points.get(group, [])
+    return [(point.name, point.value) for point in points]
+
+
+def discover(group):
+    """
+    Finds the backends of a group. The installed packages are only scanned the first time
+    :param group: Entry point group
+    :return: Dictionary of backend name to module:attribute, including dgrid's own backends
+    """
+    with _lock:
+        if group in _discovered:
+            return _discovered[group]
+
+        found = dict(BUILTIN.get(group, {}))
+        for name, target in entry_points(group):
+            if name in found and found[name] != target:
+                # dgrid's own backends can't be replaced by a plugin
+                logger.warning("Ignoring %s backend %s = %s, %s is already %s" % (group, name, target, name,
+                                                                                 found[name]))
+                continue
+            found[name] = target
+        _discovered[group] = found
+        return found
+
+
+def match(backends, name):
+    # Backend of the name, ignoring case, None if there isn't one
+    if name in backends:
+        return backends[name]
+    for known in backends:
+        if known.lower() == name.lower():
+            return backends[known]
+    return None
+
+
+def lookup(group, name, default=None):
+    """
+    Finds where a backend is, by name. Names are matched ignoring case
+    :param group: Entry point group
+    :param name: Backend name from the settings
+    :param default: module:attribute to try when no backend has the name, or None
+    :return: module:attribute of the backend
+    """
+    # dgrid's own backends are found without scanning the installed packages
+    target = match(BUILTIN.get(group, {}), name) or match(discover(group), name) or default
+    if target is None:
+        raise PluginNotFoundError("No %s backend named %s, available: %s"
+                                  % (group, name, ", ".join(sorted(discover(group)))))
+    return target
+
+
+def load(group, name, default=None):
+    """
+    Imports a backend, and only that backend
+    :param group: Entry point group
+    :param name: Backend name from the settings
+    :param default: module:attribute to try when no backend has the name, or None
+    :return: Backend class
+    """
+    target = lookup(group, name, default)
+    logger.debug("Loading %s backend %s from %s" % (group, name, target))
+    module_name, attribute = target.split(':', 1)
+    backend = importlib.import_module(module_name)
+    try:
+        for part in attribute.split('.'):
+            backend = getattr(backend, part)
+    except AttributeError:
+        raise PluginNotFoundError("%s backend %s: %s has no %s" % (group, name, module_name, attribute))
+    return backend
+
+
+def clear_cache():
+    # Forgets the discovered backends, the installed packages are scanned again on the next lookup
+    with _lock:
+        _discovered.clear()
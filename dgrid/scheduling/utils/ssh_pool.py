@@ -0,0 +1,159 @@
+"""
+Author: Robert Brennan
+Pool of persistent SSH connections, one per host, shared by every phase of a job
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import threading
+
+try:
+    from pipes import quote
+except ImportError:
+    from shlex import quote
+
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+logger = logging.getLogger(__name__)
+
+
+def fabric_connect(host):
+    """
+    Opens an SSH connection to a host, authenticated with Fabric's env settings (user, keys, passwords, gateway)
+    :param host: Fabric host string i.e. user@host:port
+    :return: Connected paramiko SSHClient
+    """
+    # Fabric is imported on the first connection, the ASYNC_SSH executor never needs it
+    from fabric.network import connect, normalize
+    from fabric.state import connections, env
+
+    # Get Fabric to throw an RemoteExecutionError when remote commands fail, instead of aborting
+    env.abort_exception = RemoteExecutionError
+    user, hostname, port = normalize(host)
+    return connect(user, hostname, port, connections)
+
+
+class SSHConnectionPool(object):
+    """
+    Keeps one authenticated transport open per host for the whole job.
+    Every remote command is run on its own channel, multiplexed over the host's transport.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, connect=fabric_connect, shell='/bin/bash -l -c'):
+        """
+        :param connect: Callable taking a host string and returning a connected paramiko SSHClient
+        :param shell: Shell commands are wrapped in, a login shell by default as Fabric's run does,
+                      so the remote login profile i.e. PATH applies. None to run commands as given
+        """
+        self.connect = connect
+        self.shell = shell
+        self.clients = dict()
+        self.host_locks = dict()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def get_transport(self, host):
+        """
+        Returns the transport for a host, connecting only if there is no live transport for it already
+        :param host: Host string to connect to
+        :return: paramiko Transport
+        """
+        with self.lock:
+            host_lock = self.host_locks.setdefault(host, threading.Lock())
+
+        # Lock per host, so one slow handshake doesn't hold up the other hosts
+        with host_lock:
+            client = self.clients.get(host)
+            if client is not None and client.get_transport() is not None and client.get_transport().is_active():
+                with self.lock:
+                    self.reused += 1
+                return client.get_transport()
+
+            # A dead transport's client still holds its socket and reader thread
+            if client is not None:
+                logger.debug("Replacing dead SSH connection to " + host)
+                client.close()
+
+            logger.debug("Opening SSH connection to " + host)
+            client = self.connect(host)
+            with self.lock:
+                self.clients[host] = client
+                self.opened += 1
+            return client.get_transport()
+
+    def wrap(self, command):
+        """
+        Wraps a command in the pool's shell
+        :param command: Command string to execute
+        :return: Command string sent to the host
+        """
+        if not self.shell:
+            return command
+        return "%s %s" % (self.shell, quote(command))
+
+    def run(self, host, command, warn_only=False):
+        """
+        Runs a command on a host over a new channel of the pooled transport, in the pool's shell.
+        Stderr is combined with stdout, as Fabric's run does by default
+        :param host: Host to run command on
+        :param command: Command string to execute
+        :param warn_only: Log a warning instead of raising when the command fails
+        :return: Output of the command, with trailing newlines removed
+        """
+        channel = self.get_transport(host).open_session()
+        try:
+            channel.set_combine_stderr(True)
+            channel.exec_command(self.wrap(command))
+            output = channel.makefile('rb', -1).read()
+            exit_code = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
+        output = output.rstrip('\r\n')
+
+        for line in output.splitlines():
+            logger.debug("[%s] out: %s" % (host, line))
+
+        if exit_code != 0:
+            message = "%s failed on %s with exit code %d" % (command, host, exit_code)
+            if not warn_only:
+                raise RemoteExecutionError(message)
+            logger.warning(message)
+        return output
+
+    def stats(self):
+        """
+        Returns how many connections were opened, and how many times an open connection was reused
+        :return: Dictionary of connection counts
+        """
+        with self.lock:
+            return {'opened': self.opened, 'reused': self.reused}
+
+    def close_all(self):
+        """
+        Closes every pooled connection
+        :return: Null
+        """
+        with self.lock:
+            clients = list(self.clients.items())
+            self.clients.clear()
+
+        for host, client in clients:
+            logger.debug("Closing SSH connection to " + host)
+            client.close()
@@ -0,0 +1,45 @@
+"""
+Author: Robert Brennan
+Works out which images each host needs before launch, and builds the command pulling them
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def host_images(assignments):
+    """
+    Collects the distinct images needed on each host
+    :param assignments: List of (host, container) tuples
+    :return: OrderedDict of host to list of images, in the order they are first needed
+    """
+    images = OrderedDict()
+    for host, container in assignments:
+        needed = images.setdefault(host, [])
+        if container.image not in needed:
+            needed.append(container.image)
+    return images
+
+
+def pull_command(images):
+    """
+    Builds a shell command pulling images one after another, stopping at the first failure
+    :param images: List of image names
+    :return: Command string
+    """
+    return ' && '.join('docker pull %s > /dev/null' % image for image in images)
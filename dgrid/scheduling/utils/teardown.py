@@ -0,0 +1,93 @@
+"""
+Author: Robert Brennan
+Builds the commands stopping and removing all of a host's containers at once, and cleaning up its images
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def teardown_command(containers, stop_timeout=None):
+    """
+    Builds a shell command stopping a host's containers together, so their grace periods run at the same time,
+    then force removing them and their volumes. Containers are removed even if stopping some of them failed
+    :param containers: List of containers on the host
+    :param stop_timeout: Seconds docker waits for the containers to stop before killing them, docker's default if None
+    :return: Command string
+    """
+    names = ' '.join(container.name for container in containers)
+    stop = 'docker stop' if stop_timeout is None else 'docker stop -t %d' % stop_timeout
+    return '%s %s; docker rm -fv %s' % (stop, names, names)
+
+
+# Image cleanup actions, taken at most once per host
+UNREFERENCED = 'unreferenced'
+UNUSED = 'unused'
+RMI = 'rmi'
+GC = 'gc'
+
+
+def cleanup_plan(containers, image_cleanup, remove_unreferenced=False, local_host=None, local_containers=()):
+    """
+    Plans the image cleanup of each host a container ran on, taking each action only once per host
+    however many containers ran there
+    :param containers: List of remote containers, those without an execution host are skipped
+    :param image_cleanup: 1 to remove all unused images, 2 to remove the job's images,
+                          3 to garbage collect least recently used images
+    :param remove_unreferenced: Whether unreferenced containers are removed first
+    :param local_host: Host the job runs on
+    :param local_containers: List of containers run on local_host outside of the placement, i.e. the interactive
+                             container, planned with the containers placed on the same host
+    :return: OrderedDict of host to list of (action, image or None) tuples, in the order they are taken
+    """
+    plan = OrderedDict()
+    placed = [(local_host, container) for container in local_containers]
+    placed.extend((container.execution_host, container) for container in containers)
+    for host, container in placed:
+        if host is None:
+            continue
+
+        wanted = []
+        if remove_unreferenced:
+            wanted.append((UNREFERENCED, None))
+        if image_cleanup == 1:
+            wanted.append((UNUSED, None))
+        if image_cleanup == 2:
+            wanted.append((RMI, container.image))
+        if image_cleanup == 3:
+            wanted.append((GC, container.image))
+
+        actions = plan.setdefault(host, [])
+        actions.extend(action for action in wanted if action not in actions)
+    return plan
+
+
+def cleanup_command(actions, scripts):
+    """
+    Builds a shell command taking a host's cleanup actions, with all of the host's images removed by one docker rmi,
+    or recorded as used by one garbage collection
+    :param actions: List of (action, image or None) tuples, from cleanup_plan
+    :param scripts: Dictionary of UNREFERENCED, UNUSED and GC to the commands running their cleanup
+    :return: Command string
+    """
+    commands = [scripts[action] for action, image in actions if action in (UNREFERENCED, UNUSED)]
+    for action, command in ((RMI, 'docker rmi'), (GC, scripts.get(GC))):
+        images = [image for taken, image in actions if taken == action]
+        if images:
+            commands.append(command + ' ' + ' '.join(images))
+    return '; '.join(commands)
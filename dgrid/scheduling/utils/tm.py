@@ -0,0 +1,242 @@
+"""
+Author: Robert Brennan
+Runs commands on a Torque job's nodes through the task manager, with pbsdsh
+
+    Copyright (C) 2017  Robert James Brennan
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from subprocess import Popen, PIPE, STDOUT
+
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+logger = logging.getLogger(__name__)
+
+# Prefixes of the lines a task's output is reported on, and of the line reporting its exit code
+TASK_MARKER = 'DGRID_TASK'
+EXIT_MARKER = 'DGRID_EXIT'
+
+
+def vnode_map(vnodes):
+    """
+    Numbers the virtual nodes of each host. Torque numbers a job's virtual nodes in PBS_NODEFILE order,
+    and pbsdsh tells each task its virtual node in PBS_VNODENUM
+    :param vnodes: List of hosts, one entry per virtual node as in PBS_NODEFILE
+    :return: OrderedDict of host to its list of virtual node numbers
+    """
+    numbers = OrderedDict()
+    for number, host in enumerate(vnodes):
+        numbers.setdefault(host, []).append(number)
+    return numbers
+
+
+def fanout_script(jobs, numbers):
+    """
+    Builds the script every task of a fan-out runs, each task running the command of the host it was spawned on.
+    Output lines are prefixed with the job's position, as pbsdsh interleaves the output of all tasks
+    :param jobs: List of (host, command) tuples, one per host
+    :param numbers: OrderedDict of host to its virtual node numbers, as returned by vnode_map
+    :return: Script as a string
+    """
+    lines = ['case "$PBS_VNODENUM" in']
+    for position, (host, command) in enumerate(jobs):
+        lines.append('%s)' % '|'.join(str(number) for number in numbers[host]))
+        lines.append('{ (')
+        lines.append(command)
+        lines.append(') 2>&1; echo "%s $?"; } | sed "s/^/%s %d /"' % (EXIT_MARKER, TASK_MARKER, position))
+        lines.append(';;')
+    lines.append('esac')
+    return '\n'.join(lines) + '\n'
+
+
+def parse_fanout(output, count):
+    """
+    Splits the output of a fan-out between its jobs
+    :param output: Output of pbsdsh
+    :param count: Number of jobs in the fan-out
+    :return: List of (exit code or None if the task never reported one, output lines) tuples in the order of jobs,
+             and the lines not from any task
+    """
+    results = [(None, []) for position in range(count)]
+    other = []
+    for line in output.splitlines():
+        parts = line.split(' ', 2)
+        if len(parts) < 2 or parts[0] != TASK_MARKER or not parts[1].isdigit() or int(parts[1]) >= count:
+            other.append(line)
+            continue
+        exit_code, lines = results[int(parts[1])]
+        text = parts[2] if len(parts) > 2 else ''
+        if text.startswith(EXIT_MARKER + ' ') and text.split(' ', 1)[1].isdigit():
+            results[int(parts[1])] = (int(text.split(' ', 1)[1]), lines)
+        else:
+            lines.append(text)
+    return results, other
+
+
+class TMPool(object):
+    """
+    Runs commands on the job's nodes as Torque tasks, spawned by pbsdsh through the task manager instead of over SSH.
+    The commands of many hosts run in a single pbsdsh fan-out, each task picking its host's command.
+    Has the same run, run_all, result, stats and close_all methods as OpenSSHPool
+    """
+
+    def __init__(self, vnodes, pbsdsh_binary='pbsdsh', options=None, script_dir=None):
+        """
+        :param vnodes: List of the job's hosts, one entry per virtual node as in PBS_NODEFILE
+        :param pbsdsh_binary: Path to the pbsdsh binary
+        :param options: List of extra pbsdsh options
+        :param script_dir: Directory the fan-out scripts are written to, every node must be able to read it.
+                           A temporary directory if None
+        """
+        self.numbers = vnode_map(vnodes)
+        self.pbsdsh_binary = pbsdsh_binary
+        self.options = options or []
+        # Only a directory the pool created is removed by close_all
+        self.created = script_dir is None or not os.path.isdir(script_dir)
+        self.script_dir = script_dir or tempfile.mkdtemp(prefix='dgrid-tm-')
+        if not os.path.isdir(self.script_dir):
+            os.makedirs(self.script_dir)
+        self.lock = threading.Lock()
+        self.fanouts = 0
+        self.tasks = 0
+
+    def pbsdsh_command(self, hosts, script):
+        """
+        Builds the pbsdsh command line running a script on hosts, once per host.
+        Task output is captured with -o, it would otherwise go to the job's output file
+        :param hosts: List of hosts the script runs on
+        :param script: Path of the script
+        :return: Command list for Popen
+        """
+        target = ['-h', hosts[0]] if len(hosts) == 1 else ['-u']
+        return [self.pbsdsh_binary] + self.options + target + ['-o', 'sh', script]
+
+    def fanout(self, jobs):
+        """
+        Runs the commands of several hosts in a single pbsdsh fan-out
+        :param jobs: List of (host, command) tuples, each host at most once
+        :return: List of (exit code, output) tuples in the order of jobs
+        """
+        with self.lock:
+            self.fanouts += 1
+            self.tasks += len(jobs)
+            script = os.path.join(self.script_dir, 'fanout-%d.sh' % self.fanouts)
+        with open(script, 'w') as f:
+            f.write(fanout_script(jobs, self.numbers))
+
+        try:
+            with open(os.devnull, 'r') as devnull:
+                process = Popen(self.pbsdsh_command([host for host, command in jobs], script),
+                                stdin=devnull, stdout=PIPE, stderr=STDOUT)
+                output = self.decode(process.communicate()[0])
+        finally:
+            os.remove(script)
+
+        results, other = parse_fanout(output, len(jobs))
+        for line in other:
+            logger.debug("pbsdsh: " + line)
+        # A task that never reported its exit code failed to start, or was killed
+        return [(exit_code if exit_code is not None else (process.returncode or 255), '\n'.join(lines))
+                for exit_code, lines in results]
+
+    def run(self, host, command, warn_only=False):
+        """
+        Runs a command on a host, stderr is combined with stdout
+        :param host: Host to run command on
+        :param command: Command string to execute
+        :param warn_only: Log a warning instead of raising when the command fails
+        :return: Output of the command, with trailing newlines removed
+        """
+        exit_code, output = self.run_all([(host, command)])[0]
+        return self.result(host, command, exit_code, output, warn_only)
+
+    def run_all(self, jobs, concurrency=None, stop_on_failure=False):
+        """
+        Runs many commands at once. Each pbsdsh fan-out runs one command per host, so a host's commands
+        are spread over as many fan-outs, run one after another. Every node is started at once,
+        concurrency is accepted for OpenSSHPool compatibility
+        :param jobs: List of (host, command) tuples
+        :param concurrency: Unused, pbsdsh spawns the tasks of a fan-out together
+        :param stop_on_failure: Start no further fan-outs once a command has failed
+        :return: List of (exit code, output) tuples in the order of jobs, None for jobs never started
+        """
+        for host, command in jobs:
+            if host not in self.numbers:
+                raise RemoteExecutionError("%s is not one of the job's nodes" % host)
+
+        rounds = []
+        for index, (host, command) in enumerate(jobs):
+            for fanout in rounds:
+                if host not in fanout:
+                    break
+            else:
+                fanout = OrderedDict()
+                rounds.append(fanout)
+            fanout[host] = (index, command)
+
+        results = [None] * len(jobs)
+        for fanout in rounds:
+            outputs = self.fanout([(host, command) for host, (index, command) in fanout.items()])
+            for (index, command), result in zip(fanout.values(), outputs):
+                results[index] = result
+            if stop_on_failure and any(exit_code != 0 for exit_code, output in outputs):
+                break
+        return results
+
+    def decode(self, output):
+        # Output as text, with trailing newlines removed
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
+        return output.rstrip('\r\n')
+
+    def result(self, host, command, exit_code, output, warn_only=False):
+        """
+        Logs the output of a command, and checks its exit code
+        :param host: Host the command ran on
+        :param command: Command string executed
+        :param exit_code: Exit code of the command
+        :param output: Output of the command
+        :param warn_only: Log a warning instead of raising when the command failed
+        :return: Output of the command, with trailing newlines removed
+        """
+        output = self.decode(output)
+        for line in output.splitlines():
+            logger.debug("[%s] out: %s" % (host, line))
+        if exit_code != 0:
+            message = "%s failed on %s with exit code %d" % (command, host, exit_code)
+            if not warn_only:
+                raise RemoteExecutionError(message)
+            logger.warning(message)
+        return output
+
+    def stats(self):
+        """
+        Returns how many pbsdsh fan-outs were run, and how many tasks they spawned
+        :return: Dictionary of counts
+        """
+        with self.lock:
+            return {'fanouts': self.fanouts, 'tasks': self.tasks}
+
+    def close_all(self):
+        """
+        Removes the script directory, when the pool created it. There are no connections to close
+        :return: Null
+        """
+        if self.created:
+            shutil.rmtree(self.script_dir, ignore_errors=True)
@@ -90,6 +90,17 @@ setup(
     entry_points={
           'console_scripts': [
               'dgrid = dgrid.__main__:main'
+          ],
+          # Backends, other packages add theirs to the same groups
+          'dgrid.schedulers': [
+              'Torque6 = dgrid.scheduling.schedulers.Torque6.Torque6:Torque6',
+              'Slurm = dgrid.scheduling.schedulers.Slurm.Slurm:Slurm'
+          ],
+          'dgrid.executors': [
+              'SSH = dgrid.scheduling.schedulers.Torque6.SSHExecutor:SSHExecutor',
+              'ASYNC_SSH = dgrid.scheduling.schedulers.Torque6.AsyncSSHExecutor:AsyncSSHExecutor',
+              'TM = dgrid.scheduling.schedulers.Torque6.TMExecutor:TMExecutor',
+              'SRUN = dgrid.scheduling.schedulers.Slurm.SrunExecutor:SrunExecutor'
           ]
       },
     author="Robert J. Brennan",
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from subprocess import Popen, PIPE, STDOUT
+
+from dgrid.scheduling.utils.broadcast import relay_tree, relay, transfer_command, descendants
+
+
+class RelayTreeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.hosts = ['node%d' % i for i in range(1, 8)]
+
+    def test_binary_tree(self):
+        tree = relay_tree('head', self.hosts, 2)
+        assert tree['head'] == ['node1', 'node2']
+        assert tree['node1'] == ['node3', 'node4']
+        assert tree['node2'] == ['node5', 'node6']
+        assert tree['node3'] == ['node7']
+        assert sorted(descendants(tree, 'head')) == sorted(self.hosts)
+
+    def test_root_not_repeated(self):
+        tree = relay_tree('head', ['head'] + self.hosts, 7)
+        assert list(tree.keys()) == ['head'] + self.hosts
+        assert tree['head'] == self.hosts
+
+    def test_invalid_fanout(self):
+        with self.assertRaises(ValueError):
+            relay_tree('head', self.hosts, 0)
+
+
+class RelayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = relay_tree('head', ['node%d' % i for i in range(1, 8)], 2)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def transfer(self, parent, child):
+        with self.lock:
+            self.sent.append((parent, child))
+        if child == 'node1':
+            raise RuntimeError('connection refused')
+        return ''
+
+    def test_parent_sends_after_receiving(self):
+        self.tree = relay_tree('head', ['node%d' % i for i in range(2, 9)], 2)
+        results = relay(self.tree, self.transfer)
+
+        assert all(error is None for elapsed, error, present in results.values())
+        received = ['head'] + [child for parent, child in self.sent]
+        for parent, child in self.sent:
+            assert received.index(parent) < received.index(child)
+
+    def test_failure_skips_subtree(self):
+        results = relay(self.tree, self.transfer)
+
+        assert len(results) == 7
+        for host in ['node1', 'node3', 'node4', 'node7']:
+            assert results[host][1] is not None
+        for host in ['node2', 'node5', 'node6']:
+            assert results[host][1] is None
+        assert not any(parent == 'node1' for parent, child in self.sent)
+
+
+class TransferCommandTests(unittest.TestCase):
+    """
+    Relays an image between local stand-in hosts, each with its own fake docker image store
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.write_script('ssh', '#!/bin/sh\nfor last in "$@"; do host=$previous; previous=$last; done\n'
+                                 'DGRID_TEST_HOST=$host exec sh -c "$last"\n')
+        self.write_script('docker', '#!/bin/sh\nstore=%s/store/$DGRID_TEST_HOST\nmkdir -p $store\n'
+                                    'case "$1" in\n'
+                                    'image) cat $store/$5 2>/dev/null;;\n'
+                                    'save) echo $2; cat $store/$2;;\n'
+                                    'load) read name; read id; echo $id > $store/$name; '
+                                    'echo $name >> %s/loads.log;;\n'
+                                    'esac\n' % (self.tmp, self.tmp))
+        self.store('head', 'centos', 'sha256:abc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_script(self, name, content):
+        with open(self.tmp + '/' + name, 'w') as f:
+            f.write(content)
+        os.chmod(self.tmp + '/' + name, 0o755)
+
+    def store(self, host, image, image_id):
+        os.makedirs(self.tmp + '/store/' + host)
+        with open(self.tmp + '/store/%s/%s' % (host, image), 'w') as f:
+            f.write(image_id + '\n')
+
+    def transfer(self, parent, child):
+        environment = dict(os.environ)
+        environment['PATH'] = self.tmp + ':' + environment['PATH']
+        environment['DGRID_TEST_HOST'] = parent
+        proc = Popen(['sh', '-c', transfer_command('centos', child)], stdout=PIPE, stderr=STDOUT, env=environment)
+        output = proc.communicate()[0].decode('utf-8')
+        if proc.returncode != 0:
+            raise RuntimeError(output)
+        return output
+
+    def test_relay_to_stand_in_hosts(self):
+        self.store('node3', 'centos', 'sha256:abc')
+        hosts = ['node%d' % i for i in range(1, 6)]
+        results = relay(relay_tree('head', hosts, 2), self.transfer)
+
+        assert all(error is None for elapsed, error, present in results.values())
+        assert [results[host][2] for host in hosts] == [False, False, True, False, False]
+        for host in hosts:
+            with open(self.tmp + '/store/%s/centos' % host) as f:
+                assert f.read().strip() == 'sha256:abc'
+        with open(self.tmp + '/loads.log') as f:
+            assert len(f.read().splitlines()) == 4
+
+    def test_missing_image_fails(self):
+        with self.assertRaises(RuntimeError):
+            self.transfer('node1', 'node2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.docker.container import Container
+from dgrid.scheduling.utils import cgroups
+
+
+class CgroupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cgroup_dir = tempfile.mkdtemp()
+        self.job_path = 'torque/8'
+
+    def write(self, path, value):
+        path = self.cgroup_dir + '/' + path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(value + '\n')
+
+    def write_v1(self):
+        self.write('cpu/torque/8/cpu.shares', '1024')
+        self.write('cpuset/torque/8/cpuset.cpus', '0-3')
+        self.write('memory/torque/8/memory.limit_in_bytes', '524288000')
+        self.write('memory/torque/8/memory.swappiness', '30')
+        self.write('memory/torque/8/memory.memsw.limit_in_bytes', '1048576000')
+
+    def write_v2(self):
+        self.write('cgroup.controllers', 'cpuset cpu io memory pids')
+        self.write('torque/8/cpu.weight', '100')
+        self.write('torque/8/cpuset.cpus.effective', '4-7')
+        self.write('torque/8/memory.max', '524288000')
+        self.write('torque/8/memory.swap.max', '524288000')
+
+    def run_local(self, command):
+        return Popen(['sh', '-c', command], stdout=PIPE).communicate()[0].decode('utf-8')
+
+    def test_v1_limits(self):
+        self.write_v1()
+        limits = cgroups.read_limits(self.cgroup_dir, self.job_path)
+
+        assert limits.version == 1
+        assert limits.cpu_shares == '1024' and limits.cpu_set == '0-3'
+        assert limits.memory == '524288000b' and limits.memory_swappiness == '30'
+        assert limits.memory_swap == '1048576000b'
+        # No kmem file, so no kernel memory limit
+        assert limits.kernel_memory is None
+
+    def test_v2_limits(self):
+        self.write_v2()
+        limits = cgroups.read_limits(self.cgroup_dir, self.job_path)
+
+        assert limits.version == 2
+        # runc converts 2598 shares back to a weight of 100
+        assert limits.cpu_shares == '2598' and limits.cpu_set == '4-7'
+        assert limits.memory == '524288000b' and limits.memory_swap == '1048576000b'
+        assert limits.memory_swappiness is None and limits.kernel_memory is None
+
+    def test_v2_unlimited_memory(self):
+        self.write_v2()
+        self.write('torque/8/memory.max', 'max')
+        limits = cgroups.read_limits(self.cgroup_dir, self.job_path)
+
+        assert limits.memory is None and limits.memory_swap is None
+
+    def test_v2_unlimited_swap(self):
+        self.write_v2()
+        self.write('torque/8/memory.swap.max', 'max')
+        limits = cgroups.read_limits(self.cgroup_dir, self.job_path)
+
+        assert limits.memory == '524288000b' and limits.memory_swap == '-1'
+
+    def test_weight_to_shares(self):
+        assert cgroups.weight_to_shares('1') == '2'
+        assert cgroups.weight_to_shares('10000') == '262144'
+        # Converting back with runc's formula gives the original weight
+        for weight in (1, 39, 100, 5000, 10000):
+            shares = int(cgroups.weight_to_shares(str(weight)))
+            assert 1 + ((shares - 2) * 9999) // 262142 == weight
+
+    def test_remote_matches_local(self):
+        for write in (self.write_v1, self.write_v2):
+            write()
+            local = cgroups.read_limits(self.cgroup_dir, self.job_path)
+            remote = cgroups.read_remote_limits(self.run_local, self.cgroup_dir, self.job_path)
+            assert vars(local) == vars(remote)
+
+    def launch_args(self, memory_limits):
+        # docker run options the launch script adds, as read by the commands built by limits_command
+        command = cgroups.limits_command(self.cgroup_dir, self.job_path, memory_limits) + '\necho $limit_args'
+        return self.run_local(command).split()
+
+    def applied_args(self, memory_limits):
+        # docker run options of a container the limits read in process are applied to
+        container = Container({'image': 'ubuntu:14.04', 'name': 'head', 'interactive': 'True'})
+        cgroups.read_limits(self.cgroup_dir, self.job_path).apply(container, memory_limits)
+        return [arg for arg in container.run() if arg.split('=')[0] in dict(Container.RUN_OPTIONS).values()]
+
+    def test_launch_args_match_applied(self):
+        for write in (self.write_v1, self.write_v2):
+            write()
+            for memory_limits in (False, True):
+                assert self.launch_args(memory_limits) == self.applied_args(memory_limits)
+
+    def test_launch_args_v2_unlimited(self):
+        self.write_v2()
+        self.write('torque/8/memory.swap.max', 'max')
+        assert self.launch_args(True) == self.applied_args(True)
+
+        self.write('torque/8/memory.max', 'max')
+        assert self.launch_args(True) == ['--cpu-shares=2598', '--cpuset-cpus=4-7']
+
+    def test_launch_args_without_cgroup(self):
+        assert self.launch_args(True) == []
+
+    def test_apply(self):
+        self.write_v1()
+        limits = cgroups.read_limits(self.cgroup_dir, self.job_path)
+        container = Container({'image': 'ubuntu:14.04', 'name': 'head', 'interactive': 'True'})
+
+        limits.apply(container)
+        assert container.cpu_shares == '1024' and container.memory is None
+
+        limits.apply(container, memory_limits=True)
+        assert container.memory == '524288000b' and container.memory_swap == '1048576000b'
+
+    def tearDown(self):
+        shutil.rmtree(self.cgroup_dir)
@@ -0,0 +1,151 @@
+import glob
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import unittest
+from subprocess import Popen
+
+from dgrid.conf import settings
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils import cleanup_queue, fileparser
+
+
+class CleanupQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = self.tmp + '/queue'
+        self.ran = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, command):
+        self.ran.append(command)
+        return 1 if 'fail' in command else 0
+
+    def entries(self):
+        return sorted(glob.glob(self.queue + '/*' + cleanup_queue.SUFFIX))
+
+    def test_enqueue_and_drain_in_order(self):
+        cleanup_queue.enqueue(self.queue, '2.head', ['second'], now=200)
+        cleanup_queue.enqueue(self.queue, '1.head', ['first a', 'first b'], now=100)
+
+        assert cleanup_queue.drain(self.queue, self.run_command) == (2, 0)
+        assert self.ran == ['first a', 'first b', 'second']
+        assert self.entries() == []
+
+    def test_enqueue_command(self):
+        command = cleanup_queue.enqueue_command(self.queue, '1.head', ["echo 'quoted' \"text\"; docker rmi x"])
+        assert Popen(['sh', '-c', command]).wait() == 0
+
+        with open(self.entries()[0]) as f:
+            work = json.load(f)
+        assert work['job_id'] == '1.head'
+        assert work['commands'] == ["echo 'quoted' \"text\"; docker rmi x"]
+
+    def test_failed_commands_retried(self):
+        cleanup_queue.enqueue(self.queue, '1.head', ['ok', 'fail'])
+
+        assert cleanup_queue.drain(self.queue, self.run_command) == (0, 1)
+        assert cleanup_queue.drain(self.queue, self.run_command) == (0, 1)
+        assert self.ran == ['ok', 'fail', 'fail']
+        # Given up on after the last attempt
+        assert cleanup_queue.drain(self.queue, self.run_command) == (1, 0)
+        assert self.entries() == []
+
+    def test_drain_one_job(self):
+        cleanup_queue.enqueue(self.queue, '1.head', ['one'])
+        cleanup_queue.enqueue(self.queue, '2.head', ['two'])
+
+        assert cleanup_queue.drain(self.queue, self.run_command, job_id='2.head') == (1, 1)
+        assert self.ran == ['two']
+
+    def test_missing_queue(self):
+        assert cleanup_queue.drain(self.tmp + '/none', self.run_command) == (0, 0)
+
+    def drained_session(self):
+        # Waits for a background worker to drain the queue, returns the session its commands ran in
+        deadline = time.time() + 30
+        while self.entries() and time.time() < deadline:
+            time.sleep(0.1)
+        assert self.entries() == []
+        with open(self.tmp + '/sid') as f:
+            return int(f.read())
+
+    def test_drain_command_own_session(self):
+        cleanup_queue.enqueue(self.queue, '1.head', ['%s -c "import os; print(os.getsid(0))" > %s/sid'
+                                                     % (sys.executable, self.tmp)])
+
+        assert Popen(['sh', '-c', cleanup_queue.drain_command(sys.executable, self.queue)]).wait() == 0
+        assert self.drained_session() != os.getsid(0)
+
+    def test_start_drain_own_session(self):
+        cleanup_queue.enqueue(self.queue, '1.head', ['%s -c "import os; print(os.getsid(0))" > %s/sid'
+                                                     % (sys.executable, self.tmp)])
+
+        worker = cleanup_queue.start_drain(sys.executable, self.queue)
+        assert worker.wait() == 0
+        assert self.drained_session() == worker.pid
+
+
+class RecordingPool(object):
+    """
+    Stands in for the executor's connection pool, recording the commands run on each host
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, host, command, warn_only=False):
+        self.commands.append((host, command))
+        return ''
+
+
+class DeferredCleanupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.environment = dict(os.environ)
+        self.saved = dict((name, getattr(settings, name)) for name in
+                          ('deferred_cleanup', 'cleanup_queue_dir', 'cleanup_drain', 'image_cleanup',
+                           'remove_unreferenced_containers'))
+        settings.deferred_cleanup = True
+        settings.cleanup_queue_dir = self.tmp + '/queue'
+        settings.cleanup_drain = 'epilogue'
+        settings.image_cleanup = 2
+        settings.remove_unreferenced_containers = True
+        os.environ['PBS_JOBID'] = '8'
+
+        containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+        self.executor = SSHExecutor(containers, [socket.gethostname(), 'node1'], self.tmp)
+        self.executor.pool = RecordingPool()
+        # Two replicas placed on this host, alongside the interactive container
+        for container, host in zip(self.executor.containers, [socket.gethostname(), 'node1', socket.gethostname()]):
+            container.execution_host = host
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        os.environ.clear()
+        os.environ.update(self.environment)
+        shutil.rmtree(self.tmp)
+
+    def test_each_host_queued_once(self):
+        self.executor.remove_images()
+
+        assert [host for host, command in self.executor.pool.commands] == ['node1']
+        entries = glob.glob(self.tmp + '/queue/*' + cleanup_queue.SUFFIX)
+        assert len(entries) == 1
+        with open(entries[0]) as f:
+            local_command = json.load(f)['commands'][0]
+        assert local_command.count('remove_unreferenced_containers.sh') == 1
+        assert local_command.count('docker rmi') == 1 and local_command.count('ubuntu:14.04') == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
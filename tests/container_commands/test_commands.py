@@ -1,7 +1,7 @@
 import json
 import unittest
 
-from dgrid.docker.container import Container
+from dgrid.docker.container import Container, ContainerTemplate
 
 
 class CommandTestSuite(unittest.TestCase):
@@ -41,6 +41,11 @@ class CommandTestSuite(unittest.TestCase):
 
         assert ' '.join(self.container.terminate()) == expected_result
 
+    def test_termination_command_w_timeout(self):
+        expected_result = "docker stop -t 5 slave"
+
+        assert ' '.join(self.container.terminate(5)) == expected_result
+
     def test_restore_command(self):
         checkpoint_dir = "/tmp/checkpoint"
         checkpoint_name = "checkpoint1"
@@ -71,6 +76,15 @@ class CommandTestSuite(unittest.TestCase):
                                                  " --kernel-memory=444 -v /var/www:/var/www -v /home/user:/home/user" \
                                                  " --name=slave --workdir=/var/www ubuntu:14.04 sh command.sh"
 
+    def test_run_command_w_cpuset_mems(self):
+        self.container.cpu_set = '0-3'
+        self.container.cpu_mems = '0'
+
+        assert ' '.join(self.container.run()) == "docker run --interactive=True --detach=False" \
+                                                 " --cpuset-cpus=0-3 --cpuset-mems=0" \
+                                                 " -v /var/www:/var/www -v /home/user:/home/user" \
+                                                 " --name=slave --workdir=/var/www ubuntu:14.04 sh command.sh"
+
     def test_run_command2(self):
         containerdef2 = """
         {
@@ -136,3 +150,70 @@ class CommandTestSuite(unittest.TestCase):
                           "--workdir=/var/www ubuntu:14.04 sh command.sh"
 
         assert ' '.join(self.container.run()) == expected_result
+
+    def test_replicas_share_template(self):
+        template = ContainerTemplate(json.loads(json.dumps({
+            "interactive": "False", "image": "ubuntu:14.04", "name": "worker",
+            "volumes": ["/data:/data"], "run_cmd": ["sh", "work.sh"]})))
+        replicas = [Container(template) for i in range(1000)]
+
+        assert all(replica.template is template for replica in replicas)
+        assert not hasattr(replicas[0], '__dict__')
+        assert not hasattr(replicas[0], 'environment_vars') and not hasattr(replicas[0], 'work_dir')
+
+        # Building commands doesn't copy the shared lists for each replica
+        replicas[0].run()
+        assert replicas[0]._volumes is Container.UNSET
+
+    def test_replica_state_isolated(self):
+        template = ContainerTemplate(json.loads(json.dumps({
+            "interactive": "False", "image": "ubuntu:14.04", "name": "worker",
+            "volumes": ["/data:/data"], "run_cmd": ["sh", "work.sh"]})))
+        first, second = Container(template), Container(template)
+
+        first.name += 'a'
+        first.volumes.append('/hostfile:/hostfile')
+        first.environment_vars = ['CONT=b']
+        first.network = 'net'
+        first.execution_host = 'node1'
+        first.cpu_set = '0-1'
+
+        assert ' '.join(second.run()) == "docker run --interactive=False --detach=True -v /data:/data " \
+                                         "--name=worker ubuntu:14.04 sh work.sh"
+        assert ' '.join(first.run()) == "docker run --interactive=False --detach=True --cpuset-cpus=0-1 " \
+                                        "--network=net -v /data:/data -v /hostfile:/hostfile -e CONT=b " \
+                                        "--name=workera ubuntu:14.04 sh work.sh"
+        assert template.volumes == ('/data:/data',) and second.execution_host is None
+
+    def test_run_command_cached(self):
+        first = self.container.run()
+        first.append('mutated')
+        assert self.container.run() == first[:-1]
+        assert self.container.run_args is not None
+
+        # Kept for lists copied from the template, not for lists set from outside
+        self.container.volumes.append('/tmp:/tmp')
+        assert '-v /tmp:/tmp' in ' '.join(self.container.run()) and self.container.run_args is not None
+        self.container.environment_vars = ['A=1']
+        assert '-e A=1' in ' '.join(self.container.run()) and self.container.run_args is None
+
+    def test_run_command_rebuilt_on_change(self):
+        self.container.run()
+        self.container.network = 'net'
+        assert '--network=net' in self.container.run()
+
+        self.container.name += 'x'
+        assert '--name=slavex' in self.container.run()
+
+        self.container.volumes.append('/tmp:/tmp')
+        assert ' '.join(self.container.run()).endswith("-v /home/user:/home/user -v /tmp:/tmp --name=slavex "
+                                                       "--workdir=/var/www ubuntu:14.04 sh command.sh")
+
+        # Changing a list already handed out in place
+        volumes = self.container.volumes
+        self.container.run()
+        volumes.pop()
+        assert '/tmp:/tmp' not in self.container.run()
+
+        self.container.image = 'ubuntu:16.04'
+        assert 'ubuntu:16.04' in self.container.run()
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from dgrid.scheduling.utils import definition
+from dgrid.scheduling.utils.Errors import DefinitionError
+
+
+class DefinitionTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.head = {"name": "head", "image": "python:2", "interactive": "True", "run_cmd": ["python", "run.py"]}
+        self.worker = {"name": "worker", "image": "ubuntu:14.04", "interactive": "False", "scale": 3}
+
+    def write(self, data, name='def.json'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        return path
+
+    def error(self, data):
+        with self.assertRaises(DefinitionError) as raised:
+            definition.load_definition(self.write(data))
+        return raised.exception
+
+    def test_loads(self):
+        loaded = definition.load_definition(self.write({"containers": [self.head, self.worker]}))
+
+        assert [(template.name, replicas) for template, replicas in loaded.templates] == [('head', 1), ('worker', 3)]
+        assert loaded.hostfile_format is None
+
+    def test_normalises(self):
+        self.head['run_cmd'] = "sh -c 'echo hi'"
+        self.worker['interactive'] = False
+        self.worker['checkpointing'] = True
+        loaded = definition.load_definition(self.write({"containers": [self.head, self.worker]}))
+
+        head, worker = [template for template, replicas in loaded.templates]
+        assert head.cmd == ('sh', '-c', 'echo hi')
+        assert worker.interactive == 'False' and worker.checkpointing == 'True'
+
+    def test_missing_field(self):
+        del self.worker['image']
+        ex = self.error({"containers": [self.head, self.worker]})
+
+        assert ex.field == 'containers[1].image' and ex.path.endswith('def.json')
+        assert str(ex).endswith('def.json: containers[1].image: required field is missing')
+
+    def test_wrong_types(self):
+        self.worker['scale'] = 0
+        assert self.error({"containers": [self.head, self.worker]}).field == 'containers[1].scale'
+
+        self.worker['scale'] = 2
+        self.worker['volumes'] = ["/a:/a", 5]
+        ex = self.error({"containers": [self.head, self.worker]})
+        assert ex.field == 'containers[1].volumes' and 'item 1' in ex.problem
+
+        del self.worker['volumes']
+        self.head['interactive'] = "yes"
+        assert self.error({"containers": [self.head, self.worker]}).field == 'containers[0].interactive'
+
+    def test_containers(self):
+        assert self.error({"containers": []}).field == 'containers'
+        assert self.error({"hostfile_format": "yaml", "containers": [self.head]}).field == 'hostfile_format'
+        assert self.error([self.head]).field == '(top level)'
+
+    def test_links(self):
+        self.head['links'] = ["db:DB"]
+        assert self.error({"containers": [self.head, self.worker]}).field == 'containers[0].links[0]'
+
+        self.head['links'] = ["worker:WORKER"]
+        assert 'scaled' in self.error({"containers": [self.head, self.worker]}).problem
+
+        self.head['links'] = ["worker"]
+        assert self.error({"containers": [self.head, self.worker]}).field == 'containers[0].links'
+
+    def test_host_lists(self):
+        self.worker['host_to_list'] = ["slots=4"]
+        ex = self.error({"hostfile_format": "json", "containers": [self.head, self.worker]})
+        assert ex.field == 'containers[1].host_to_list'
+
+        self.worker['host_to_list'] = ["slots=many"]
+        assert self.error({"hostfile_format": "machinefile", "containers": [self.head, self.worker]}).field \
+            == 'containers[1].host_to_list'
+
+    def test_bad_json(self):
+        ex = self.error('{"containers": [')
+        assert ex.field == '(file)' and isinstance(ex, ValueError)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
@@ -2,7 +2,7 @@ import os
 import unittest
 import json
 from dgrid.scheduling.utils import fileparser
-from dgrid.scheduling.utils.docker_netorking import add_networking
+from dgrid.scheduling.utils.docker_netorking import add_networking, format_hostfile, write_hostfile
 
 
 class TestDockerNetworking(unittest.TestCase):
@@ -13,6 +13,7 @@ class TestDockerNetworking(unittest.TestCase):
         self.docker_def_json = self.write_dir + 'def_json.json'
         self.docker_def_list = self.write_dir + 'def_list.json'
         self.docker_def_envs = self.write_dir + 'def_envs.json'
+        self.docker_def_machinefile = self.write_dir + 'def_machinefile.json'
 
     def test_check_list_volumes(self):
         containers = fileparser.get_containers(self.docker_def_list)
@@ -133,6 +134,44 @@ class TestDockerNetworking(unittest.TestCase):
 
         assert all(item is True for item in results) and len(results) is 2
 
+    def test_check_machinefile(self):
+        containers = fileparser.get_containers(self.docker_def_machinefile)
+        conts, var = add_networking(containers, self.write_dir)
+
+        with open(self.write_dir + 'machinefile', 'r') as f:
+            lines = f.read().splitlines()
+
+        names = [container.name for container in conts if not container.name.startswith('head')]
+        assert lines == [names[0] + ' slots=4', names[1] + ' slots=4', names[2] + ' slots=1'] and var is True
+        for container in conts:
+            if container.name.startswith('head'):
+                assert any(volume.endswith(':/machinefile') for volume in container.volumes)
+
+    def test_json_keeps_definition_order(self):
+        contents = format_hostfile([('b1', {'tag': 'b'}), ('a1', {'tag': 'a'}), ('b2', {'tag': 'b'})], 'json')
+        assert contents == '{"b": ["b1", "b2"], "a": ["a1"]}'
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, format_hostfile, [('a', {})], 'yaml')
+
+    def test_rewrite_replaces_hostfile(self):
+        # A second job in the same directory doesn't see the hosts of the first
+        containers = fileparser.get_containers(self.docker_def_list)
+        add_networking(containers, self.write_dir)
+        containers = fileparser.get_containers(self.docker_def_list)
+        conts, var = add_networking(containers, self.write_dir)
+
+        with open(self.write_dir + 'hostfile', 'r') as f:
+            lines = f.read().splitlines()
+        assert lines == [container.name for container in conts if container.name.startswith('tail')]
+        assert [name for name in os.listdir(self.write_dir) if name.startswith('hostfile.')] == []
+
+    def test_write_hostfile(self):
+        write_hostfile(self.write_dir + 'hostfile', 'a\n')
+        write_hostfile(self.write_dir + 'hostfile', 'b\n')
+        with open(self.write_dir + 'hostfile', 'r') as f:
+            assert f.read() == 'b\n'
+
     def run_check(self, volumes, islist=False, isjson=False):
         result = False
         for volume in volumes:
@@ -158,4 +197,4 @@ class TestDockerNetworking(unittest.TestCase):
 
     def tearDown(self):
         # remove created hostfiles
-        os.system("rm " + self.write_dir + "hostfile*")
+        os.system("rm -f " + self.write_dir + "hostfile* " + self.write_dir + "machinefile")
@@ -0,0 +1,358 @@
+import json
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import ThreadingUnixStreamServer
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingUnixStreamServer
+    from urllib.parse import urlparse, parse_qs
+
+from dgrid.conf import settings
+from dgrid.docker.container import byte_size
+from dgrid.docker.engine import DockerEngine, split_image, local_engine
+from dgrid.scheduling.schedulers.Slurm.SrunExecutor import SrunExecutor
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.Errors import DockerAPIError
+from dgrid.scheduling.utils.output import STDOUT, STDERR
+
+
+def frame(stream, data):
+    # Multiplexed output frame, as the daemon writes for containers without a TTY
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+class FakeDaemon(BaseHTTPRequestHandler):
+    """
+    Answers Engine API requests as the docker daemon would, recording each request and connection
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+        self.handled = 0
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.handled += 1
+        # Closes idle keep-alive connections without telling the client, as the daemon may
+        if self.server.requests_per_connection and self.handled >= self.server.requests_per_connection:
+            self.close_connection = True
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+        self.server.requests.append((method, url.path, query, body))
+        parts = url.path.strip('/').split('/')
+        containers = self.server.containers
+
+        if url.path == '/containers/create':
+            if query['name'] in containers:
+                return self.reply(409, {'message': 'Conflict. The container name is already in use'})
+            if body['Image'] in self.server.missing:
+                return self.reply(404, {'message': 'No such image: ' + body['Image']})
+            containers[query['name']] = body
+            return self.reply(201, {'Id': 'id-' + query['name']})
+        if parts[0] == 'containers' and parts[1] not in containers:
+            return self.reply(404, {'message': 'No such container: ' + parts[1]})
+        if parts[0] == 'containers' and method == 'DELETE':
+            del containers[parts[1]]
+            return self.reply(204)
+        if parts[0] == 'containers' and parts[2] == 'json':
+            return self.reply(200, {'Id': 'id-' + parts[1], 'State': {'Pid': 4242}})
+        if parts[0] == 'containers' and parts[2] == 'logs':
+            output = frame(1, b'hello\npar') + frame(2, b'oops\n') + frame(1, b'tial\nend')
+            return self.reply(200, output, 'application/vnd.docker.raw-stream')
+        if parts[0] == 'containers' and parts[2] == 'wait':
+            return self.reply(200, {'StatusCode': 3})
+        if parts[0] == 'containers':
+            return self.reply(204)
+        if url.path == '/images/create':
+            if query['fromImage'] == 'missing':
+                return self.reply(200, b'{"status": "Pulling"}\n{"error": "manifest unknown"}\n')
+            self.server.missing.discard(query['fromImage'] + ':' + query['tag'])
+            return self.reply(200, b'{"status": "Pulling from library/ubuntu"}\n'
+                                   b'{"status": "Downloading", "progressDetail": {"current": 1}}\n')
+        if url.path == '/networks/create':
+            return self.reply(201, {'Id': 'net-' + body['Name']})
+        if parts[0] == 'networks':
+            return self.reply(204)
+        return self.reply(404, {'message': 'page not found'})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+
+class EngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.socket_path = self.tmp + '/docker.sock'
+        self.server = ThreadingUnixStreamServer(self.socket_path, FakeDaemon)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.containers = dict()
+        # Images the daemon doesn't have until they are pulled
+        self.server.missing = set()
+        self.server.connections = 0
+        self.server.requests_per_connection = None
+        # Clients closing connections mid-request aren't errors here
+        self.server.handle_error = lambda request, address: None
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        self.engine = DockerEngine(self.socket_path, timeout=5)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def requests(self):
+        return [(method, path) for method, path, query, body in self.server.requests]
+
+
+class DockerEngineTests(EngineTestCase):
+
+    def test_split_image(self):
+        assert split_image('ubuntu:14.04') == ('ubuntu', '14.04')
+        assert split_image('ubuntu') == ('ubuntu', 'latest')
+        assert split_image('registry:5000/team/app') == ('registry:5000/team/app', 'latest')
+        assert split_image('registry:5000/app:2') == ('registry:5000/app', '2')
+        assert list(split_image('ubuntu@sha256:abc')) == ['ubuntu', 'sha256:abc']
+
+    def test_byte_size(self):
+        assert byte_size('512m') == 512 * 1024 ** 2
+        assert byte_size('1073741824') == 1073741824
+        assert byte_size(-1) == -1
+
+    def test_one_connection(self):
+        assert self.engine.run_container('head', {'Image': 'ubuntu'}) == 'id-head'
+        assert self.engine.container_pid('head') == 4242
+        self.engine.remove_container('head')
+
+        assert self.requests() == [('POST', '/containers/create'), ('POST', '/containers/head/start'),
+                                   ('GET', '/containers/head/json'), ('DELETE', '/containers/head')]
+        assert self.server.connections == 1
+        assert self.server.requests[0][2] == {'name': 'head'}
+        assert self.server.requests[-1][2] == {'force': '1', 'v': '1'}
+
+    def test_reconnects_when_closed(self):
+        self.server.requests_per_connection = 2
+
+        for i in range(5):
+            self.engine.create_network('net%d' % i)
+
+        assert len(self.server.requests) == 5
+        assert self.server.connections == 3
+
+    def test_errors(self):
+        with self.assertRaises(DockerAPIError) as raised:
+            self.engine.remove_container('gone')
+        assert raised.exception.status == 404
+        assert 'No such container: gone' in str(raised.exception)
+
+        self.engine.run_container('head', {'Image': 'ubuntu'})
+        self.assertRaises(DockerAPIError, self.engine.create_container, 'head', {'Image': 'ubuntu'})
+        # The connection is still usable after errors
+        assert self.engine.container_pid('head') == 4242
+
+    def test_pull(self):
+        self.engine.pull('ubuntu:14.04')
+        assert self.server.requests[0][2] == {'fromImage': 'ubuntu', 'tag': '14.04'}
+
+        with self.assertRaises(DockerAPIError) as raised:
+            self.engine.pull('missing')
+        assert 'manifest unknown' in str(raised.exception)
+
+    def test_follow(self):
+        self.engine.run_container('head', {'Image': 'ubuntu'})
+        lines = []
+
+        exit_code = self.engine.follow('head', lambda stream, timestamp, line: lines.append((stream, line)))
+
+        assert exit_code == 3
+        assert lines == [(STDOUT, 'hello'), (STDERR, 'oops'), (STDOUT, 'partial'), (STDOUT, 'end')]
+        assert self.server.requests[-2][2] == {'follow': '1', 'stdout': '1', 'stderr': '1'}
+
+    def test_stop_timeout(self):
+        self.engine.run_container('head', {'Image': 'ubuntu'})
+        self.engine.stop_container('head', 5)
+        self.engine.stop_container('head')
+
+        assert self.server.requests[-2][1:3] == ('/containers/head/stop', {'t': '5'})
+        assert self.server.requests[-1][2] == {}
+
+    def test_local_engine(self):
+        saved = settings.docker_api, settings.docker_socket
+        try:
+            settings.docker_api, settings.docker_socket = True, self.socket_path
+            assert local_engine().socket_path == self.socket_path
+            settings.docker_socket = self.tmp + '/missing.sock'
+            assert local_engine() is None
+            settings.docker_api, settings.docker_socket = False, self.socket_path
+            assert local_engine() is None
+        finally:
+            settings.docker_api, settings.docker_socket = saved
+
+
+class ContainerConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.head, self.slave = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[:2]
+
+    def test_config(self):
+        self.head.cgroup_parent = '/torque/8'
+        self.head.cpu_shares = '512'
+        self.head.cpu_set = '0-3'
+        self.head.memory = '1073741824'
+        self.head.user = 1000
+        self.head.network = 'jobnet'
+        self.head.volumes = ['/data:/data:ro']
+        self.head.environment_vars = ['A=1']
+
+        config = self.head.api_config()
+
+        assert config['Image'] == 'ubuntu:14.04'
+        assert config['Cmd'] == ['hostname']
+        assert config['User'] == '1000'
+        assert config['Env'] == ['A=1']
+        assert config['AttachStdout'] and config['AttachStderr']
+        assert config['OpenStdin'] and config['StdinOnce']
+        assert config['HostConfig'] == {'CgroupParent': '/torque/8', 'CpuShares': 512, 'CpusetCpus': '0-3',
+                                        'Memory': 1073741824, 'NetworkMode': 'jobnet', 'Binds': ['/data:/data:ro']}
+
+    def test_same_as_run_command(self):
+        config = self.slave.api_config()
+        run = self.slave.run()
+
+        assert config['Cmd'] == run[run.index(self.slave.image) + 1:]
+        assert not config['AttachStdout'] and not config['OpenStdin']
+        assert 'Binds' not in config['HostConfig'] and 'Env' not in config
+
+
+class ExecutorEngineTests(EngineTestCase):
+
+    def setUp(self):
+        EngineTestCase.setUp(self)
+        self.environment = dict(os.environ)
+        self.saved = dict((name, getattr(settings, name)) for name in ('pbs_track', 'image_inventory'))
+        with open(self.tmp + '/pbs_track', 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> %s/pbs_track.log\n' % self.tmp)
+        os.chmod(self.tmp + '/pbs_track', 0o755)
+        settings.pbs_track = self.tmp + '/pbs_track'
+        settings.image_inventory = False
+        os.environ['PBS_JOBID'] = '8'
+
+        head = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[:1]
+        self.executor = SSHExecutor(head, [socket.gethostname()], self.tmp)
+        self.executor.engine = self.engine
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        os.environ.clear()
+        os.environ.update(self.environment)
+        EngineTestCase.tearDown(self)
+
+    def test_interactive_container(self):
+        self.executor.run_int_container()
+
+        name = self.executor.int_container.name
+        assert self.requests() == [('POST', '/images/create'), ('POST', '/containers/create'),
+                                   ('POST', '/containers/%s/start' % name), ('GET', '/containers/%s/json' % name),
+                                   ('GET', '/containers/%s/logs' % name), ('POST', '/containers/%s/wait' % name)]
+        assert self.server.containers[name]['Image'] == 'ubuntu:14.04'
+        with open(self.tmp + '/pbs_track.log') as f:
+            assert f.read().split() == ['-j', '8', '-a', '4242']
+        assert not self.executor.local_run
+
+    def test_teardown_and_network(self):
+        self.executor.network_name = 'jobnet'
+        self.executor.docker_network(create=True)
+        self.executor.run_int_container()
+        self.executor.local_run = True
+
+        self.executor.terminate_clean()
+        self.executor.docker_network(remove=True)
+        # A failed request is logged, not raised
+        self.executor.terminate_clean()
+
+        name = self.executor.int_container.name
+        assert self.requests()[0] == ('POST', '/networks/create')
+        assert self.requests()[-5:] == [('POST', '/containers/%s/stop' % name), ('DELETE', '/containers/' + name),
+                                        ('DELETE', '/networks/jobnet'), ('POST', '/containers/%s/stop' % name),
+                                        ('DELETE', '/containers/' + name)]
+        assert not self.server.containers
+
+
+class SrunEngineTests(EngineTestCase):
+
+    def setUp(self):
+        EngineTestCase.setUp(self)
+        self.environment = dict(os.environ)
+        os.environ['SLURMD_NODENAME'] = 'node1'
+        os.environ['SLURM_JOB_ID'] = '77'
+
+        head = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[:1]
+        self.executor = SrunExecutor(head, ['node1'], self.tmp)
+        self.executor.engine = self.engine
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        EngineTestCase.tearDown(self)
+
+    def test_present_image_not_pulled(self):
+        self.executor.run_int_container()
+
+        name = self.executor.int_container.name
+        assert self.requests() == [('POST', '/containers/create'), ('POST', '/containers/%s/start' % name),
+                                   ('GET', '/containers/%s/logs' % name), ('POST', '/containers/%s/wait' % name)]
+        assert not self.executor.local_run
+
+    def test_missing_image_pulled(self):
+        self.server.missing.add('ubuntu:14.04')
+
+        self.executor.run_int_container()
+
+        name = self.executor.int_container.name
+        assert self.requests()[:4] == [('POST', '/containers/create'), ('POST', '/images/create'),
+                                       ('POST', '/containers/create'), ('POST', '/containers/%s/start' % name)]
+        assert self.server.requests[1][2] == {'fromImage': 'ubuntu', 'tag': '14.04'}
+        assert self.server.containers[name]['Image'] == 'ubuntu:14.04'
+
+    def test_other_errors_raised(self):
+        self.server.containers[self.executor.int_container.name] = dict()
+
+        self.assertRaises(DockerAPIError, self.executor.run_int_container)
+
+        assert self.requests() == [('POST', '/containers/create')]
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from multiprocessing import Process
+from subprocess import CalledProcessError
+
+from dgrid.scheduling.utils import image_gc
+
+
+class FakeDocker(object):
+    """
+    Stands in for docker, each image takes up 10% of the disk. Listing images takes delay seconds
+    """
+
+    def __init__(self, images, containers):
+        self.images = images
+        self.containers = containers
+        self.commands = []
+        self.delay = 0
+
+    def __call__(self, args):
+        self.commands.append(args)
+        if args[:1] == ['images']:
+            time.sleep(self.delay)
+            return '\n'.join(image['Id'] for image in self.images)
+        if args[:2] == ['image', 'inspect']:
+            return json.dumps([image for image in self.images if image['Id'] in args[2:]])
+        if args[:1] == ['ps']:
+            return '\n'.join(self.containers)
+        if args[:1] == ['inspect']:
+            return '\n'.join(self.containers[name] for name in args[3:])
+        if args[:1] == ['rmi']:
+            if 'busy:1' in args:
+                raise CalledProcessError(1, 'docker rmi')
+            self.images = [image for image in self.images if not set(args[1:]).intersection(
+                image['RepoTags'] or [image['Id']])]
+            return ''
+
+    def usage(self, path):
+        return 10.0 * len(self.images)
+
+
+class ImageGCTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index = self.tmp + '/index'
+        images = [{'Id': 'sha256:%d' % i, 'RepoTags': ['image%d:latest' % i], 'Size': 100} for i in range(9)]
+        images.append({'Id': 'sha256:dangling', 'RepoTags': None, 'Size': 100})
+        self.docker = FakeDocker(images, {'c1': 'sha256:0'})
+        # Image 8 was used longest ago, image 1 most recently
+        with open(self.index, 'w') as f:
+            json.dump(dict(('sha256:%d' % i, 1000 - i) for i in range(1, 9)), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def collect(self, high=85, low=70, used=()):
+        return image_gc.collect(self.docker, self.index, '/', high, low, used, now=2000, usage=self.docker.usage)
+
+    def remaining(self):
+        return [image['Id'] for image in self.docker.images]
+
+    def test_below_high_watermark(self):
+        removed, usage = self.collect(high=101)
+
+        assert removed == []
+        assert usage == 100
+        assert not any(command[0] == 'rmi' for command in self.docker.commands)
+
+    def test_lru_eviction_to_low_watermark(self):
+        removed, usage = self.collect()
+
+        # Never used images go first, then least recently used, never images used by containers
+        assert removed == ['sha256:dangling', 'sha256:8', 'sha256:7']
+        assert usage == 70
+        assert 'sha256:0' in self.remaining()
+        assert ['rmi', 'sha256:dangling'] in self.docker.commands
+
+    def test_bulk_queries(self):
+        self.collect(high=101)
+        assert [command[0] for command in self.docker.commands] == ['images', 'image', 'ps', 'inspect']
+
+    def test_used_images_recorded(self):
+        removed, usage = self.collect(used=['image8', 'image7'])
+
+        assert removed == ['sha256:dangling', 'sha256:6', 'sha256:5']
+        index = image_gc.load_index(self.index)
+        assert index['sha256:8'] == 2000 and index['sha256:0'] == 2000
+        assert 'sha256:6' not in index
+
+    def test_failed_removal_skipped(self):
+        self.docker.images[8]['RepoTags'] = ['busy:1']
+        removed, usage = self.collect()
+
+        assert 'sha256:8' not in removed
+        assert len(removed) == 3
+
+    def test_missing_index(self):
+        os.remove(self.index)
+        removed, usage = self.collect()
+
+        assert len(removed) == 3
+        # Created writable by every user's jobs
+        assert os.stat(self.index).st_mode & 0o777 == 0o666
+
+    def test_concurrent_writers(self):
+        # Two jobs ending on the node at once, each recording the image it used
+        self.docker.delay = 0.3
+        writers = [Process(target=self.collect, kwargs={'high': 101, 'used': [image]})
+                   for image in ('image8', 'image7')]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        index = image_gc.load_index(self.index)
+        assert index['sha256:8'] == 2000 and index['sha256:7'] == 2000
+
+
+if __name__ == '__main__':
+    unittest.main()
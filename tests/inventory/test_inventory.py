@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils.inventory import inventory_command, invalidate_command, parse_inventory, \
+    split_present, normalise
+
+
+class InventoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = self.tmp + '/images'
+        # Fake docker binary, counts how often it is asked for the image list
+        with open(self.tmp + '/docker', 'w') as f:
+            f.write('#!/bin/sh\necho >> %s/calls.log\n'
+                    'echo "ubuntu:14.04 ubuntu@sha256:aaa sha256:111"\n'
+                    'echo "registry:5000/app:v1 registry:5000/app@<none> sha256:222"\n'
+                    'echo "<none>:<none> <none>@<none> sha256:333"\n' % self.tmp)
+        os.chmod(self.tmp + '/docker', 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, command):
+        environment = dict(os.environ)
+        environment['PATH'] = self.tmp + ':' + environment['PATH']
+        proc = Popen(['sh', '-c', command], stdout=PIPE, stderr=PIPE, env=environment)
+        return proc.communicate()[0].decode('utf-8')
+
+    def calls(self):
+        with open(self.tmp + '/calls.log') as f:
+            return len(f.read().splitlines())
+
+    def test_normalise(self):
+        assert normalise('ubuntu') == 'ubuntu:latest'
+        assert normalise('ubuntu:14.04') == 'ubuntu:14.04'
+        assert normalise('registry:5000/app') == 'registry:5000/app:latest'
+        assert normalise('ubuntu@sha256:aaa') == 'ubuntu@sha256:aaa'
+
+    def test_parse_inventory(self):
+        images, cached = parse_inventory(self.run_command(inventory_command(self.cache, 300)))
+
+        assert not cached
+        assert images == {'ubuntu:14.04': 'sha256:111', 'ubuntu@sha256:aaa': 'sha256:111',
+                          'registry:5000/app:v1': 'sha256:222'}
+
+    def test_cached_within_ttl(self):
+        self.run_command(inventory_command(self.cache, 300))
+        images, cached = parse_inventory(self.run_command(inventory_command(self.cache, 300)))
+
+        assert cached
+        assert len(images) == 3
+        assert self.calls() == 1
+
+    def test_expired_and_invalidated(self):
+        self.run_command(inventory_command(self.cache, 0))
+        self.run_command(inventory_command(self.cache, 0))
+        assert self.calls() == 2
+
+        self.run_command(invalidate_command(self.cache))
+        assert not os.path.exists(self.cache)
+
+    def test_split_present(self):
+        images, cached = parse_inventory(self.run_command(inventory_command(self.cache, 300)))
+        present, missing = split_present(['ubuntu:14.04', 'ubuntu', 'ubuntu@sha256:aaa', 'centos'], images)
+
+        assert present == ['ubuntu:14.04', 'ubuntu@sha256:aaa']
+        assert missing == ['ubuntu', 'centos']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+
+from dgrid.scheduling.schedulers.Torque6.JobArray import JobArray
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.cgroups import CgroupLimits
+from dgrid.scheduling.utils.Errors import HostValueError
+from dgrid.scheduling.utils.job_array import parse_array, split_slots, lane_shares
+from dgrid.scheduling.utils.numa import parse_cpu_list
+
+from dgrid.conf import settings
+
+
+class ParseArrayTests(unittest.TestCase):
+
+    def test_range(self):
+        assert parse_array('0-4') == ([0, 1, 2, 3, 4], None)
+
+    def test_list_and_ranges(self):
+        assert parse_array('1,4,10-12') == ([1, 4, 10, 11, 12], None)
+
+    def test_step(self):
+        assert parse_array('0-30:10') == ([0, 10, 20, 30], None)
+
+    def test_limit(self):
+        assert parse_array('0-999%8') == (list(range(1000)), 8)
+
+    def test_repeats_dropped(self):
+        assert parse_array('1-3,2,3-4')[0] == [1, 2, 3, 4]
+
+    def test_invalid(self):
+        for spec in ('', 'a-b', '5-1', '0-9:0', '0-9%0', '0-9%x', '-1', '1,,2'):
+            with self.assertRaises(ValueError):
+                parse_array(spec)
+
+
+class SplitSlotsTests(unittest.TestCase):
+
+    def test_split(self):
+        hosts = ['head', 'head', 'node1', 'node1', 'node2']
+
+        assert split_slots(hosts, 2, 'head') == [['head', 'node1', 'node2'], ['head', 'node1']]
+
+    def test_fewer_lanes_than_head_slots(self):
+        hosts = ['head', 'head', 'head', 'node1']
+
+        assert split_slots(hosts, 2, 'head') == [['head', 'head'], ['head', 'node1']]
+
+    def test_limited_by_head_slots(self):
+        hosts = ['head', 'node1', 'node2']
+
+        assert split_slots(hosts, 4, 'head') == [['head', 'node1', 'node2']]
+
+    def test_head_missing(self):
+        with self.assertRaises(HostValueError):
+            split_slots(['node1', 'node2'], 2, 'head')
+
+    def test_lane_shares(self):
+        hosts = ['head', 'head', 'node1', 'node1', 'node1', 'node2']
+
+        assert lane_shares(hosts, split_slots(hosts, 2, 'head')) == [
+            {'head': (0, 1, 2), 'node1': (0, 2, 3)}, {'head': (1, 1, 2), 'node1': (2, 1, 3), 'node2': (0, 1, 1)}]
+
+
+class LanePartitionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.environment = dict(os.environ)
+        self.numa_partitioning = settings.numa_partitioning
+        settings.numa_partitioning = True
+        os.environ['PBS_JOBID'] = '8'
+        self.hostname = socket.gethostname()
+        self.tmp = tempfile.mkdtemp()
+
+        # Two lanes, each with one of the head node's slots and two of node1's
+        hosts = [self.hostname] * 2 + ['node1'] * 4
+        lanes = split_slots(hosts, 2, self.hostname)
+        self.executors = []
+        for lane, shares in zip(lanes, lane_shares(hosts, lanes)):
+            containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+            executor = SSHExecutor(containers, lane, self.tmp)
+            executor.slot_shares = shares
+            executor.placement = {'node1': executor.containers[:2]}
+            for host in (self.hostname, 'node1'):
+                # Two NUMA nodes of four cpus each, all given to the job
+                executor.host_limits[host] = CgroupLimits(1, cpu_set='0-7', memory='800b')
+                executor.host_topology[host] = OrderedDict([(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])])
+            self.executors.append(executor)
+
+    def tearDown(self):
+        settings.numa_partitioning = self.numa_partitioning
+        os.environ.clear()
+        os.environ.update(self.environment)
+        shutil.rmtree(self.tmp)
+
+    def lane_cpus(self, host):
+        return [sorted(cpu for cpus, mems, memory in executor.get_partition(host).values()
+                       for cpu in parse_cpu_list(cpus)) for executor in self.executors]
+
+    def test_lanes_disjoint_on_shared_host(self):
+        first, second = self.lane_cpus('node1')
+
+        assert first == [0, 1, 2, 3] and second == [4, 5, 6, 7]
+        # Each lane splits its own share between its containers, and its part of the memory limit
+        partition = self.executors[0].get_partition('node1')
+        assert sorted(cpus for cpus, mems, memory in partition.values()) == ['0-1', '2-3']
+        assert set(memory for cpus, mems, memory in partition.values()) == set(['200b'])
+
+    def test_interactive_containers_disjoint(self):
+        first, second = self.lane_cpus(self.hostname)
+
+        assert first == [0, 1, 2, 3] and second == [4, 5, 6, 7]
+        assert list(self.executors[1].get_partition(self.hostname).keys()) == [self.executors[1].int_container.name]
+
+
+class ArrayContainersTests(unittest.TestCase):
+
+    def test_index_variable(self):
+        jobs = fileparser.get_array_containers(os.getcwd() + '/tests/file_parser/dockerdef.json', [3, 7])
+
+        assert list(jobs.keys()) == [3, 7]
+        for index, containers in jobs.items():
+            for container in containers:
+                assert container.environment_vars[-1] == 'DGRID_ARRAY_INDEX=%d' % index
+
+    def test_sub_jobs_independent(self):
+        jobs = fileparser.get_array_containers(os.getcwd() + '/tests/file_parser/dockerdef.json', [0, 1])
+        first, second = jobs[0][0], jobs[1][0]
+
+        assert first.template is second.template
+        assert 'DGRID_ARRAY_INDEX=1' not in first.run()
+        assert 'DGRID_ARRAY_INDEX=1' in second.run()
+
+
+class FakeExecutor(object):
+    # Records the calls JobArray makes, sub-jobs fail when their index is in failing
+    failing = ()
+    log = []
+
+    def __init__(self, containers, hosts, work_dir=None):
+        self.int_container = containers[0]
+        self.containers = containers[1:]
+        self.hosts = hosts
+        self.work_dir = work_dir
+        self.create_net = True
+        self.network_name = None
+        self.in_array = False
+        self.lock = threading.Lock()
+
+    def record(self, *call):
+        with self.lock:
+            FakeExecutor.log.append(call)
+
+    def share(self, lead):
+        self.network_name = lead.network_name
+        self.in_array = True
+
+    def start_staging(self, assignments):
+        self.record('staging', sorted(set(host for host, container in assignments)))
+        return ()
+
+    def finish_staging(self):
+        pass
+
+    def wait_for(self, pending, deadline=None):
+        return pending.get()
+
+    def docker_network(self, create=False, remove=False):
+        self.record('network', 'create' if create else 'remove')
+
+    def run(self):
+        index = int(self.int_container.environment_vars[-1].split('=')[1])
+        assert os.path.basename(self.work_dir) == 'dgrid-array-%d' % index
+        self.record('run', index, tuple(self.hosts), self.network_name)
+        for container in self.containers:
+            container.execution_host = self.hosts[0]
+        sys.exit(1 if index in FakeExecutor.failing else 0)
+
+    def terminate_clean(self):
+        self.record('terminate')
+
+    def remove_images(self):
+        self.record('remove_images', len(self.containers))
+
+    def report_inventory(self):
+        self.record('report_inventory')
+
+    def close_connections(self):
+        self.record('close_connections')
+
+
+class JobArrayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.workdir = os.environ.get('PBS_O_WORKDIR')
+        os.environ['PBS_O_WORKDIR'] = self.tmp
+        FakeExecutor.log = []
+        FakeExecutor.failing = ()
+        self.prestage_images = settings.prestage_images
+        settings.prestage_images = True
+        self.jobs = fileparser.get_array_containers(os.getcwd() + '/tests/file_parser/dockerdef.json', range(6))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        settings.prestage_images = self.prestage_images
+        if self.workdir is None:
+            del os.environ['PBS_O_WORKDIR']
+        else:
+            os.environ['PBS_O_WORKDIR'] = self.workdir
+
+    def run_array(self, concurrency=2):
+        array = JobArray(FakeExecutor, self.jobs, ['head', 'head', 'node1', 'node2'], concurrency)
+        array.hostname = 'head'
+        return array.run()
+
+    def test_runs_every_sub_job(self):
+        results = self.run_array()
+
+        assert results == dict((index, 0) for index in range(6))
+        runs = [call for call in FakeExecutor.log if call[0] == 'run']
+        assert sorted(call[1] for call in runs) == list(range(6))
+        # Lanes split the slots, every sub-job uses the array's network
+        assert set(call[2] for call in runs) == set([('head', 'node1'), ('head', 'node2')])
+        assert len(set(call[3] for call in runs)) == 1
+        assert os.listdir(self.tmp) == []
+
+    def test_shared_setup_and_cleanup(self):
+        self.run_array()
+        log = FakeExecutor.log
+
+        # Images are staged on every host once, before the network is created
+        assert log[:2] == [('staging', ['head', 'node1', 'node2']), ('network', 'create')]
+        assert log[-4:] == [('network', 'remove'), ('remove_images', sum(len(c) - 1 for c in self.jobs.values())),
+                            ('report_inventory',), ('close_connections',)]
+        assert log.count(('network', 'create')) == 1
+
+    def test_failures_reported(self):
+        FakeExecutor.failing = (2, 5)
+
+        results = self.run_array(concurrency=1)
+
+        assert [index for index in sorted(results) if results[index] != 0] == [2, 5]
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.executor_base import ExecutorBase
+from dgrid.scheduling.utils.launch_script import build_launch_script, parse_launch_results
+
+
+class LaunchScriptTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.containers = fileparser.get_containers(self.cwd + '/tests/torque/Dockerdef3.json')[1:]
+
+        # Fake docker binary, records the commands it is called with
+        self.write_script('docker', '#!/bin/sh\necho "$@" >> %s/docker.log\n'
+                                    'if [ "$1" = "run" ]; then echo abc123; else echo 4242; fi\n' % self.tmp)
+        self.write_script('pbs_track', '#!/bin/sh\necho "$@" >> %s/pbs_track.log\n' % self.tmp)
+
+        for container in self.containers:
+            container.cpu_shares = '1024'
+            container.cpu_set = '0-3'
+
+    def write_script(self, name, content):
+        with open(self.tmp + '/' + name, 'w') as f:
+            f.write(content)
+        os.chmod(self.tmp + '/' + name, 0o755)
+
+    def run_script(self, script):
+        environment = dict(os.environ)
+        environment['PATH'] = self.tmp + ':' + environment['PATH']
+        proc = Popen(['sh', '-c', script], stdout=PIPE, stderr=PIPE, env=environment)
+        out, err = proc.communicate()
+        return out.decode('utf-8')
+
+    def test_launches_all_containers(self):
+        script = build_launch_script(self.containers, self.tmp + '/pbs_track', '8')
+        launched, error = parse_launch_results(self.run_script(script))
+
+        assert error is None
+        assert [result['name'] for result in launched] == [container.name for container in self.containers]
+        assert all(result['container_id'] == 'abc123' and result['pid'] == '4242' for result in launched)
+        assert all(result['limits'] == {'cpu_shares': '1024', 'cpu_set': '0-3'} for result in launched)
+
+        with open(self.tmp + '/docker.log') as f:
+            runs = [line for line in f.read().splitlines() if line.startswith('run')]
+        assert len(runs) == len(self.containers)
+        assert all('--cpu-shares=1024 --cpuset-cpus=0-3' in line for line in runs)
+
+        with open(self.tmp + '/pbs_track.log') as f:
+            assert f.read().splitlines() == ['-j 8 -a 4242'] * len(self.containers)
+
+    def test_reads_limits(self):
+        for container in self.containers:
+            container.cpu_shares = None
+            container.cpu_set = None
+        script = build_launch_script(self.containers, None, '8', 'limit_args="--cpu-shares=512 --cpuset-cpus=4-7"')
+        launched, error = parse_launch_results(self.run_script(script))
+
+        assert error is None and len(launched) == len(self.containers)
+        with open(self.tmp + '/docker.log') as f:
+            runs = [line for line in f.read().splitlines() if line.startswith('run')]
+        assert all(line.startswith('run --cpu-shares=512 --cpuset-cpus=4-7 ') for line in runs)
+        assert all(result['limits'] == {'cpu_shares': '512', 'cpu_set': '4-7'} for result in launched)
+
+    def test_read_limits_set_on_containers(self):
+        for container in self.containers:
+            container.cpu_shares = None
+            container.cpu_set = None
+        script = build_launch_script(self.containers, None, '8',
+                                     'limit_args="--cpu-shares=512 --cpuset-cpus=4-7 --memory=2048b"')
+
+        ExecutorBase().check_launch('node1', self.containers, self.run_script(script))
+
+        assert all((container.cpu_shares, container.cpu_set, container.memory) == ('512', '4-7', '2048b')
+                   for container in self.containers)
+
+    def test_reports_failed_step(self):
+        self.write_script('pbs_track', '#!/bin/sh\nexit 1\n')
+        script = build_launch_script(self.containers, self.tmp + '/pbs_track', '8')
+        launched, error = parse_launch_results(self.run_script(script))
+
+        assert launched == [] and error == {'name': self.containers[0].name, 'step': 'pbs_track'}
+
+    def test_without_tracking(self):
+        script = build_launch_script(self.containers, None, '8')
+        launched, error = parse_launch_results(self.run_script(script))
+
+        assert error is None and len(launched) == len(self.containers)
+        assert not os.path.exists(self.tmp + '/pbs_track.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
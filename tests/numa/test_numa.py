@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils import numa
+
+
+class NumaTests(unittest.TestCase):
+
+    def setUp(self):
+        # Two NUMA nodes of eight cpus each
+        self.topology = numa.OrderedDict([(0, list(range(0, 8))), (1, list(range(8, 16)))])
+        self.node_dir = tempfile.mkdtemp()
+
+    def slice_nodes(self, slices):
+        return [nodes for cpus, nodes in slices]
+
+    def test_cpu_list(self):
+        assert numa.parse_cpu_list('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+        assert numa.format_cpu_list([11, 0, 1, 2, 3, 8, 10]) == '0-3,8,10-11'
+
+    def test_disjoint_slices_inside_nodes(self):
+        slices = numa.partition(list(range(16)), self.topology, 4)
+
+        assert [cpus for cpus, nodes in slices] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]
+        assert self.slice_nodes(slices) == [[0], [0], [1], [1]]
+
+    def test_only_job_cpus_used(self):
+        slices = numa.partition([2, 3, 4, 5, 12, 13], self.topology, 3)
+        used = [cpu for cpus, nodes in slices for cpu in cpus]
+
+        assert sorted(used) == [2, 3, 4, 5, 12, 13] and len(set(used)) == 6
+        assert self.slice_nodes(slices) == [[0], [0], [1]]
+
+    def test_whole_nodes_for_few_containers(self):
+        topology = numa.OrderedDict((node, [node * 2, node * 2 + 1]) for node in range(4))
+        slices = numa.partition(list(range(8)), topology, 2)
+
+        assert slices == [([0, 1, 2, 3], [0, 1]), ([4, 5, 6, 7], [2, 3])]
+
+    def test_uneven_split(self):
+        slices = numa.partition(list(range(16)), self.topology, 3)
+
+        # Slices stay inside a node rather than balancing sizes across nodes
+        assert [len(cpus) for cpus, nodes in slices] == [4, 4, 8]
+        assert self.slice_nodes(slices) == [[0], [0], [1]]
+
+    def test_no_topology(self):
+        slices = numa.partition([0, 1, 2, 3], numa.OrderedDict(), 2)
+
+        assert slices == [([0, 1], None), ([2, 3], None)]
+
+    def test_more_containers_than_cpus(self):
+        assert numa.partition([0, 1], self.topology, 3) is None
+
+    def test_split_memory(self):
+        slices = numa.partition(list(range(16)), self.topology, 3)
+        memory = numa.split_memory(1600, slices)
+
+        assert memory == [len(cpus) * 100 for cpus, nodes in slices]
+
+    def test_read_topology(self):
+        for node, cpus in self.topology.items():
+            os.makedirs(self.node_dir + '/node%d' % node)
+            with open(self.node_dir + '/node%d/cpulist' % node, 'w') as f:
+                f.write(numa.format_cpu_list(cpus) + '\n')
+
+        def run(command):
+            return Popen(['sh', '-c', command], stdout=PIPE).communicate()[0].decode('utf-8')
+
+        assert numa.read_topology(self.node_dir) == self.topology
+        assert numa.read_remote_topology(run, self.node_dir) == self.topology
+
+    def tearDown(self):
+        shutil.rmtree(self.node_dir)
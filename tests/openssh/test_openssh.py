@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from dgrid.scheduling.utils.openssh import OpenSSHPool, split_host
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+
+class OpenSSHPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Fake ssh binary, records its arguments and runs the remote command locally
+        ssh = self.tmp + '/ssh'
+        with open(ssh, 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> %s/ssh.log\n'
+                    'for last in "$@"; do :; done\n'
+                    'case " $* " in *" -O exit "*) exit 0;; esac\n'
+                    'exec sh -c "$last"\n' % self.tmp)
+        os.chmod(ssh, 0o755)
+        self.pool = OpenSSHPool(ssh)
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.tmp)
+
+    def ssh_log(self):
+        with open(self.tmp + '/ssh.log') as f:
+            return f.read().splitlines()
+
+    def test_split_host(self):
+        assert split_host('user@node1:2222') == ('user', 'node1', '2222')
+        assert split_host('node1') == (None, 'node1', None)
+
+    def test_ssh_command(self):
+        command = self.pool.ssh_command('user@node1:2222', 'hostname')
+        assert command[0] == self.tmp + '/ssh'
+        assert 'ControlMaster=auto' in command
+        assert 'ControlPath=' + self.pool.control_dir + '/%r@%h:%p' in command
+        assert command[-4:] == ['-l', 'user', 'node1', 'hostname']
+        assert command[command.index('-p') + 1] == '2222'
+
+    def test_run(self):
+        assert self.pool.run('node1', 'echo hello; echo err >&2') == 'hello\nerr'
+
+    def test_run_failure(self):
+        with self.assertRaises(RemoteExecutionError):
+            self.pool.run('node1', 'exit 3')
+        assert self.pool.run('node1', 'echo partial; exit 3', warn_only=True) == 'partial'
+
+    def test_run_all_in_order(self):
+        jobs = [('node%d' % i, 'sleep 0.%d; echo %d' % (5 - i, i)) for i in range(5)]
+        assert self.pool.run_all(jobs) == [(0, str(i)) for i in range(5)]
+
+    def test_run_all_concurrently(self):
+        jobs = [('node%d' % i, 'sleep 0.5') for i in range(8)]
+        start = time.time()
+        self.pool.run_all(jobs, concurrency=8)
+        assert time.time() - start < 2
+
+    def test_run_all_stop_on_failure(self):
+        jobs = [('node1', 'exit 2'), ('node2', 'echo ok'), ('node3', 'echo ok')]
+        results = self.pool.run_all(jobs, concurrency=1, stop_on_failure=True)
+        assert results == [(2, ''), None, None]
+
+    def test_run_all_large_output(self):
+        results = self.pool.run_all([('node1', 'seq 1 100000')])
+        assert results[0][1].splitlines()[-1] == '100000'
+
+    def test_stats_and_close(self):
+        self.pool.run('node1', 'true')
+        self.pool.run('node1', 'true')
+        self.pool.run('node2', 'true')
+        assert self.pool.stats() == {'opened': 2, 'reused': 1}
+
+        control_dir = self.pool.control_dir
+        self.pool.close_all()
+        exits = [line for line in self.ssh_log() if '-O exit' in line]
+        assert len(exits) == 2
+        assert not os.path.exists(control_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import time
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils.output import stream_output, clock, STDOUT, STDERR
+
+
+class StreamOutputTests(unittest.TestCase):
+
+    def run_script(self, script, buffer_lines=1000):
+        lines = []
+        process = Popen(['sh', '-c', script], stdout=PIPE, stderr=PIPE)
+        exit_code = stream_output(process, lambda stream, timestamp, line: lines.append((stream, timestamp, line)),
+                                  buffer_lines)
+        return exit_code, lines
+
+    def test_interleaved_order(self):
+        exit_code, lines = self.run_script('echo one; sleep 0.2; echo two >&2; sleep 0.2; echo three; exit 3')
+
+        assert exit_code == 3
+        assert [(stream, line) for stream, timestamp, line in lines] == \
+            [(STDOUT, 'one'), (STDERR, 'two'), (STDOUT, 'three')]
+        assert lines[0][1] <= lines[1][1] <= lines[2][1]
+
+    def test_full_stderr_pipe_does_not_stall(self):
+        # Far more than a pipe buffer on stderr before anything on stdout
+        exit_code, lines = self.run_script('i=0; while [ $i -lt 5000 ]; do echo "error line $i" >&2; i=$((i+1)); done;'
+                                           ' echo done', buffer_lines=10)
+
+        assert exit_code == 0
+        assert len([line for stream, timestamp, line in lines if stream == STDERR]) == 5000
+        assert [(stream, line) for stream, timestamp, line in lines if stream == STDOUT] == [(STDOUT, 'done')]
+
+    def test_clock_ignores_system_time(self):
+        system_time = time.time
+        time.time = lambda: 0.0
+        try:
+            start = clock()
+            time.sleep(0.1)
+            assert clock() - start >= 0.05
+        finally:
+            time.time = system_time
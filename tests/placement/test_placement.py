@@ -0,0 +1,54 @@
+import unittest
+
+from dgrid.scheduling.utils import placement
+from dgrid.scheduling.utils.Errors import PlacementError
+
+
+class PlacementTests(unittest.TestCase):
+
+    def setUp(self):
+        # Torque lists each host once per allocated core
+        self.slots = placement.host_slots(['head', 'head', 'node1', 'node1', 'node1', 'node2', 'node1', 'node2'])
+        self.containers = ['c%d' % i for i in range(5)]
+
+    def hosts(self, assignments):
+        return [host for host, container in assignments]
+
+    def test_host_slots(self):
+        assert list(self.slots.items()) == [('head', 2), ('node1', 4), ('node2', 2)]
+
+    def test_pack(self):
+        assignments = placement.place(self.containers, self.slots, 'pack')
+
+        assert self.hosts(assignments) == ['head', 'head', 'node1', 'node1', 'node1']
+        assert [container for host, container in assignments] == self.containers
+
+    def test_spread(self):
+        assignments = placement.place(self.containers, self.slots, 'spread')
+
+        assert self.hosts(assignments) == ['node1', 'node1', 'head', 'node1', 'node2']
+
+    def test_round_robin(self):
+        assignments = placement.place(self.containers, self.slots, 'round-robin')
+
+        assert self.hosts(assignments) == ['head', 'node1', 'node2', 'head', 'node1']
+
+    def test_skips_full_hosts(self):
+        self.slots['head'] = 0
+        for strategy in placement.STRATEGIES:
+            assignments = placement.place(self.containers, self.slots, strategy)
+            assert 'head' not in self.hosts(assignments) and len(assignments) == 5
+
+    def test_never_exceeds_slots(self):
+        containers = ['c%d' % i for i in range(8)]
+        for strategy in placement.STRATEGIES:
+            grouped = placement.placement_map(placement.place(containers, self.slots, strategy))
+            assert dict((host, len(c)) for host, c in grouped.items()) == dict(self.slots)
+
+    def test_not_enough_slots(self):
+        containers = ['c%d' % i for i in range(9)]
+
+        self.assertRaises(PlacementError, placement.place, containers, self.slots, 'pack')
+
+    def test_unknown_strategy(self):
+        self.assertRaises(PlacementError, placement.place, self.containers, self.slots, 'DOES_NOT_EXIST')
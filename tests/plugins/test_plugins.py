@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from dgrid.scheduling.utils import plugins
+from dgrid.scheduling.utils.Errors import PluginNotFoundError
+
+PLUGIN = """
+class FastExecutor(object):
+    def __init__(self, containers, hosts, work_dir=None):
+        self.containers = containers
+
+
+class Schedulers(object):
+    class Nested(object):
+        pass
+"""
+
+ENTRY_POINTS = """[dgrid.executors]
+FAST_LAUNCH = dgrid_fake_plugin:FastExecutor
+SSH = dgrid_fake_plugin:FastExecutor
+
+[dgrid.schedulers]
+Nested = dgrid_fake_plugin:Schedulers.Nested
+Missing = dgrid_fake_plugin:DoesntExist
+"""
+
+
+class PluginTests(unittest.TestCase):
+
+    def setUp(self):
+        # An installed package registering dgrid backends
+        self.tmp = tempfile.mkdtemp()
+        with open(self.tmp + '/dgrid_fake_plugin.py', 'w') as f:
+            f.write(PLUGIN)
+        info = self.tmp + '/dgrid_fake_plugin.egg-info'
+        os.mkdir(info)
+        with open(info + '/PKG-INFO', 'w') as f:
+            f.write('Metadata-Version: 1.1\nName: dgrid-fake-plugin\nVersion: 1.0\n')
+        with open(info + '/entry_points.txt', 'w') as f:
+            f.write(ENTRY_POINTS)
+
+        sys.path.insert(0, self.tmp)
+        try:
+            # pkg_resources only sees packages on sys.path when it was imported
+            import pkg_resources
+            pkg_resources.working_set.add_entry(self.tmp)
+        except ImportError:
+            pass
+        plugins.clear_cache()
+
+    def tearDown(self):
+        sys.path.remove(self.tmp)
+        sys.modules.pop('dgrid_fake_plugin', None)
+        shutil.rmtree(self.tmp)
+        plugins.clear_cache()
+
+    def test_builtin_without_scanning(self):
+        klass = plugins.load(plugins.EXECUTORS, 'async_ssh')
+
+        assert klass.__name__ == 'AsyncSSHExecutor'
+        assert plugins._discovered == {}
+
+    def test_discovers_plugin(self):
+        klass = plugins.load(plugins.EXECUTORS, 'FAST_LAUNCH')
+
+        assert klass.__name__ == 'FastExecutor'
+        assert 'FAST_LAUNCH' in plugins.discover(plugins.EXECUTORS)
+
+    def test_discovery_cached(self):
+        assert plugins.discover(plugins.SCHEDULERS) is plugins.discover(plugins.SCHEDULERS)
+
+    def test_builtin_not_replaced(self):
+        assert plugins.discover(plugins.EXECUTORS)['SSH'] == plugins.BUILTIN[plugins.EXECUTORS]['SSH']
+        assert plugins.load(plugins.EXECUTORS, 'SSH').__name__ == 'SSHExecutor'
+
+    def test_nested_attribute(self):
+        assert plugins.load(plugins.SCHEDULERS, 'nested').__name__ == 'Nested'
+
+    def test_missing_attribute(self):
+        self.assertRaises(PluginNotFoundError, plugins.load, plugins.SCHEDULERS, 'Missing')
+
+    def test_unknown(self):
+        with self.assertRaises(PluginNotFoundError) as raised:
+            plugins.load(plugins.SCHEDULERS, 'DoesntExist')
+
+        assert 'Torque6' in str(raised.exception)
+        assert isinstance(raised.exception, ImportError)
+
+    def test_default(self):
+        klass = plugins.load(plugins.SCHEDULERS, 'DoesntExist', 'dgrid_fake_plugin:FastExecutor')
+
+        assert klass.__name__ == 'FastExecutor'
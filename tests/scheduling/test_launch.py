@@ -0,0 +1,167 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from dgrid.scheduling.schedulers.Torque6.SSHExecutor import SSHExecutor
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.cgroups import CgroupLimits
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+from dgrid.conf import settings
+
+
+class FakePool(object):
+    """
+    Stands in for the executor's connection pool, recording the commands run on each host and how many ran at once.
+    docker run fails on fail_host
+    """
+
+    def __init__(self, fail_host=None, delay=0.05):
+        self.fail_host = fail_host
+        self.delay = delay
+        self.commands = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+
+    def run(self, host, command, warn_only=False):
+        with self.lock:
+            self.commands.append((host, command))
+            self.running += 1
+            self.most = max(self.most, self.running)
+        try:
+            time.sleep(self.delay)
+            if host == self.fail_host and command.startswith('docker run'):
+                raise RemoteExecutionError("docker run failed on " + host)
+            return '4242'
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def hosts(self, prefix):
+        return [host for host, command in self.commands if command.startswith(prefix)]
+
+
+class ParallelLaunchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.environment = dict(os.environ)
+        self.saved = dict((name, getattr(settings, name)) for name in
+                          ('parallel_launch', 'launch_pool_size', 'batched_launch', 'numa_partitioning',
+                           'image_cleanup', 'teardown_deadline', 'pbs_track'))
+        settings.parallel_launch = True
+        settings.batched_launch = False
+        settings.numa_partitioning = False
+        settings.image_cleanup = 0
+        settings.teardown_deadline = 10
+
+        # Fake docker and pbs_track binaries, for the containers run on this host
+        with open(self.tmp + '/docker', 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> %s/docker.log\n[ "$1" != "inspect" ] || echo 4242\n' % self.tmp)
+        with open(self.tmp + '/pbs_track', 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> %s/pbs_track.log\n' % self.tmp)
+        for name in ('docker', 'pbs_track'):
+            os.chmod(self.tmp + '/' + name, 0o755)
+        settings.pbs_track = self.tmp + '/pbs_track'
+        os.environ['PATH'] = self.tmp + ':' + os.environ['PATH']
+        os.environ['PBS_JOBID'] = '8'
+
+        self.nodes = ['node1', 'node2', 'node3']
+        containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+        self.executor = SSHExecutor(containers, [socket.gethostname()] + self.nodes, self.tmp)
+        for node in self.nodes:
+            self.executor.host_limits[node] = CgroupLimits(1)
+        self.assignments = list(zip(self.nodes, self.executor.containers))
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        os.environ.clear()
+        os.environ.update(self.environment)
+        shutil.rmtree(self.tmp)
+
+    def test_launch_all_hosts(self):
+        settings.launch_pool_size = 2
+        self.executor.pool = FakePool()
+
+        self.executor.launch_parallel(self.assignments)
+
+        assert sorted(self.executor.pool.hosts('docker run')) == self.nodes
+        assert [container.execution_host for container in self.executor.containers] == self.nodes
+
+    def test_pool_size_limits_concurrency(self):
+        settings.launch_pool_size = 2
+        self.executor.pool = FakePool()
+
+        self.executor.launch_parallel(self.assignments)
+
+        assert self.executor.pool.most == 2
+
+    def test_abort_on_first_failure(self):
+        # One host at a time, so the hosts after the failed one are never started
+        settings.launch_pool_size = 1
+        self.executor.pool = FakePool(fail_host='node1')
+
+        self.assertRaises(SystemExit, self.executor.launch_parallel, self.assignments)
+
+        assert self.executor.pool.hosts('docker run') == ['node1']
+        assert [container.execution_host for container in self.executor.containers] == ['node1', None, None]
+
+    def test_teardown_only_launched_hosts(self):
+        settings.launch_pool_size = 1
+        self.executor.pool = FakePool(fail_host='node2')
+
+        self.assertRaises(SystemExit, self.executor.launch_parallel, self.assignments)
+
+        assert self.executor.pool.hosts('docker run') == ['node1', 'node2']
+        assert sorted(self.executor.pool.hosts('docker stop')) == ['node1', 'node2']
+        with open(self.tmp + '/docker.log') as f:
+            assert f.read().split() == ['rm', '-fv', self.executor.int_container.name]
+
+    def test_head_node_in_process(self):
+        # Containers placed on this host are run and torn down without going through the pool
+        self.executor.pool = FakePool()
+        self.executor.host_limits[socket.gethostname()] = CgroupLimits(1)
+        head, remote = self.executor.containers[0], self.executor.containers[1]
+
+        self.executor.launch_parallel([(socket.gethostname(), head), ('node1', remote)])
+        self.executor.terminate_clean()
+
+        assert set(host for host, command in self.executor.pool.commands) == set(['node1'])
+        with open(self.tmp + '/docker.log') as f:
+            commands = [line.split()[0] for line in f.read().splitlines()]
+        # The interactive container is removed while the other hosts tear down
+        assert commands[:2] == ['run', 'inspect'] and sorted(commands[2:]) == ['rm', 'rm', 'stop']
+        with open(self.tmp + '/pbs_track.log') as f:
+            assert f.read().split() == ['-j', '8', '-a', '4242']
+
+    def test_launch_host_stops_once_aborted(self):
+        self.executor.pool = FakePool()
+        abort_launch = threading.Event()
+        abort_launch.set()
+
+        result = self.executor.launch_host('node1', self.executor.containers, abort_launch)
+
+        assert result == {'launched': [], 'error': None}
+        assert self.executor.pool.commands == []
+
+    def test_launch_host_failure_sets_abort(self):
+        self.executor.pool = FakePool(fail_host='node1')
+        abort_launch = threading.Event()
+
+        result = self.executor.launch_host('node1', self.executor.containers, abort_launch)
+
+        # The failed container is recorded, it may have been left running
+        assert result['launched'] == [self.executor.containers[0].name]
+        assert result['error'].startswith('RemoteExecutionError')
+        assert abort_launch.is_set()
+        assert self.executor.pool.hosts('docker run') == ['node1']
+
+
+if __name__ == '__main__':
+    unittest.main()
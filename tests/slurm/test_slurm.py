@@ -0,0 +1,211 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from dgrid.conf import settings
+from dgrid.scheduling import schedule
+from dgrid.scheduling.schedulers.Slurm.SrunExecutor import SrunExecutor
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.Errors import HostValueError
+from dgrid.scheduling.utils.nodelist import expand_nodelist, expand_counts, read_nodelist, slurm_hosts
+
+# Fake srun, runs each task's program in turn with the task's node in SLURMD_NODENAME,
+# numbering tasks in reverse node order as Slurm's own node order may differ from the node list's
+SRUN = """#!%s
+import os, subprocess, sys
+args = sys.argv[1:]
+with open(os.path.join(%r, 'srun.log'), 'a') as f:
+    f.write(' '.join(args) + '\\n')
+nodes = [arg.split('=', 1)[1] for arg in args if arg.startswith('--nodelist=')][0].split(',')
+with open(args[args.index('--multi-prog') + 1]) as f:
+    program = f.read().split()[1:]
+status = 0
+for rank, node in enumerate(sorted(nodes, reverse=True)):
+    environment = dict(os.environ, SLURMD_NODENAME=node, SLURM_PROCID=str(rank))
+    proc = subprocess.Popen(program, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=environment)
+    for line in proc.communicate()[0].decode('utf-8').splitlines():
+        sys.stdout.write('%%d: %%s\\n' %% (rank, line))
+    status = max(status, proc.returncode)
+sys.exit(status)
+"""
+
+# Fake docker, records its commands with the node they ran on, docker run fails on FAIL_NODE
+DOCKER = """#!/bin/sh
+echo "$SLURMD_NODENAME $@" >> %s/docker.log
+if [ "$1" = "run" ]; then
+    [ "$SLURMD_NODENAME" != "$FAIL_NODE" ] || exit 1
+    echo abc123
+elif [ "$1" = "inspect" ]; then
+    echo 4242
+fi
+"""
+
+SCONTROL = """#!/bin/sh
+echo "$@" >> %s/scontrol.log
+echo odd-a
+echo odd-b
+"""
+
+
+class NodelistTests(unittest.TestCase):
+
+    def test_ranges(self):
+        assert expand_nodelist('node[01-03,07],login1') == ['node01', 'node02', 'node03', 'node07', 'login1']
+
+    def test_suffix_and_several_brackets(self):
+        assert expand_nodelist('gpu[1-2]-ib') == ['gpu1-ib', 'gpu2-ib']
+        assert expand_nodelist('r[1-2]n[8-9]') == ['r1n8', 'r1n9', 'r2n8', 'r2n9']
+
+    def test_padding(self):
+        assert expand_nodelist('n[8-10]') == ['n8', 'n9', 'n10']
+        assert expand_nodelist('n[098-100]') == ['n098', 'n099', 'n100']
+
+    def test_invalid(self):
+        for nodelist in ('n[1-', 'n]', 'n[a]', 'n[3-1]', 'a,,b'):
+            self.assertRaises(ValueError, expand_nodelist, nodelist)
+
+    def test_counts(self):
+        assert expand_counts('2(x3),1') == [2, 2, 2, 1]
+        self.assertRaises(ValueError, expand_counts, '2(3)')
+
+    def test_hosts(self):
+        assert slurm_hosts('node[1-3]', '2(x2),1') == ['node1', 'node1', 'node2', 'node2', 'node3']
+        assert slurm_hosts('node[1-2]') == ['node1', 'node2']
+        self.assertRaises(HostValueError, slurm_hosts, 'node[1-2]', '1(x3)')
+        self.assertRaises(HostValueError, slurm_hosts, None)
+
+    def test_scontrol_fallback(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            with open(tmp + '/scontrol', 'w') as f:
+                f.write(SCONTROL % tmp)
+            os.chmod(tmp + '/scontrol', 0o755)
+
+            assert read_nodelist('odd[a-b]', tmp + '/scontrol') == ['odd-a', 'odd-b']
+            assert read_nodelist('node[1-2]', tmp + '/scontrol') == ['node1', 'node2']
+            with open(tmp + '/scontrol.log') as f:
+                assert f.read().splitlines() == ['show hostnames odd[a-b]']
+        finally:
+            shutil.rmtree(tmp)
+
+
+class SrunExecutorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.environment = dict(os.environ)
+        self.image_cleanup = settings.image_cleanup
+        self.docker_api = settings.docker_api
+        # Local docker operations go through the fake docker CLI
+        settings.docker_api = False
+        for name, content in (('srun', SRUN % (sys.executable, self.tmp)), ('docker', DOCKER % self.tmp)):
+            with open(self.tmp + '/' + name, 'w') as f:
+                f.write(content)
+            os.chmod(self.tmp + '/' + name, 0o755)
+
+        os.environ['PATH'] = self.tmp + ':' + os.environ['PATH']
+        os.environ['SLURM_JOB_NODELIST'] = 'node[1-3]'
+        os.environ['SLURM_TASKS_PER_NODE'] = '2(x2),1'
+        os.environ['SLURMD_NODENAME'] = 'node1'
+        os.environ['SLURM_JOB_ID'] = '77'
+        os.environ['SLURM_SUBMIT_DIR'] = self.tmp
+        os.environ.pop('FAIL_NODE', None)
+        self.containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        settings.image_cleanup = self.image_cleanup
+        settings.docker_api = self.docker_api
+        shutil.rmtree(self.tmp)
+
+    def log(self, name):
+        if not os.path.exists(self.tmp + '/' + name):
+            return []
+        with open(self.tmp + '/' + name) as f:
+            return f.read().splitlines()
+
+    def run_job(self):
+        with self.assertRaises(SystemExit) as raised:
+            SrunExecutor(self.containers, None).run()
+        return raised.exception.code
+
+    def test_one_step_launch(self):
+        assert self.run_job() == 0
+
+        steps = self.log('srun.log')
+        assert len(steps) == 2
+        assert '--job-name=dgrid-launch' in steps[0] and '--job-name=dgrid-teardown' in steps[1]
+        assert '--nodelist=node1,node2' in steps[0].split() and '--multi-prog' in steps[0].split()
+
+        runs = [line for line in self.log('docker.log') if line.split()[1] == 'run']
+        # Each container ran on the node it was placed on, the interactive container on this node
+        assert sorted(line.split()[0] for line in runs if '--name=slave' in line) == ['node1', 'node2', 'node2']
+        assert len([line for line in runs if '--name=head' in line]) == 1
+        assert all('--cgroup-parent=/slurm/uid_%d/job_77' % os.getuid() in line for line in runs)
+        assert all('--user=%d' % os.getuid() in line for line in runs)
+        assert not os.path.exists(self.tmp + '/.dgrid-steps-77')
+
+    def test_teardown(self):
+        self.run_job()
+
+        commands = [line.split()[:2] for line in self.log('docker.log')]
+        assert ['node1', 'stop'] in commands and ['node2', 'stop'] in commands
+        assert ['node3', 'stop'] not in commands
+        # The interactive container is removed locally
+        assert [line for line in self.log('docker.log') if line.startswith('node1 rm -fv head')]
+
+    def test_failed_launch_torn_down(self):
+        os.environ['FAIL_NODE'] = 'node2'
+
+        assert self.run_job() == 'Terminating'
+
+        steps = self.log('srun.log')
+        assert len(steps) == 2
+        assert '--job-name=dgrid-teardown' in steps[1]
+        # The interactive container never ran
+        assert not [line for line in self.log('docker.log') if line.startswith('node1 run') and '--name=head' in line]
+
+    def test_image_cleanup(self):
+        settings.image_cleanup = 2
+
+        self.run_job()
+
+        assert '--job-name=dgrid-cleanup' in self.log('srun.log')[-1]
+        assert 'node2 rmi ubuntu:14.04' in self.log('docker.log')
+
+    def test_launch_steps_independent_of_node_count(self):
+        os.environ['SLURM_JOB_NODELIST'] = 'node[1-40]'
+        os.environ['SLURM_TASKS_PER_NODE'] = '1(x40)'
+        for i in range(12):
+            self.containers.extend(fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[1:])
+
+        self.run_job()
+
+        assert len(self.log('srun.log')) == 2
+        assert len([line for line in self.log('docker.log') if line.split()[1] == 'run']) == 40
+
+    def test_scheduler(self):
+        scheduler = settings.scheduler
+        settings.scheduler = 'Slurm'
+        try:
+            job = schedule.Scheduler.get_scheduler(self.containers)
+        finally:
+            settings.scheduler = scheduler
+
+        assert type(job).__name__ == 'Slurm'
+        assert isinstance(job.executor, SrunExecutor)
+        assert job.executor.hosts == ['node1', 'node1', 'node2', 'node2', 'node3']
+
+    def test_array_not_supported(self):
+        scheduler = settings.scheduler
+        settings.scheduler = 'Slurm'
+        try:
+            job, jobs = schedule.load_array(os.getcwd() + '/tests/torque/Dockerdef3.json', [0, 1])
+        finally:
+            settings.scheduler = scheduler
+
+        assert job.executor is None
+        self.assertRaises(NotImplementedError, job.run_array, jobs)
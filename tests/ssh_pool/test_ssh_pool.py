@@ -0,0 +1,116 @@
+import io
+import threading
+import unittest
+
+from dgrid.scheduling.utils.ssh_pool import SSHConnectionPool
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+
+
+class FakeChannel(object):
+    def __init__(self, transport):
+        self.transport = transport
+        self.command = None
+
+    def set_combine_stderr(self, combine):
+        pass
+
+    def exec_command(self, command):
+        self.command = command
+        self.transport.commands.append(command)
+
+    def makefile(self, mode, bufsize):
+        return io.BytesIO(self.transport.outputs.get(self.command, b'output\n'))
+
+    def recv_exit_status(self):
+        return 1 if self.command == 'false' else 0
+
+    def close(self):
+        pass
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.active = True
+        self.commands = []
+        self.outputs = {}
+
+    def is_active(self):
+        return self.active
+
+    def open_session(self):
+        return FakeChannel(self)
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+class SSHConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = []
+        self.pool = SSHConnectionPool(connect=self.connect, shell=None)
+
+    def connect(self, host):
+        client = FakeClient()
+        self.clients.append((host, client))
+        return client
+
+    def test_reuses_connection_per_host(self):
+        self.pool.run('host1', 'echo 1')
+        self.pool.run('host1', 'echo 2')
+        self.pool.run('host2', 'echo 3')
+
+        assert self.pool.stats() == {'opened': 2, 'reused': 1}
+        assert self.clients[0][1].transport.commands == ['echo 1', 'echo 2']
+
+    def test_returns_stripped_output(self):
+        self.pool.get_transport('host1').outputs['cat cpu.shares'] = b'1024\n'
+
+        assert self.pool.run('host1', 'cat cpu.shares') == '1024'
+
+    def test_failed_command_raises(self):
+        self.assertRaises(RemoteExecutionError, self.pool.run, 'host1', 'false')
+
+    def test_failed_command_warn_only(self):
+        assert self.pool.run('host1', 'false', warn_only=True) == 'output'
+
+    def test_reconnects_dead_transport(self):
+        self.pool.run('host1', 'echo 1')
+        self.clients[0][1].transport.active = False
+        self.pool.run('host1', 'echo 2')
+
+        assert self.pool.stats() == {'opened': 2, 'reused': 0}
+        # The dead connection is closed before it is replaced
+        assert self.clients[0][1].closed and not self.clients[1][1].closed
+
+    def test_login_shell(self):
+        pool = SSHConnectionPool(connect=self.connect)
+        pool.run('host1', 'echo "$PATH" | cut -d: -f1')
+
+        assert self.clients[0][1].transport.commands == ['/bin/bash -l -c \'echo "$PATH" | cut -d: -f1\'']
+
+    def test_single_connection_across_threads(self):
+        threads = [threading.Thread(target=self.pool.run, args=('host1', 'echo')) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(self.clients) == 1 and self.pool.stats() == {'opened': 1, 'reused': 9}
+
+    def test_close_all(self):
+        self.pool.run('host1', 'echo 1')
+        self.pool.run('host2', 'echo 1')
+        self.pool.close_all()
+
+        assert all(client.closed for host, client in self.clients)
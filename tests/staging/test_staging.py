@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.staging import host_images, pull_command
+
+
+class StagingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+
+        # Fake docker binary, records the images pulled and fails for missing images
+        with open(self.tmp + '/docker', 'w') as f:
+            f.write('#!/bin/sh\necho "$2" >> %s/pulls.log\n[ "$2" != "missing" ]\n' % self.tmp)
+        os.chmod(self.tmp + '/docker', 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, command):
+        environment = dict(os.environ)
+        environment['PATH'] = self.tmp + ':' + environment['PATH']
+        return Popen(['sh', '-c', command], stdout=PIPE, stderr=PIPE, env=environment).wait()
+
+    def pulls(self):
+        with open(self.tmp + '/pulls.log') as f:
+            return f.read().splitlines()
+
+    def test_host_images_distinct(self):
+        first, second = self.containers[0], self.containers[1]
+        second.image = first.image
+        images = host_images([('node1', first), ('node2', first), ('node1', second)])
+
+        assert list(images.items()) == [('node1', [first.image]), ('node2', [first.image])]
+
+    def test_pull_command(self):
+        assert self.run_command(pull_command(['centos', 'ubuntu'])) == 0
+        assert self.pulls() == ['centos', 'ubuntu']
+
+    def test_pull_command_stops_at_failure(self):
+        assert self.run_command(pull_command(['centos', 'missing', 'ubuntu'])) != 0
+        assert self.pulls() == ['centos', 'missing']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+# Packages only the executors need
+HEAVY = ('fabric', 'paramiko', 'retry', 'Crypto', 'cryptography')
+
+REPORT = """
+heavy = [name for name in sys.modules if sys.modules[name] is not None and name.split('.')[0] in %r]
+sys.stdout.write('\\nheavy:' + ','.join(sorted(heavy)) + '\\n')
+""" % (HEAVY,)
+
+CLI = """
+import sys
+from dgrid.dgrid import main
+sys.argv = ['dgrid'] + sys.argv[1:]
+try:
+    main()
+except SystemExit as ex:
+    sys.stdout.write('\\nstatus:%s' % ex.code)
+""" + REPORT
+
+
+class StartupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_python(self, code, *args):
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.getcwd()
+        proc = Popen([sys.executable, '-c', code] + list(args), stdout=PIPE, stderr=PIPE, env=environment)
+        output = proc.communicate()[0].decode('utf-8')
+        return output.rsplit('heavy:', 1)[-1].strip().split(',') if 'heavy:' in output else None, output
+
+    def test_version(self):
+        heavy, output = self.run_python(CLI, '--version')
+
+        assert heavy == ['']
+
+    def test_help(self):
+        heavy, output = self.run_python(CLI, '--help')
+
+        assert 'dockdef' in output
+        assert heavy == ['']
+
+    def test_invalid_definition(self):
+        with open(self.tmp + '/invalid.json', 'w') as f:
+            f.write('{"containers": [{"name": "head", "image": "python:2"}]}')
+
+        heavy, output = self.run_python(CLI, '--dockdef', self.tmp + '/invalid.json')
+
+        assert 'status:1' in output
+        assert heavy == ['']
+
+    def test_scheduler_without_fabric(self):
+        # Executors are imported when a job runs, only the one used
+        code = "import sys\nimport dgrid.scheduling.schedulers.Torque6.Torque6\n" \
+               "sys.stdout.write('executor:%s' % ('dgrid.scheduling.schedulers.Torque6.SSHExecutor' in sys.modules))\n"
+
+        heavy, output = self.run_python(code + REPORT)
+
+        assert heavy == ['']
+        assert 'executor:False' in output
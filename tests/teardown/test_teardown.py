@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+from subprocess import Popen, PIPE
+
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.teardown import teardown_command, cleanup_plan, cleanup_command, UNREFERENCED, \
+    UNUSED, RMI, GC
+
+
+class TeardownTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+        self.names = ' '.join(container.name for container in self.containers)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, command, stop_status=0):
+        # Fake docker binary, records its commands and fails docker stop with stop_status
+        with open(self.tmp + '/docker', 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> %s/docker.log\n[ "$1" != "stop" ] || exit %d\n' % (self.tmp, stop_status))
+        os.chmod(self.tmp + '/docker', 0o755)
+
+        environment = dict(os.environ)
+        environment['PATH'] = self.tmp + ':' + environment['PATH']
+        status = Popen(['sh', '-c', command], stdout=PIPE, stderr=PIPE, env=environment).wait()
+        with open(self.tmp + '/docker.log') as f:
+            return status, f.read().splitlines()
+
+    def test_one_stop_and_remove(self):
+        status, commands = self.run_command(teardown_command(self.containers, 5))
+
+        assert status == 0
+        assert commands == ['stop -t 5 ' + self.names, 'rm -fv ' + self.names]
+
+    def test_default_timeout(self):
+        status, commands = self.run_command(teardown_command(self.containers))
+
+        assert commands[0] == 'stop ' + self.names
+
+    def test_removed_when_stop_fails(self):
+        status, commands = self.run_command(teardown_command(self.containers, 5), stop_status=1)
+
+        assert status == 0
+        assert commands[1] == 'rm -fv ' + self.names
+
+
+class CleanupPlanTests(unittest.TestCase):
+
+    def setUp(self):
+        # Several containers on one host, the last never launched
+        hosts = ['node1', 'node1', 'node1', 'node2', None]
+        images = ['ubuntu', 'ubuntu', 'fedora', 'centos', 'debian']
+        self.containers = []
+        for host, image in zip(hosts, images):
+            container = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[0]
+            container.execution_host = host
+            container.image = image
+            self.containers.append(container)
+        self.scripts = {UNREFERENCED: 'sh unref.sh', UNUSED: 'sh unused.sh'}
+
+    def test_unused_once_per_host(self):
+        plan = cleanup_plan(self.containers, 1, remove_unreferenced=True)
+
+        assert list(plan.items()) == [('node1', [(UNREFERENCED, None), (UNUSED, None)]),
+                                      ('node2', [(UNREFERENCED, None), (UNUSED, None)])]
+        assert cleanup_command(plan['node1'], self.scripts) == 'sh unref.sh; sh unused.sh'
+
+    def test_images_batched(self):
+        plan = cleanup_plan(self.containers, 2)
+
+        assert plan['node1'] == [(RMI, 'ubuntu'), (RMI, 'fedora')]
+        assert cleanup_command(plan['node1'], self.scripts) == 'docker rmi ubuntu fedora'
+        assert cleanup_command(plan['node2'], self.scripts) == 'docker rmi centos'
+
+    def test_garbage_collection_once_per_host(self):
+        self.scripts[GC] = 'python -m dgrid.scheduling.utils.image_gc --index index'
+        plan = cleanup_plan(self.containers, 3, remove_unreferenced=True)
+
+        assert cleanup_command(plan['node1'], self.scripts) == \
+            'sh unref.sh; python -m dgrid.scheduling.utils.image_gc --index index ubuntu fedora'
+
+    def test_local_containers_planned_with_host(self):
+        # The interactive container ran on node1, alongside the replicas placed there
+        head = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')[0]
+        head.image = 'alpine'
+        plan = cleanup_plan(self.containers, 2, True, 'node1', [head])
+
+        assert list(plan.items()) == [('node1', [(UNREFERENCED, None), (RMI, 'alpine'), (RMI, 'ubuntu'),
+                                                 (RMI, 'fedora')]),
+                                      ('node2', [(UNREFERENCED, None), (RMI, 'centos')])]
+
+    def test_nothing_to_clean(self):
+        assert cleanup_plan(self.containers, 0) == {'node1': [], 'node2': []}
+
+
+if __name__ == '__main__':
+    unittest.main()
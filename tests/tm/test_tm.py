@@ -0,0 +1,247 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+from dgrid.conf import settings
+from dgrid.scheduling import schedule
+from dgrid.scheduling.schedulers.Torque6.TMExecutor import TMExecutor
+from dgrid.scheduling.utils import fileparser
+from dgrid.scheduling.utils.Errors import RemoteExecutionError
+from dgrid.scheduling.utils.tm import TMPool, vnode_map, parse_fanout
+
+# Fake pbsdsh, spawns one task per node with -u or on the node given with -h, each with its first virtual node in
+# PBS_VNODENUM and its node in FAKE_NODE. Tasks on DEAD_NODE never start, output is written in reverse node order
+PBSDSH = """#!%s
+import os, subprocess, sys
+args = sys.argv[1:]
+with open(os.path.join(%r, 'pbsdsh.log'), 'a') as f:
+    f.write(' '.join(args) + '\\n')
+vnodes = os.environ['FAKE_VNODES'].split(',')
+nodes = [args[args.index('-h') + 1]] if '-h' in args else sorted(set(vnodes), key=vnodes.index)
+program = args[args.index('-o') + 1:]
+tasks = []
+for node in nodes:
+    if node == os.environ.get('DEAD_NODE'):
+        continue
+    environment = dict(os.environ, PBS_VNODENUM=str(vnodes.index(node)), FAKE_NODE=node)
+    tasks.append(subprocess.Popen(program, stdout=subprocess.PIPE, env=environment))
+for task in reversed(tasks):
+    sys.stdout.write(task.communicate()[0].decode('utf-8'))
+"""
+
+# Fake docker, records its commands with the node they ran on, docker run fails on FAIL_NODE
+DOCKER = """#!/bin/sh
+echo "$FAKE_NODE $@" >> %s/docker.log
+if [ "$1" = "run" ]; then
+    [ "$FAKE_NODE" != "$FAIL_NODE" ] || exit 1
+    echo abc123
+elif [ "$1" = "inspect" ]; then
+    echo 4242
+fi
+"""
+
+
+class TMTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.environment = dict(os.environ)
+        self.hostname = socket.gethostname()
+        self.vnodes = [self.hostname, self.hostname, 'node2', 'node2', 'node3']
+        for name, content in (('pbsdsh', PBSDSH % (sys.executable, self.tmp)), ('docker', DOCKER % self.tmp),
+                              ('pbs_track', '#!/bin/sh\necho "$@" >> %s/pbs_track.log\n' % self.tmp)):
+            with open(self.tmp + '/' + name, 'w') as f:
+                f.write(content)
+            os.chmod(self.tmp + '/' + name, 0o755)
+
+        os.environ['PATH'] = self.tmp + ':' + os.environ['PATH']
+        os.environ['FAKE_VNODES'] = ','.join(self.vnodes)
+        os.environ['FAKE_NODE'] = self.hostname
+        os.environ['PBS_JOBID'] = '8'
+        for name in ('FAIL_NODE', 'DEAD_NODE', 'PBS_NODEFILE', 'PBS_O_WORKDIR'):
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        shutil.rmtree(self.tmp)
+
+    def log(self, name):
+        if not os.path.exists(self.tmp + '/' + name):
+            return []
+        with open(self.tmp + '/' + name) as f:
+            return f.read().splitlines()
+
+
+class TMPoolTests(TMTestCase):
+
+    def setUp(self):
+        TMTestCase.setUp(self)
+        self.pool = TMPool(self.vnodes, self.tmp + '/pbsdsh')
+
+    def tearDown(self):
+        self.pool.close_all()
+        TMTestCase.tearDown(self)
+
+    def test_vnode_map(self):
+        assert list(vnode_map(['a', 'a', 'b', 'a']).items()) == [('a', [0, 1, 3]), ('b', [2])]
+
+    def test_run_on_one_node(self):
+        assert self.pool.run('node2', 'echo $FAKE_NODE; echo err >&2') == 'node2\nerr'
+        assert self.log('pbsdsh.log')[0].split()[:3] == ['-h', 'node2', '-o']
+
+    def test_run_failure(self):
+        with self.assertRaises(RemoteExecutionError):
+            self.pool.run('node2', 'exit 3')
+        assert self.pool.run('node2', 'echo partial; exit 3', warn_only=True) == 'partial'
+
+    def test_run_all_single_fanout(self):
+        jobs = [(host, 'echo $FAKE_NODE; exit %d' % i) for i, host in enumerate(['node3', self.hostname, 'node2'])]
+
+        assert self.pool.run_all(jobs) == [(0, 'node3'), (1, self.hostname), (2, 'node2')]
+        assert len(self.log('pbsdsh.log')) == 1
+        assert self.log('pbsdsh.log')[0].split()[:2] == ['-u', '-o']
+
+    def test_repeated_hosts(self):
+        jobs = [('node2', 'echo 1'), ('node3', 'echo 2'), ('node2', 'exit 4'), ('node2', 'echo 3')]
+
+        assert self.pool.run_all(jobs) == [(0, '1'), (0, '2'), (4, ''), (0, '3')]
+        assert len(self.log('pbsdsh.log')) == 3
+
+        assert self.pool.run_all(jobs, stop_on_failure=True) == [(0, '1'), (0, '2'), (4, ''), None]
+
+    def test_task_never_started(self):
+        os.environ['DEAD_NODE'] = 'node3'
+
+        assert self.pool.run_all([('node2', 'echo ok'), ('node3', 'echo ok')]) == [(0, 'ok'), (255, '')]
+
+    def test_unknown_host(self):
+        with self.assertRaises(RemoteExecutionError):
+            self.pool.run('node9', 'true')
+
+    def test_parse_fanout(self):
+        results, other = parse_fanout('DGRID_TASK 1 b\npbsdsh: error\nDGRID_TASK 0 DGRID_EXIT 0\n'
+                                      'DGRID_TASK 1 DGRID_EXIT 2\nDGRID_TASK 5 x', 2)
+        assert results == [(0, []), (2, ['b'])]
+        assert other == ['pbsdsh: error', 'DGRID_TASK 5 x']
+
+    def test_stats_and_close(self):
+        self.pool.run_all([('node2', 'true'), ('node3', 'true')])
+        self.pool.run('node2', 'true')
+        assert self.pool.stats() == {'fanouts': 2, 'tasks': 3}
+        assert os.listdir(self.pool.script_dir) == []
+
+        self.pool.close_all()
+        assert not os.path.exists(self.pool.script_dir)
+
+
+class TMExecutorTests(TMTestCase):
+
+    def setUp(self):
+        TMTestCase.setUp(self)
+        self.saved = dict((name, getattr(settings, name)) for name in ('pbs_track', 'image_cleanup', 'pbsdsh_binary',
+                                                                        'tm_cgroup_parent', 'parallel_launch',
+                                                                        'docker_api', 'prestage_images',
+                                                                        'image_inventory', 'image_inventory_path'))
+        # Local docker operations go through the fake docker CLI
+        settings.docker_api = False
+        settings.pbs_track = self.tmp + '/pbs_track'
+        settings.pbsdsh_binary = self.tmp + '/pbsdsh'
+        self.containers = fileparser.get_containers(os.getcwd() + '/tests/torque/Dockerdef3.json')
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        TMTestCase.tearDown(self)
+
+    def run_job(self):
+        with self.assertRaises(SystemExit) as raised:
+            TMExecutor(self.containers, list(self.vnodes)).run()
+        return raised.exception.code
+
+    def runs(self):
+        return [line for line in self.log('docker.log') if line.split()[1] == 'run']
+
+    def test_one_fanout_launch(self):
+        assert self.run_job() == 0
+
+        # One fan-out launches every host's containers, and one tears them down
+        assert [line.split()[0] for line in self.log('pbsdsh.log')] == ['-u', '-u']
+        runs = self.runs()
+        assert sorted(line.split()[0] for line in runs if '--name=slave' in line) == sorted([self.hostname, 'node2', 'node2'])
+        assert len([line for line in runs if '--name=head' in line]) == 1
+        # Every container is in the job's cgroup, so nothing is tracked with pbs_track
+        assert all('--cgroup-parent=/torque/8' in line for line in runs)
+        assert self.log('pbs_track.log') == []
+
+    def test_limits_read_by_launch_script(self):
+        assert self.run_job() == 0
+
+        # No fan-out reads the job's limits before the launch
+        assert self.log('pbsdsh.log')[0].startswith('-u')
+
+    def test_serial_launch_is_one_fanout(self):
+        settings.parallel_launch = False
+
+        assert self.run_job() == 0
+        assert [line.split()[0] for line in self.log('pbsdsh.log')] == ['-u', '-u']
+
+    def test_pbs_track_without_cgroup_parent(self):
+        settings.tm_cgroup_parent = None
+
+        assert self.run_job() == 0
+        assert not [line for line in self.runs() if '--cgroup-parent' in line]
+        # Remote containers are tracked by the launch script, the interactive container by the executor
+        assert self.log('pbs_track.log').count('-j 8 -a 4242') == 4
+
+    def test_teardown(self):
+        self.run_job()
+
+        commands = [line.split()[:2] for line in self.log('docker.log')]
+        assert ['node2', 'stop'] in commands and [self.hostname, 'stop'] in commands
+        assert ['node3', 'stop'] not in commands
+
+    def test_staging_is_one_fanout(self):
+        settings.prestage_images = True
+        settings.image_inventory = True
+        settings.image_inventory_path = self.tmp + '/inventory-{user}'
+
+        assert self.run_job() == 0
+
+        # Inventories are read, and the missing images pulled, on every host at once
+        assert [line.split()[0] for line in self.log('pbsdsh.log')] == ['-u', '-u', '-u', '-u']
+        pulls = [line.split()[0] for line in self.log('docker.log') if line.split()[1] == 'pull']
+        assert sorted(pulls) == sorted([self.hostname, 'node2'])
+
+    def test_failed_launch_torn_down(self):
+        os.environ['FAIL_NODE'] = 'node2'
+
+        assert self.run_job() == 'Terminating'
+
+        commands = [line.split()[:2] for line in self.log('docker.log')]
+        assert ['node2', 'stop'] in commands
+        # The interactive container never ran
+        assert not [line for line in self.runs() if '--name=head' in line]
+
+    def test_image_cleanup(self):
+        settings.image_cleanup = 2
+
+        self.run_job()
+
+        # Replicas ran on this host and node2, each removes its images once, this host without pbsdsh
+        removals = [line for line in self.log('docker.log') if line.split()[1] == 'rmi']
+        assert sorted(removals) == sorted([self.hostname + ' rmi ubuntu:14.04', 'node2 rmi ubuntu:14.04'])
+        assert [line.split()[:2] for line in self.log('pbsdsh.log')] == [['-u', '-o'], ['-u', '-o'], ['-h', 'node2']]
+
+    def test_scheduler(self):
+        scheduler, method = settings.scheduler, settings.Execution_Method
+        settings.scheduler, settings.Execution_Method = 'Torque6', 'TM'
+        try:
+            job = schedule.Scheduler.get_scheduler(self.containers, list(self.vnodes))
+        finally:
+            settings.scheduler, settings.Execution_Method = scheduler, method
+
+        assert isinstance(job.executor, TMExecutor)